@@ -0,0 +1,80 @@
+"""
+Benchmark of formats of message files.
+
+The benchmark writes a synthetic catalog (see `bench_jaml.py`) in each format
+supported by `trubar.messages`, and measures the time for reading and
+writing it (into a new file, for SQLite). YAML is measured with libyaml,
+which is used when available, and with the pure-Python loader and dumper,
+which were used before.
+
+Run with `python benchmarks/bench_catalogs.py`.
+"""
+import os
+import tempfile
+import timeit
+
+import yaml
+
+from trubar import jaml
+from trubar.messages import \
+    BACKENDS, Backend, dict_to_msg_nodes, dict_from_msg_nodes
+
+from bench_jaml import synthetic_catalog  # pylint: disable=wrong-import-order
+
+
+SIZE = 2_000_000
+REPEAT = 3
+
+
+def _read_pure_yaml(filename):
+    with open(filename, encoding="utf-8") as f:
+        return dict_to_msg_nodes(yaml.load(f, Loader=yaml.Loader))
+
+
+def _write_pure_yaml(messages):
+    return [yaml.dump(dict_from_msg_nodes(messages), Dumper=yaml.Dumper,
+                      indent=4, sort_keys=False,
+                      encoding="utf-8", allow_unicode=True)]
+
+
+FORMATS = [
+    ("JAML", ".jaml", BACKENDS[".jaml"]),
+    ("JSON", ".json", BACKENDS[".json"]),
+    ("SQLite", ".sqlite", BACKENDS[".sqlite"]),
+    ("YAML" + " (libyaml)" * yaml.__with_libyaml__, ".yaml", BACKENDS[".yaml"]),
+    ("YAML (pure Python)", ".yaml",
+     Backend(_read_pure_yaml, _write_pure_yaml, (yaml.YAMLError, ))),
+]
+
+
+def measure(backend: Backend, fname: str, messages) -> tuple:
+    def write():
+        if os.path.exists(fname):
+            os.remove(fname)
+        if backend.save is not None:
+            backend.save(messages, fname)
+        else:
+            with open(fname, "wb") as f:
+                f.writelines(backend.write(messages))
+
+    dump = min(timeit.repeat(write, number=1, repeat=REPEAT))
+    read = min(timeit.repeat(lambda: backend.read(fname),
+                             number=1, repeat=REPEAT))
+    return os.path.getsize(fname) / 1e6, read, dump
+
+
+def main():
+    messages = jaml.read(synthetic_catalog(SIZE))
+    print(f"{'':24}{'size':>11}{'read':>12}{'write':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, ext, backend in FORMATS:
+            fname = os.path.join(tmpdir, "catalog" + ext)
+            mb, read, dump = measure(backend, fname, messages)
+            print(f"{name:24}{mb:8.2f} MB{1000 * read:9.0f} ms"
+                  f"{1000 * dump:9.0f} ms")
+            # YAML does not keep comments
+            assert ext == ".yaml" or backend.read(fname) == messages
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of reading and writing JAML files.
+
+The benchmark generates a synthetic catalog of about the size of catalogs of
+large projects (12 MB), with comments, quoted and multi-line messages, and
+measures throughput of reading and writing it. Real catalogs can be given as
+arguments; they are read and written, too.
+
+Run with `python benchmarks/bench_jaml.py [catalog.jaml ...]`.
+"""
+import os
+import sys
+import random
+import timeit
+
+from trubar import jaml
+from trubar.messages import MsgNode
+
+
+SIZE = 12_000_000
+REPEAT = 3
+# Throughput, in MB/s, that reading should reach on a contemporary machine
+TARGET_READ = 15
+
+WORDS = ["pig", "piggy", "cow", "farm", "animals", "the", "walk", "{n}",
+         "{self.name!r}", "it's", 'say "hi"', "key: value", "# not comment"]
+
+
+def synthetic_catalog(size: int) -> str:
+    rnd = random.Random(42)
+
+    def message(k):
+        text = " ".join(rnd.choices(WORDS, k=rnd.randint(1, 12)))
+        if k % 17 == 0:
+            text += "\nand another line"
+        return text
+
+    def translation():
+        return rnd.choice([None, False, True,
+                           " ".join(rnd.choices(WORDS, k=5))])
+
+    catalog = {}
+    text_size = 0
+    while text_size < size:
+        module = {
+            f"class `C{j}`": MsgNode({
+                f"def `f{k}`": MsgNode({
+                    message(i): MsgNode(translation(),
+                                        ["# comment"] if i % 13 == 0 else None)
+                    for i in range(10)})
+                for k in range(5)})
+            for j in range(4)}
+        name = f"package/module_{len(catalog)}.py"
+        catalog[name] = MsgNode(module)
+        text_size += len(jaml.dump({name: catalog[name]}))
+    return jaml.dump(catalog)
+
+
+def measure(name: str, text: str) -> float:
+    mb = len(text.encode("utf-8")) / 1e6
+    read = min(timeit.repeat(lambda: jaml.read(text),
+                             number=1, repeat=REPEAT))
+    messages = jaml.read(text)
+    dump = min(timeit.repeat(lambda: jaml.dump(messages),
+                             number=1, repeat=REPEAT))
+    assert jaml.dump(messages) == text
+    print(f"{name:30}{mb:8.2f} MB{mb / read:10.1f} MB/s{mb / dump:10.1f} MB/s")
+    return mb / read
+
+
+def main():
+    print(f"{'':30}{'size':>11}{'read':>15}{'write':>15}")
+    speeds = [measure("synthetic", synthetic_catalog(SIZE))]
+    for fname in sys.argv[1:]:
+        with open(fname, encoding="utf-8") as f:
+            text = f.read()
+        # Normalize the file, so that writing can be checked
+        speeds.append(measure(os.path.basename(fname)[-30:],
+                              jaml.dump(jaml.read(text))))
+    slowest = min(speeds)
+    print(f"\nSlowest reading: {slowest:.1f} MB/s "
+          f"({'meets' if slowest >= TARGET_READ else 'below'} "
+          f"the target of {TARGET_READ} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of code generated in multilingual mode on string-heavy code.
+
+The benchmark generates a module resembling a widget with many methods that
+use strings (labels, tooltips, f-strings), translates it with different
+options and measures the time for calling all methods. A second module, in
+which methods use only f-strings, measures formatting of f-strings.
+
+Run with `python benchmarks/bench_lookups.py`.
+"""
+import os
+import json
+import timeit
+import tempfile
+from unittest.mock import patch
+
+import libcst as cst
+
+from trubar.codegen import StringTranslatorMultilingual
+from trubar.config import config, LanguageDef
+from trubar.messages import MsgNode
+from trubar.runtime import Translator
+
+
+N_METHODS = 50
+N_STRINGS = 10
+REPEAT = 2000
+
+
+def widget_source(f_strings=False):
+    methods = []
+    for i in range(N_METHODS):
+        lines = [f"    def method_{i}(self, n):",
+                 "        labels = []"]
+        for j in range(N_STRINGS):
+            if f_strings:
+                lines.append(f'        labels.append(f"Label {i}.{j}: {{n}}")')
+            else:
+                lines.append(f'        labels.append("Label {i}.{j}")')
+        lines.append(f'        labels.append(f"Selected {{n}} of {i}")')
+        lines.append("        return labels")
+        methods.append("\n".join(lines))
+    return "class Widget:\n" + "\n\n".join(methods) + "\n"
+
+
+def translations():
+    return {"class `Widget`": MsgNode({
+        f"def `method_{i}`": MsgNode({
+            **{f"Label {i}.{j}": MsgNode(f"Oznaka {i}.{j}")
+               for j in range(N_STRINGS)},
+            **{f"Label {i}.{j}: {{n}}": MsgNode(f"Oznaka {i}.{j}: {{n}}")
+               for j in range(N_STRINGS)},
+            f"Selected {{n}} of {i}": MsgNode(f"Izbranih {{n}} od {i}")})
+        for i in range(N_METHODS)})}
+
+
+def translated(source, **options):
+    tables = [["English", "English"], ["Slovenščina", "Slovenian"]]
+    options = {"format_f_strings": False, "plain_lookup": False,
+               "hoist_strings": False, **options}
+    with patch.multiple(config, **options):
+        tree = cst.parse_module(source)
+        translator = StringTranslatorMultilingual(
+            [{}, translations()], ["widget.py"], tables, [], tree,
+            cst.parse_module("pass").body)
+        tree = cst.metadata.MetadataWrapper(tree)
+        code = tree.module.code_for_node(tree.visit(translator))
+    return code, tables
+
+
+def run(name, source, **options):
+    code, tables = translated(source, **options)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "Slovenian.json"), "w",
+                  encoding="utf-8") as f:
+            json.dump(tables[1], f)
+        namespace = {"_tr": Translator(tmpdir, "Slovenian")}
+    exec(code, namespace)  # pylint: disable=exec-used
+    widget = namespace["Widget"]()
+    methods = [getattr(widget, f"method_{i}") for i in range(N_METHODS)]
+
+    def call_all():
+        for method in methods:
+            method(42)
+
+    best = min(timeit.repeat(call_all, number=REPEAT // 10, repeat=10))
+    calls = N_METHODS * REPEAT // 10
+    print(f"{name:20}{1e6 * best / calls:10.2f} µs per call")
+    return methods[0](42)
+
+
+def main():
+    config.languages = {
+        "en": LanguageDef("English", "English", True),
+        "si": LanguageDef("Slovenščina", "Slovenian", False)}
+    source = widget_source()
+    original(source)
+
+    results = [
+        run("default", source),
+        run("format-f-strings", source, format_f_strings=True),
+        run("plain-lookup", source, plain_lookup=True),
+        run("hoist-strings", source, hoist_strings=True),
+        run("hoist + plain", source, hoist_strings=True, plain_lookup=True),
+    ]
+    assert all(result == results[0] for result in results)
+
+    print("\nOnly f-strings")
+    source = widget_source(f_strings=True)
+    original(source)
+    results = [
+        run("default", source),
+        run("format-f-strings", source, format_f_strings=True),
+    ]
+    assert all(result == results[0] for result in results)
+
+
+def original(source):
+    namespace = {}
+    exec(source, namespace)  # pylint: disable=exec-used
+    widget = namespace["Widget"]()
+    methods = [getattr(widget, f"method_{i}") for i in range(N_METHODS)]
+
+    def call_all():
+        for method in methods:
+            method(42)
+
+    best = min(timeit.repeat(call_all, number=REPEAT // 10, repeat=10))
+    print(f"{'original':20}"
+          f"{1e6 * best / (N_METHODS * REPEAT // 10):10.2f} µs per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark of memory used by loaded translations.
+
+The benchmark creates translations of a synthetic catalog (see
+`bench_jaml.py`) into several languages, which have the same keys and
+different translations, and measures the memory taken by them as `MsgDict`
+and as `CompactMsgDict`, which `translate` uses.
+
+Run with `python benchmarks/bench_memory.py`.
+"""
+import gc
+import tracemalloc
+
+from trubar import jaml
+from trubar.messages import MsgNode, MsgDict, compact
+
+from bench_jaml import synthetic_catalog  # pylint: disable=wrong-import-order
+
+
+SIZE = 12_000_000
+LANGUAGES = ["si", "de", "es"]
+
+
+def translated(messages: MsgDict, lang: str) -> MsgDict:
+    return {
+        key: MsgNode(translated(node.value, lang)
+                     if isinstance(node.value, dict)
+                     else f"[{lang}] {node.value}"
+                     if isinstance(node.value, str) else node.value,
+                     node.comments)
+        for key, node in messages.items()}
+
+
+def measure(texts, load) -> float:
+    gc.collect()
+    tracemalloc.start()
+    catalogs = [load(text) for text in texts]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(catalogs) == len(texts)
+    return size / 1e6
+
+
+def main():
+    messages = jaml.read(synthetic_catalog(SIZE))
+    texts = [jaml.dump(translated(messages, lang)) for lang in LANGUAGES]
+    del messages
+    pool = {}
+    plain = measure(texts, jaml.read)
+    compacted = measure(texts, lambda text: compact(jaml.read(text), pool))
+    print(f"{len(LANGUAGES)} languages, "
+          f"{sum(map(len, texts)) / 1e6:.1f} MB of text")
+    print(f"{'MsgDict':20}{plain:10.1f} MB")
+    print(f"{'CompactMsgDict':20}{compacted:10.1f} MB"
+          f"{100 * (1 - compacted / plain):10.0f} % less")
+
+
+if __name__ == "__main__":
+    main()
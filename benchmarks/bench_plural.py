@@ -0,0 +1,80 @@
+"""
+Benchmark of functions for plural forms.
+
+The benchmark compares functions `pl` and `plsi` from `trubar.plural` with the
+hand-written functions from the documentation on localization, which split
+the forms and apply the rules at each call.
+
+Run with `python benchmarks/bench_plural.py`.
+"""
+import timeit
+
+from trubar.plural import pl, plsi
+
+
+REPEAT = 200_000
+
+
+def pl_doc(n: int, forms: str) -> str:
+    plural = int(n != 1)
+
+    if "|" in forms:
+        return forms.split("|")[plural]
+
+    if forms[-1] in "yY" and forms[-2] not in "aeiouAEIOU":
+        word = [forms, forms[:-1] + "ies"][plural]
+    else:
+        word = forms + "s" * plural
+    if forms.isupper():
+        word = word.upper()
+    return word
+
+
+def plsi_doc(n: int, forms: str) -> str:
+    n = abs(n) % 100
+    if n == 4:
+        n = 3
+    elif n == 0 or n >= 5:
+        n = 4
+    n -= 1
+
+    if "|" in forms:
+        forms = forms.split("|")
+        if n == 3 and len(forms) == 3:
+            n -= 1
+        return forms[n]
+
+    if forms[-1] == "a":
+        return forms[:-1] + ("a", "i", "e", "")[n]
+    else:
+        return forms + ("", "a", "i", "ov")[n]
+
+
+CASES = [
+    ("English, regular", pl_doc, pl, "piggy"),
+    ("English, forms", pl_doc, pl, "leaf|leaves"),
+    ("Slovenian, regular", plsi_doc, plsi, "krava"),
+    ("Slovenian, forms", plsi_doc, plsi,
+     "pujsek se je šel|pujska sta se šla|pujski so se šli|pujskov se je šlo"),
+]
+
+
+def measure(func, forms):
+    def call():
+        for n in range(10):
+            func(n, forms)
+
+    return min(timeit.repeat(call, number=REPEAT // 10, repeat=5)) / REPEAT
+
+
+def main():
+    print(f"{'':20}{'documentation':>16}{'trubar.plural':>16}")
+    for name, doc_func, func, forms in CASES:
+        assert all(doc_func(n, forms) == func(n, forms) for n in range(200))
+        print(f"{name:20}"
+              f"{1e9 * measure(doc_func, forms):13.0f} ns"
+              f"{1e9 * measure(func, forms):13.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,8 @@ def translate(msg_filename: str,
               config_file: Optional[str] = None,
               pattern="",
               verbosity=actions.ReportCritical,
-              dry_run=False) -> None:
+              dry_run=False,
+              table_profile: Optional[str] = None) -> None:
     """
     Translate messages from source directory to destination directory.
 
@@ -22,24 +23,31 @@ def translate(msg_filename: str,
         pattern (str, optional): pattern for file selection
         verbosity (int, optional): verbosity level
         dry_run (bool, optional): if True, do not write any files
+        table_profile (str, optional): file with lookup counts; frequently
+            used messages are put at the beginning of message tables
     """
     # do not import at the top level to avoid re-exporting (and shadowing) config
     # pylint: disable=import-outside-toplevel
-    from trubar.messages import load
+    from trubar.messages import load, compact
     from trubar.utils import check_any_files
     from trubar.config import config
 
     if config_file:
         config.update_from_file(config_file)
+    # Translations are only read, so they are compacted to save memory;
+    # languages share the pool of strings, since their keys are the same
+    pool = {}
     if config.languages:
         messages = [
-            load(os.path.join(config.base_dir, code, msg_filename))
+            compact(load(os.path.join(config.base_dir, code, msg_filename),
+                         pattern), pool)
             if not settings.is_original else {}
             for code, settings in config.languages.items()]
     else:
-        messages = [load(msg_filename)]
+        messages = [compact(load(msg_filename, pattern), pool)]
 
     trans_keys = set.union(*(set(trans) for trans in messages))
     check_any_files(trans_keys, source_dir)
     actions.translate(messages, source_dir, dest_dir or source_dir, pattern,
-                      verbosity=verbosity, dry_run=dry_run)
+                      verbosity=verbosity, dry_run=dry_run,
+                      table_profile=table_profile)
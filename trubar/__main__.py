@@ -6,10 +6,12 @@ import json
 from trubar import translate
 from trubar.actions import \
     collect, merge, missing, template, update_messages, stat, \
-    ReportCritical
+    with_fallbacks, resolve_fallbacks, mo_entries, ReportCritical
 from trubar.messages import load, dump
 from trubar.config import config
-from trubar.utils import check_any_files, dump_removed, load_mapping
+from trubar.utils import \
+    check_any_files, dump_removed, load_mapping, save_compiled_table, \
+    load_table_changes, save_table_changes, remove_table_changes, save_mo
 
 
 def check_dir_exists(path):
@@ -100,6 +102,10 @@ def main() -> None:
         "-n", "--dry-run", action="store_true",
         help="don't write anything; perform a trial run to check the structure"
     )
+    parser.add_argument(
+        "--table-profile", metavar="profile",
+        help="lookup counts recorded with TRUBAR_TABLE_PROFILE; frequently "
+             "used messages are put at the beginning of message tables")
 
     parser = add_parser("merge",
                         "Merge translations into template or existing "
@@ -149,6 +155,19 @@ def main() -> None:
     parser.add_argument(
         "-o", "--output", metavar="output-file", required=True,
         help="message table")
+    parser.add_argument(
+        "-c", "--changes-only", action="store_true",
+        help="write only changed entries into a separate file, from which "
+             "they can be reloaded at run-time")
+
+    parser = add_parser("export-mo",
+                        "Write translations into gettext catalogs (.mo)")
+    parser.add_argument(
+        "messages", metavar="messages",
+        help="file with translated messages")
+    parser.add_argument(
+        "-o", "--output", metavar="output", required=True,
+        help="output file, or directory for catalogs in multilingual setup")
 
     parser = add_parser("stat", "Show statistics about messages in the file")
     parser.add_argument(
@@ -180,6 +199,9 @@ def main() -> None:
         if args.inplace:
             if args.dest:
                 argparser.error("options -d and -i are incompatible")
+            elif config.languages and config.specialized_trees:
+                argparser.error(
+                    "specialized trees cannot be translated in place")
             else:
                 args.dest = args.source
         elif not args.dest:
@@ -188,10 +210,11 @@ def main() -> None:
             config.set_static_files(args.static)
         verbosity = ReportCritical if args.quiet else args.verbosity
         translate(args.messages, args.source, args.dest,
-                  pattern=pattern, verbosity=verbosity, dry_run=args.dry_run)
+                  pattern=pattern, verbosity=verbosity, dry_run=args.dry_run,
+                  table_profile=args.table_profile)
 
     elif args.action == "merge":
-        additional = load(args.translations)
+        additional = load(args.translations, pattern)
         existing = load(args.messages)
         unused = merge(additional, existing, pattern,
                        print_unused=not args.unused)
@@ -205,13 +228,13 @@ def main() -> None:
                     pass  # create empty file
 
     elif args.action == "template":
-        existing = load(args.messages)
+        existing = load(args.messages, pattern)
         new = template(existing, pattern)
         dump(new, args.output)
 
     elif args.action == "missing":
-        translations = load(args.messages)
-        messages = load(args.all_messages) \
+        translations = load(args.messages, pattern)
+        messages = load(args.all_messages, pattern) \
             if args.all_messages else translations
         needed = missing(translations, messages, pattern)
         dump(needed, args.output)
@@ -221,7 +244,13 @@ def main() -> None:
         translations = load(args.translations)
         languages, mapping = load_mapping(os.path.split(output)[0])
         with open(output, "r", encoding="utf-8") as f:
-            lang_name, intl_name, *messages = json.load(f)
+            base_table = json.load(f)
+        table = list(base_table)
+        generation, changes = load_table_changes(output)
+        if args.changes_only:
+            for idx, entry in changes.items():
+                table[idx] = entry
+        lang_name, intl_name, *messages = table
         if len(messages) != len(mapping):
             print("Mapping and message table size do not match.")
             sys.exit(6)
@@ -229,12 +258,51 @@ def main() -> None:
             print(f"Language '{intl_name}' not in mapping languages.")
             sys.exit(7)
         lang_idx = languages.index(intl_name)
+        # Fallbacks are read from files with the same name in their
+        # languages' directories
+        fallbacks = next((langdef.fallback
+                          for langdef in (config.languages or {}).values()
+                          if langdef.international_name == intl_name), ())
+        if fallbacks:
+            fname = os.path.basename(args.translations)
+            translations = with_fallbacks(
+                translations,
+                [load(os.path.join(config.base_dir, code, fname))
+                 for code in fallbacks
+                 if not config.languages[code].is_original])
         new_messages = update_messages(translations, messages, mapping, lang_idx)
-        with open(output, "w", encoding="utf-8") as f:
-            json.dump([lang_name, intl_name] + new_messages, f)
+        new_messages = [lang_name, intl_name] + new_messages
+        if args.changes_only:
+            if new_messages != table:
+                save_table_changes(output, base_table, new_messages,
+                                   generation + 1)
+        else:
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump(new_messages, f)
+            remove_table_changes(output)
+            compiled = os.path.splitext(output)[0] + ".pyc"
+            if config.compile_tables or os.path.exists(compiled):
+                save_compiled_table(compiled, new_messages, mapping)
+
+    elif args.action == "export-mo":
+        if config.languages:
+            translations = resolve_fallbacks([
+                load(os.path.join(config.base_dir, code, args.messages),
+                     pattern)
+                if not langdef.is_original else {}
+                for code, langdef in config.languages.items()])
+            os.makedirs(args.output, exist_ok=True)
+            for (code, langdef), trans in zip(config.languages.items(),
+                                              translations):
+                if not langdef.is_original:
+                    save_mo(os.path.join(args.output, f"{code}.mo"),
+                            mo_entries(trans, pattern), code)
+        else:
+            save_mo(args.output,
+                    mo_entries(load(args.messages, pattern), pattern))
 
     elif args.action == "stat":
-        messages = load(args.messages)
+        messages = load(args.messages, pattern)
         stat(messages, pattern)
 
 
@@ -1,46 +1,32 @@
+import ast
 import dataclasses
+import itertools
 import os
-import re
 import shutil
-import json
-from typing import Union, List, Optional, NamedTuple, Tuple, Dict
+from typing import List, Optional, NamedTuple, Tuple, Dict, Sequence
 
 import libcst as cst
 from libcst.metadata import ParentNodeProvider
 
-from trubar.utils import walk_files, save_mapping, KeyMapping
+from trubar.utils import walk_files, KeyMapping
 from trubar.messages import MsgNode, MsgDict
 from trubar.config import config
+from trubar.codegen import \
+    NamespaceNode, prefix_for_node, CountImportsFromFuture, StringTranslator, \
+    StringTranslatorMultilingual, table_entry, format_template
+from trubar.tables import \
+    TableSegment, tree_shim, new_segment, load_table_profile, table_segment
 
 
 __all__ = ["collect", "translate", "merge", "missing", "template",
            "ReportCritical", "ReportUpdates", "ReportTranslations", "ReportAll"]
 
 
-NamespaceNode = Union[cst.Module, cst.FunctionDef, cst.ClassDef]
-SomeString = Union[cst.SimpleString, cst.FormattedString]
-
-
-re_single_quote = re.compile(r"(^|[^\\])'")
-re_double_quote = re.compile(r'(^|[^\\])"')
-re_braced = re.compile(r"{.+}")
-all_quotes = ("'", '"', "'''", '"""')
-
-
 class State(NamedTuple):
     node: NamespaceNode
     name: str
 
 
-def prefix_for_node(node: NamespaceNode):
-    if isinstance(node, cst.FunctionDef):
-        return "def "
-    elif isinstance(node, cst.ClassDef):
-        return "class "
-    assert isinstance(node, cst.Module)
-    return ""
-
-
 class StringCollector(cst.CSTVisitor):
     METADATA_DEPENDENCIES = (ParentNodeProvider, )
 
@@ -121,339 +107,6 @@ class StringCollector(cst.CSTVisitor):
         return False  # doesn't matter, there's nothing down there anyway
 
 
-class TranslationError(Exception):
-    pass
-
-
-class CountImportsFromFuture(cst.CSTVisitor):
-    def __init__(self):
-        super().__init__()
-        self.count = 0
-        self.has_docstring = False
-
-    def visit_Module(self, node: cst.Module):
-        self.has_docstring = node.get_docstring()
-
-    def visit_ImportFrom(self, node: cst.ImportFrom):
-        if node.module is not None and node.module.value == "__future__":
-            self.count += 1
-        return False
-
-
-class StringTranslatorBase(cst.CSTTransformer):
-    METADATA_DEPENDENCIES = (ParentNodeProvider, )
-
-    def __init__(self,
-                 module: cst.Module,
-                 auto_import: Optional[cst.CSTNode] = None,
-                 n_future_imports: Optional[int] = 0,
-                 has_docstring: bool = False):
-        super().__init__()
-        self.module = module
-        self.context_stack: Union[List[MsgDict], List[List[MsgDict]]] = []
-        self.auto_import = auto_import
-        self.auto_import_after = n_future_imports or None
-        self.import_after_docstring = has_docstring and not n_future_imports
-
-    @property
-    def context(self):
-        return self.context_stack[-1]
-
-    def push_context(self, node: NamespaceNode) -> None:
-        raise NotImplementedError
-
-    def pop_context(self) -> None:
-        self.context_stack.pop()
-
-    def __leave(self, _, updated_node: cst.CSTNode) -> cst.CSTNode:
-        self.pop_context()
-        return updated_node
-
-    def translate(
-            self,
-            node: SomeString,
-            updated_node: SomeString) -> cst.CSTNode:
-        raise NotImplementedError
-
-    leave_ClassDef = __leave
-    leave_FunctionDef = __leave
-
-    def leave_SimpleStatementLine(self, _, updated_node: cst.CSTNode
-                                  ) -> cst.CSTNode:
-        # Decrease the counter of __future__imports, and put auto imports
-        # after the node when the counter reaches zero
-        if self.auto_import is None:
-            return updated_node
-
-        if self.auto_import_after is not None:
-            self.auto_import_after -= sum(
-                isinstance(child, cst.ImportFrom)
-                and child.module.value == "__future__"
-                for child in updated_node.body)
-
-        if self.import_after_docstring:
-            import_now = isinstance(updated_node, cst.SimpleStatementLine)
-        else:
-            import_now = self.auto_import_after == 0
-        if import_now:
-            updated_node = cst.FlattenSentinel([updated_node,
-                                                *self.auto_import])
-            self.auto_import = None
-        return updated_node
-
-    def on_leave(self,
-                 original_node: cst.CSTNodeT,
-                 updated_node: cst.CSTNodeT) -> cst.CSTNode:
-        # If there are no imports from __future__ insert auto import
-        # before the first node
-        updated_node = super().on_leave(original_node, updated_node)
-        if self.auto_import \
-                and not self.import_after_docstring \
-                and self.auto_import_after is None \
-                and not isinstance(original_node, cst.Module) \
-                and isinstance(
-                    self.get_metadata(ParentNodeProvider, original_node),
-                    cst.Module):
-            updated_node = cst.FlattenSentinel([*self.auto_import,
-                                                updated_node])
-            self.auto_import = None
-        return updated_node
-
-    def visit_ClassDef(self, node: NamespaceNode) -> None:
-        self.push_context(node)
-
-    def visit_FunctionDef(self, node: NamespaceNode) -> None:
-        self.push_context(node)
-
-    def leave_FormattedString(
-            self,
-            original_node: cst.FormattedString,
-            updated_node: cst.FormattedString) -> cst.CSTNode:
-        return self.translate(original_node, updated_node)
-
-    def leave_SimpleString(
-            self,
-            original_node: cst.SimpleString,
-            updated_node: cst.SimpleString) -> cst.CSTNode:
-        return self.translate(original_node, updated_node)
-
-    def visit_ConcatenatedString(
-            self,
-            _) -> bool:
-        return False
-
-    def leave_ConcatenatedString(
-            self,
-            original_node: cst.ConcatenatedString,
-            updated_node: cst.ConcatenatedString) -> cst.CSTNode:
-
-        def compose_concatenation(node: cst.ConcatenatedString):
-            left = self.translate(node.left, node.left)
-            if isinstance(node.right, cst.ConcatenatedString):
-                right = compose_concatenation(node.right)
-            else:
-                right = self.translate(node.right, node.right)
-            return cst.BinaryOperation(
-                left, cst.Add(), right,
-                (cst.LeftParen(),), (cst.RightParen(), ))
-
-        return compose_concatenation(updated_node)
-
-
-class StringTranslator(StringTranslatorBase):
-    def __init__(self,
-                 context: MsgDict,
-                 module: cst.Module,
-                 auto_import: Optional[cst.CSTNode] = None,
-                 n_future_imports: Optional[int] = None,
-                 has_docstring: bool = False):
-        super().__init__(module, auto_import, n_future_imports, has_docstring)
-        self.context_stack = [context]
-
-    def push_context(self, node: NamespaceNode) -> None:
-        key = f"{prefix_for_node(node)}`{node.name.value}`"
-        space = self.context[key].value if key in self.context else {}
-        self.context_stack.append(space)
-
-    def translate(
-            self,
-            node: SomeString, updated_node: SomeString) -> cst.CSTNode:
-        if not self.context:
-            return updated_node
-        lq = len(node.quote)
-        original = self.module.code_for_node(node)[len(node.prefix) + lq:-lq]
-        if original not in self.context:
-            return updated_node
-        translation = self.context[original].value
-        if translation in (None, False, True):
-            return updated_node
-        assert isinstance(translation, str)
-
-        quote = node.quote
-        if config.smart_quotes:
-            has_single = re_single_quote.search(translation)
-            has_double = re_double_quote.search(translation)
-            if quote == "'" and has_single and not has_double:
-                quote = '"'
-            elif quote == '"' and has_double and not has_single:
-                quote = "'"
-
-        if config.auto_prefix \
-                and "f" not in node.prefix and not re_braced.search(original) \
-                and re_braced.search(translation) :
-            try:
-                new_node = cst.parse_expression(
-                    f'f{node.prefix}{quote}{translation}{quote}')
-            except cst.ParserSyntaxError:
-                pass
-            else:
-                assert isinstance(new_node, cst.FormattedString)
-                if any(isinstance(part, cst.FormattedStringExpression)
-                       for part in new_node.parts):
-                    return new_node
-
-        try:
-            new_node = cst.parse_expression(
-                f'{node.prefix}{quote}{translation}{quote}')
-        except cst.ParserSyntaxError:
-            if "\n" in translation and len(quote) != 3:
-                unescaped = " Unescaped \\n?"
-            else:
-                unescaped = ""
-            raise TranslationError(
-                f'\nProbable syntax error in translation.{unescaped}\n'
-                f'Original: {original}\n'
-                f'Translation: {translation}') from None
-
-        return new_node
-
-
-class StringTranslatorMultilingual(StringTranslatorBase):
-    def __init__(self,
-                 contexts: List[MsgDict],
-                 key_stack: List[str],
-                 message_tables: List[List[str]],
-                 key_mapping: List[KeyMapping],
-                 module: cst.Module,
-                 auto_import: Optional[cst.CSTNode] = None,
-                 n_future_imports: Optional[int] = None,
-                 has_docstring: bool = False):
-        super().__init__(module, auto_import, n_future_imports, has_docstring)
-        self.context_stack = [contexts]
-        self.key_stack = key_stack
-        self.message_tables = message_tables
-        self.key_mapping = key_mapping
-
-    def push_context(self, node: NamespaceNode) -> None:
-        key = f"{prefix_for_node(node)}`{node.name.value}`"
-        space = [lang_context[key].value if key in lang_context else {}
-                 for lang_context in self.context]
-        self.context_stack.append(space)
-        self.key_stack.append(key)
-
-    def pop_context(self) -> None:
-        super().pop_context()
-        self.key_stack.pop()
-
-    @classmethod
-    def _f_string_languages(cls,
-                            prefix: str,
-                            original: str,
-                            messages: List[str]) -> set[int]:
-        """
-        For the given messages, return a set of indices of languages that
-        requires an f-prefix, excluding the original language.
-
-        This is determined by
-         - checking that the string includes braces and, if so,
-         - compiling as f-string and checking that the result contains some
-           formatted string expressions
-        """
-        add_f = set()
-        if "f" not in prefix:
-            prefix += "f"
-        for i, translation in enumerate(messages[1:], start=1):
-            if re_braced.search(translation):
-                try:
-                    node = cst.parse_expression(prefix + repr(translation))
-                except cst.ParserSyntaxError as exc:
-                    languages = list(config.languages.values())
-                    language = languages[i].international_name
-                    raise TranslationError(
-                        f"Probable syntax error in translation to {language}.\n"
-                        f"Original: {original}\n"
-                        f"Translation:\n  {translation}\n"
-                        "This error occurred while trying to compile the "
-                        "translation string as an f-string.\n"
-                        "The original Python message:"
-                    ) from exc
-
-                assert isinstance(node, cst.FormattedString)
-                if any(isinstance(part, cst.FormattedStringExpression)
-                       for part in node.parts):
-                    add_f.add(i)
-        return add_f
-
-    def translate(
-            self,
-            node: SomeString,
-            updated_node: SomeString) -> cst.CSTNode:
-        if not self.context:
-            return updated_node
-
-        lq = len(node.quote)
-        orig_str = self.module.code_for_node(node)
-        original = orig_str[len(node.prefix) + lq:-lq]
-
-        messages = [lang_context[original].value
-                    if original in lang_context else None
-                    for lang_context in self.context]
-        assert all(isinstance(translation, (str, bool, type(None)))
-                   for translation in messages)
-        if all(message in (None, False, True) for message in messages):
-            return updated_node
-        messages = [
-            translation if isinstance(translation, str) else original
-            for translation in messages]
-
-        idx = len(self.message_tables[0])
-        if "f" in node.prefix \
-                or config.auto_prefix and not re_braced.search(original):
-            need_f = self._f_string_languages(node.prefix, orig_str, messages)
-            if "f" in node.prefix:
-                need_f.add(0)
-        else:
-            need_f = set()
-
-        raw = "r" in node.prefix
-        for lang_idx, (message, table) in \
-                enumerate(zip(messages, self.message_tables)):
-            if not raw:
-                # unescape the translation: we need actual \n, not \ and n
-                message = message \
-                    .encode('latin-1', 'backslashreplace') \
-                    .decode('unicode-escape')
-            if need_f:
-                # This string will be evaled, "uneval" it through repr
-                message = repr(message)
-                # Add an f-prefix to the string if needed
-                if lang_idx in need_f:
-                    message = "f" + message
-            table.append(message)
-        self.key_mapping.append(
-            KeyMapping(
-                (*self.key_stack, original),
-                tuple(need_f),
-                raw,
-            )
-        )
-
-        if need_f:
-            trans = f'_tr.e(_tr.c({idx}, {orig_str}))'
-        else:
-            trans = f"_tr.m[{idx}, {orig_str}]"
-        return cst.parse_expression(trans)
-
 def collect(source: str,
             existing: Optional[MsgDict] = None,
             pattern: str = "",
@@ -490,7 +143,79 @@ ReportCritical, ReportUpdates, ReportTranslations, ReportAll = range(4)
 
 def translate(translations: Dict[str, MsgDict],
               source: str, destination: str, pattern: str,
-              *, verbosity=ReportUpdates, dry_run=False) -> None:
+              *, verbosity=ReportUpdates, dry_run=False,
+              table_profile: Optional[str] = None) -> None:
+    if config.languages:
+        translations = resolve_fallbacks(translations)
+    if config.languages and config.specialized_trees:
+        # One single-language tree for each language, and a shim
+        segments = None
+        any_reports = False
+        for (code, langdef), trans in zip(config.languages.items(),
+                                          translations):
+            if ReportUpdates <= verbosity:
+                print(f"Translating to {langdef.international_name}")
+            any_reports |= _translate_files(
+                [trans], source, os.path.join(destination, "i18n", code),
+                pattern, None, langdef.auto_import, {},
+                verbosity=verbosity, dry_run=dry_run)
+        if not dry_run:
+            with open(os.path.join(destination, "__init__.py"), "wt",
+                      encoding=config.encoding) as f:
+                f.write(tree_shim())
+    else:
+        # Message tables, key mappings and reserved indices for each segment
+        hot = load_table_profile(table_profile) if table_profile else {}
+        segments = {"": new_segment(destination, "", hot)} \
+            if config.languages else None
+        any_reports = _translate_files(
+            translations, source, destination, pattern,
+            segments, config.auto_import, hot,
+            verbosity=verbosity, dry_run=dry_run)
+
+    inplace = os.path.realpath(source) == os.path.realpath(destination)
+    if not (dry_run or inplace):
+        if config.languages and config.specialized_trees:
+            # The shim puts only the language's tree on the package's path,
+            # so each tree gets shared static files and its language's own
+            own = {path for langdef in config.languages.values()
+                   for path in langdef.static_files}
+            shared = tuple(path for path in config.static_files
+                           if path not in own)
+            targets = [(os.path.join(destination, "i18n", code),
+                        shared + langdef.static_files)
+                       for code, langdef in config.languages.items()]
+        else:
+            targets = [(destination, config.static_files)]
+        for target, paths in targets:
+            for path in paths:
+                if ReportAll <= verbosity:
+                    any_reports = True
+                    print(f"Copying files from '{path}'")
+                shutil.copytree(path, target, dirs_exist_ok=True)
+
+    if not any_reports and verbosity > ReportCritical:
+        print("No changes.")
+
+    if segments is not None:
+        unused = sum(len(segment.reserved) for segment in segments.values())
+        if unused and verbosity > ReportCritical:
+            print(f"{unused} messages from the table profile were not found.")
+        for segment in segments.values():
+            segment.writer.close(config.compile_tables)
+
+
+def _translate_files(
+        translations: List[MsgDict],
+        source: str, destination: str, pattern: str,
+        segments: Optional[Dict[str, TableSegment]],
+        auto_imports: Sequence[str],
+        hot: Dict[str, List[Tuple[str, ...]]],
+        *, verbosity: int, dry_run: bool) -> bool:
+    # Translate files into destination; use multilingual translator and
+    # put messages into tables in `segments`, unless it is `None`; new
+    # segments reserve indices for key paths in `hot`.
+    # Return `True` if anything was reported
     def write_if_different(data, dest):
         try:
             with open(dest, encoding=config.encoding) as f:
@@ -511,10 +236,10 @@ def translate(translations: Dict[str, MsgDict],
         def noop(*_, **_1):
             pass
 
-        copyfile = copytree = makedirs = noop
+        copyfile = makedirs = noop
 
     else:
-        copyfile, copytree = shutil.copyfile, shutil.copytree
+        copyfile = shutil.copyfile
         makedirs = os.makedirs
 
     any_reports = False
@@ -525,20 +250,12 @@ def translate(translations: Dict[str, MsgDict],
             any_reports = True
             print(s)
 
-    if config.auto_import:
-        imports = cst.parse_module("\n".join(config.auto_import))
+    if auto_imports:
+        imports = cst.parse_module("\n".join(auto_imports))
         auto_import = imports.body
     else:
         auto_import = None
 
-    if config.languages:
-        message_tables = [[language.name, language.international_name]
-                          for language in config.languages.values()]
-        key_mapping = []
-    else:
-        message_tables = None
-        key_mapping = None
-
     for name, fullname in walk_files(source, pattern, select=False):
         transname = os.path.join(destination, name)
         path, _ = os.path.split(transname)
@@ -572,7 +289,17 @@ def translate(translations: Dict[str, MsgDict],
             print(f"Error when parsing {name}")
             raise
 
-        if auto_import is not None:
+        file_import = auto_import
+        if segments is not None:
+            segment = table_segment(name)
+            if segment not in segments:
+                segments[segment] = new_segment(destination, segment, hot)
+            if segment:
+                file_import = [*(auto_import or ()),
+                               cst.parse_statement(
+                                   f'_tr = _tr.segment("{segment}")')]
+
+        if file_import is not None:
             counter = CountImportsFromFuture()
             tree.visit(counter)
             n_future_imports = counter.count
@@ -587,22 +314,27 @@ def translate(translations: Dict[str, MsgDict],
                 trans[name].value if name in trans else {}
                 for trans in translations
             ]
-            if config.languages is None:
+            if segments is None:
                 translator = StringTranslator(
                     trans_name[0],
                     tree,
-                    auto_import, n_future_imports, has_docstring)
+                    file_import, n_future_imports, has_docstring)
             else:
+                message_tables, key_mapping, reserved, writer = \
+                    segments[segment]
                 translator = StringTranslatorMultilingual(
                     trans_name, [name], message_tables, key_mapping,
                     tree,
-                    auto_import, n_future_imports, has_docstring)
+                    file_import, n_future_imports, has_docstring,
+                    reserved, writer.flushed)
             tree = cst.metadata.MetadataWrapper(tree)
             translated = tree.visit(translator)
             trans_source = tree.module.code_for_node(translated)
         except Exception:
             print(f"Error when inserting translations into {name}")
             raise
+        if segments is not None:
+            segments[segment].writer.flush()
 
         diff = write_if_different(trans_source, transname)
         if diff == 0:
@@ -611,24 +343,12 @@ def translate(translations: Dict[str, MsgDict],
             report(f"Updating translated {name}", ReportUpdates)
         else:  # diff == 2
             report(f"Creating translated {name}", ReportUpdates)
-    if not dry_run:
-        for path in config.static_files:
-            report(f"Copying files from '{path}'", ReportAll)
-            copytree(path, destination, dirs_exist_ok=True)
-
-    if not any_reports and verbosity > ReportCritical:
-        print("No changes.")
+        if segments is not None and config.format_f_strings:
+            for original, formatted in translator.f_strings:
+                path = "format" if formatted else "eval"
+                report(f"  {path}: {original}", ReportTranslations)
+    return any_reports
 
-    if config.languages:
-        i18ndir = os.path.join(destination, "i18n")
-        os.makedirs(i18ndir, exist_ok=True)
-        for langdef, messages in zip(config.languages.values(), message_tables):
-            fname = os.path.join(i18ndir, f"{langdef.international_name}.json")
-            with open(fname, "wt", encoding=config.encoding) as f:
-                json.dump(messages, f)
-        languages = [langdef.international_name
-                     for langdef in config.languages.values()]
-        save_mapping(i18ndir, languages, key_mapping)
 
 def _any_translations(translations: MsgDict):
     return any(isinstance(value, str)
@@ -677,6 +397,84 @@ def merge(additional: MsgDict, existing: MsgDict, pattern: str = "",
     return unused
 
 
+def with_fallbacks(translations: MsgDict,
+                   fallbacks: Sequence[MsgDict]) -> MsgDict:
+    """
+    Return translations in which messages that are missing or untranslated
+    (`None`) are taken from the first fallback that has them.
+
+    Messages that are explicitly kept (`False` or `True`) are not replaced.
+    """
+    fallbacks = [fallback for fallback in fallbacks if fallback]
+    if not fallbacks:
+        return translations
+    resolved: MsgDict = {}
+    for key in dict.fromkeys(itertools.chain(translations, *fallbacks)):
+        nodes = [messages[key] for messages in (translations, *fallbacks)
+                 if key in messages]
+        spaces = [node for node in nodes if isinstance(node.value, dict)]
+        if spaces:
+            resolved[key] = MsgNode(
+                with_fallbacks(spaces[0].value,
+                               [node.value for node in spaces[1:]]),
+                spaces[0].comments)
+        else:
+            resolved[key] = next(
+                (node for node in nodes if node.value is not None), nodes[0])
+    return resolved
+
+
+def resolve_fallbacks(translations: List[MsgDict]) -> List[MsgDict]:
+    """
+    Apply fallbacks from configuration to translations for all languages.
+
+    Translations are given in the order of `config.languages`.
+    """
+    codes = list(config.languages)
+    return [
+        with_fallbacks(trans,
+                       [translations[codes.index(code)]
+                        for code in langdef.fallback])
+        for trans, langdef in zip(translations, config.languages.values())]
+
+
+def mo_entries(translations: MsgDict,
+               pattern: str = "") -> List[Tuple[str, str, str]]:
+    """
+    Return triplets (context, original, translation) for translated messages,
+    for writing into a gettext catalog.
+
+    Context is the path of keys (file name, classes and functions), separated
+    by slashes. Escape sequences in originals and translations are decoded.
+    """
+    entries = []
+
+    def collect_entries(messages: MsgDict, path: Tuple[str, ...]):
+        for key, node in messages.items():
+            if isinstance(node.value, dict):
+                collect_entries(node.value, path + (key, ))
+            elif isinstance(node.value, str):
+                entries.append(("/".join(path),
+                                _string_value(key),
+                                _string_value(node.value)))
+
+    for fname, node in translations.items():
+        if pattern in fname and isinstance(node.value, dict):
+            collect_entries(node.value, (fname, ))
+    return entries
+
+
+def _string_value(text: str) -> str:
+    # Messages are stored as they appear between the quotes in sources; try
+    # quotes that can enclose them
+    for quote in ('"', "'", '"""', "'''"):
+        try:
+            return ast.literal_eval(f"{quote}{text}{quote}")
+        except (SyntaxError, ValueError):
+            pass
+    return text
+
+
 def template(existing: MsgDict, pattern: str = "") -> MsgDict:
     new_template: MsgDict = {}
     for msg, trans in existing.items():
@@ -697,7 +495,12 @@ def update_messages(
     lang_idx: int,
 ) -> List[str]:
     new_messages = []
-    for ((path, *parts), f_langs, raw), old in zip(mapping, messages):
+    for keymap, old in zip(mapping, messages):
+        if keymap.joined:
+            entry = _joined_entry(translations, keymap, lang_idx)
+            new_messages.append(old if entry is None else entry)
+            continue
+        path, *parts = keymap.path
         node = translations.get(path)
         if node is None or not isinstance(node.value, dict):
             new_messages.append(old)
@@ -708,22 +511,47 @@ def update_messages(
                 new_messages.append(old)
                 break
         else:
-            if isinstance(node.value, str):
-                message = node.value
-                if not raw:
-                    message = message \
-                        .encode('latin-1', 'backslashreplace') \
-                        .decode('unicode-escape')
-                if f_langs:
-                    message = repr(message)
-                    if lang_idx in f_langs:
-                        message = "f" + message
-                new_messages.append(message)
-            else:
+            if not isinstance(node.value, str):
                 new_messages.append(parts[-1])
+                continue
+            message = table_entry(
+                node.value, keymap.f_lang_idx, keymap.raw, lang_idx)
+            if keymap.fields is not None:
+                formatted = format_template(message, keymap.fields)
+                if formatted is None:
+                    print(f"{'/'.join(keymap.path)}: translation uses "
+                          "expressions that are not in the original; "
+                          "translate again to update it")
+                    formatted = old
+                message = formatted
+            new_messages.append(message)
     return new_messages
 
 
+def _joined_entry(translations: MsgDict,
+                  keymap: KeyMapping,
+                  lang_idx: int) -> Optional[str]:
+    # Return the entry for implicitly concatenated strings, or None if their
+    # namespace is missing; untranslated parts are kept in the original, as
+    # in `translate`
+    *path, original = keymap.path
+    namespace = translations
+    for part in path:
+        node = namespace.get(part)
+        if node is None or not isinstance(node.value, dict):
+            return None
+        namespace = node.value
+    entries = []
+    for orig in (original, *keymap.joined):
+        node = namespace.get(orig)
+        if node is not None and isinstance(node.value, str):
+            message = node.value
+        else:
+            message = orig
+        entries.append(table_entry(message, (), keymap.raw, lang_idx))
+    return "".join(entries)
+
+
 @dataclasses.dataclass
 class Stat:
     translated: int = 0
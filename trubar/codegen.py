@@ -0,0 +1,721 @@
+import ast
+import re
+from typing import \
+    Union, List, Optional, Tuple, Dict, Set, Collection, Sequence
+
+import libcst as cst
+from libcst.metadata import ParentNodeProvider
+
+from trubar.utils import KeyMapping
+from trubar.messages import MsgDict
+from trubar.config import config
+
+
+NamespaceNode = Union[cst.Module, cst.FunctionDef, cst.ClassDef]
+SomeString = Union[cst.SimpleString, cst.FormattedString]
+
+
+re_single_quote = re.compile(r"(^|[^\\])'")
+re_double_quote = re.compile(r'(^|[^\\])"')
+re_braced = re.compile(r"{.+}")
+all_quotes = ("'", '"', "'''", '"""')
+
+
+def prefix_for_node(node: NamespaceNode):
+    if isinstance(node, cst.FunctionDef):
+        return "def "
+    elif isinstance(node, cst.ClassDef):
+        return "class "
+    assert isinstance(node, cst.Module)
+    return ""
+
+
+class TranslationError(Exception):
+    pass
+
+
+class CountImportsFromFuture(cst.CSTVisitor):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.has_docstring = False
+
+    def visit_Module(self, node: cst.Module):
+        self.has_docstring = node.get_docstring()
+
+    def visit_ImportFrom(self, node: cst.ImportFrom):
+        if node.module is not None and node.module.value == "__future__":
+            self.count += 1
+        return False
+
+
+class StringTranslatorBase(cst.CSTTransformer):
+    METADATA_DEPENDENCIES = (ParentNodeProvider, )
+
+    def __init__(self,
+                 module: cst.Module,
+                 auto_import: Optional[cst.CSTNode] = None,
+                 n_future_imports: Optional[int] = 0,
+                 has_docstring: bool = False):
+        super().__init__()
+        self.module = module
+        self.context_stack: Union[List[MsgDict], List[List[MsgDict]]] = []
+        self.auto_import = auto_import
+        self.auto_import_after = n_future_imports or None
+        self.import_after_docstring = has_docstring and not n_future_imports
+
+    @property
+    def context(self):
+        return self.context_stack[-1]
+
+    def push_context(self, node: NamespaceNode) -> None:
+        raise NotImplementedError
+
+    def pop_context(self) -> None:
+        self.context_stack.pop()
+
+    def __leave(self, _, updated_node: cst.CSTNode) -> cst.CSTNode:
+        self.pop_context()
+        return updated_node
+
+    def translate(
+            self,
+            node: SomeString,
+            updated_node: SomeString) -> cst.CSTNode:
+        raise NotImplementedError
+
+    leave_ClassDef = __leave
+    leave_FunctionDef = __leave
+
+    def leave_SimpleStatementLine(self, _, updated_node: cst.CSTNode
+                                  ) -> cst.CSTNode:
+        # Decrease the counter of __future__imports, and put auto imports
+        # after the node when the counter reaches zero
+        if self.auto_import is None:
+            return updated_node
+
+        if self.auto_import_after is not None:
+            self.auto_import_after -= sum(
+                isinstance(child, cst.ImportFrom)
+                and child.module.value == "__future__"
+                for child in updated_node.body)
+
+        if self.import_after_docstring:
+            import_now = isinstance(updated_node, cst.SimpleStatementLine)
+        else:
+            import_now = self.auto_import_after == 0
+        if import_now:
+            updated_node = cst.FlattenSentinel([updated_node,
+                                                *self.auto_import])
+            self.auto_import = None
+        return updated_node
+
+    def on_leave(self,
+                 original_node: cst.CSTNodeT,
+                 updated_node: cst.CSTNodeT) -> cst.CSTNode:
+        # If there are no imports from __future__ insert auto import
+        # before the first node
+        updated_node = super().on_leave(original_node, updated_node)
+        if self.auto_import \
+                and not self.import_after_docstring \
+                and self.auto_import_after is None \
+                and not isinstance(original_node, cst.Module) \
+                and isinstance(
+                    self.get_metadata(ParentNodeProvider, original_node),
+                    cst.Module):
+            updated_node = cst.FlattenSentinel([*self.auto_import,
+                                                updated_node])
+            self.auto_import = None
+        return updated_node
+
+    def visit_ClassDef(self, node: NamespaceNode) -> None:
+        self.push_context(node)
+
+    def visit_FunctionDef(self, node: NamespaceNode) -> None:
+        self.push_context(node)
+
+    def leave_FormattedString(
+            self,
+            original_node: cst.FormattedString,
+            updated_node: cst.FormattedString) -> cst.CSTNode:
+        return self.translate(original_node, updated_node)
+
+    def leave_SimpleString(
+            self,
+            original_node: cst.SimpleString,
+            updated_node: cst.SimpleString) -> cst.CSTNode:
+        return self.translate(original_node, updated_node)
+
+    def visit_ConcatenatedString(
+            self,
+            _) -> bool:
+        return False
+
+    def leave_ConcatenatedString(
+            self,
+            original_node: cst.ConcatenatedString,
+            updated_node: cst.ConcatenatedString) -> cst.CSTNode:
+
+        def compose_concatenation(node: cst.ConcatenatedString):
+            left = self.translate(node.left, node.left)
+            if isinstance(node.right, cst.ConcatenatedString):
+                right = compose_concatenation(node.right)
+            else:
+                right = self.translate(node.right, node.right)
+            return cst.BinaryOperation(
+                left, cst.Add(), right,
+                (cst.LeftParen(),), (cst.RightParen(), ))
+
+        return compose_concatenation(updated_node)
+
+
+class StringTranslator(StringTranslatorBase):
+    def __init__(self,
+                 context: MsgDict,
+                 module: cst.Module,
+                 auto_import: Optional[cst.CSTNode] = None,
+                 n_future_imports: Optional[int] = None,
+                 has_docstring: bool = False):
+        super().__init__(module, auto_import, n_future_imports, has_docstring)
+        self.context_stack = [context]
+
+    def push_context(self, node: NamespaceNode) -> None:
+        key = f"{prefix_for_node(node)}`{node.name.value}`"
+        space = self.context[key].value if key in self.context else {}
+        self.context_stack.append(space)
+
+    def translate(
+            self,
+            node: SomeString, updated_node: SomeString) -> cst.CSTNode:
+        if not self.context:
+            return updated_node
+        lq = len(node.quote)
+        original = self.module.code_for_node(node)[len(node.prefix) + lq:-lq]
+        if original not in self.context:
+            return updated_node
+        translation = self.context[original].value
+        if translation in (None, False, True):
+            return updated_node
+        assert isinstance(translation, str)
+
+        quote = node.quote
+        if config.smart_quotes:
+            has_single = re_single_quote.search(translation)
+            has_double = re_double_quote.search(translation)
+            if quote == "'" and has_single and not has_double:
+                quote = '"'
+            elif quote == '"' and has_double and not has_single:
+                quote = "'"
+
+        if config.auto_prefix \
+                and "f" not in node.prefix and not re_braced.search(original) \
+                and re_braced.search(translation) :
+            try:
+                new_node = cst.parse_expression(
+                    f'f{node.prefix}{quote}{translation}{quote}')
+            except cst.ParserSyntaxError:
+                pass
+            else:
+                assert isinstance(new_node, cst.FormattedString)
+                if any(isinstance(part, cst.FormattedStringExpression)
+                       for part in new_node.parts):
+                    return new_node
+
+        try:
+            new_node = cst.parse_expression(
+                f'{node.prefix}{quote}{translation}{quote}')
+        except cst.ParserSyntaxError:
+            if "\n" in translation and len(quote) != 3:
+                unescaped = " Unescaped \\n?"
+            else:
+                unescaped = ""
+            raise TranslationError(
+                f'\nProbable syntax error in translation.{unescaped}\n'
+                f'Original: {original}\n'
+                f'Translation: {translation}') from None
+
+        return new_node
+
+    def leave_ConcatenatedString(
+            self,
+            original_node: cst.ConcatenatedString,
+            updated_node: cst.ConcatenatedString) -> cst.CSTNode:
+        # Keep the implicit concatenation of translated literals, which is
+        # joined into a single literal by the compiler
+        def translate_parts(node: cst.ConcatenatedString):
+            left = self.translate(node.left, node.left)
+            if isinstance(node.right, cst.ConcatenatedString):
+                right = translate_parts(node.right)
+            else:
+                right = self.translate(node.right, node.right)
+            if not isinstance(left, (cst.SimpleString, cst.FormattedString)) \
+                    or not isinstance(right, (cst.SimpleString,
+                                              cst.FormattedString,
+                                              cst.ConcatenatedString)):
+                return None
+            return node.with_changes(left=left, right=right)
+
+        translated = translate_parts(updated_node)
+        if translated is None:
+            return super().leave_ConcatenatedString(original_node, updated_node)
+        return translated
+
+
+class StringTranslatorMultilingual(StringTranslatorBase):
+    def __init__(self,
+                 contexts: List[MsgDict],
+                 key_stack: List[str],
+                 message_tables: List[List[str]],
+                 key_mapping: List[KeyMapping],
+                 module: cst.Module,
+                 auto_import: Optional[cst.CSTNode] = None,
+                 n_future_imports: Optional[int] = None,
+                 has_docstring: bool = False,
+                 reserved: Optional[Dict[Tuple[str, ...], int]] = None,
+                 offset: int = 0):
+        super().__init__(module, auto_import, n_future_imports, has_docstring)
+        self.context_stack = [contexts]
+        # Indices reserved for messages with the given key paths; used indices
+        # are removed from the dictionary
+        self.reserved = reserved if reserved is not None else {}
+        # Number of entries that were already written and removed from tables
+        self.offset = offset
+        self.key_stack = key_stack
+        self.message_tables = message_tables
+        self.key_mapping = key_mapping
+        # Originals of f-strings and whether they are formatted without eval
+        self.f_strings: List[Tuple[str, bool]] = []
+        # Originals of strings with plain lookups in the current line
+        self.line_originals: List[str] = []
+        # Originals from headers of enclosing compound statements
+        self.header_originals: List[List[str]] = []
+        # Strings within functions are bound to module-level names after
+        # auto imports
+        self.hoist_after = auto_import[-1] \
+            if config.hoist_strings and auto_import else None
+        self.hoisted: List[cst.SimpleStatementLine] = []
+
+    def push_context(self, node: NamespaceNode) -> None:
+        key = f"{prefix_for_node(node)}`{node.name.value}`"
+        space = [lang_context[key].value if key in lang_context else {}
+                 for lang_context in self.context]
+        self.context_stack.append(space)
+        self.key_stack.append(key)
+
+    def pop_context(self) -> None:
+        super().pop_context()
+        self.key_stack.pop()
+
+    def leave_Module(self, _, updated_node: cst.Module) -> cst.Module:
+        if not self.hoisted:
+            return updated_node
+        body = list(updated_node.body)
+        pos = next(i for i, stmt in enumerate(body)
+                   if stmt is self.hoist_after) + 1
+        body[pos:pos] = self.hoisted
+        return updated_node.with_changes(body=body)
+
+    def visit_SimpleStatementLine(self, _) -> None:
+        self.line_originals = []
+
+    def visit_Decorator(self, _) -> None:
+        self.line_originals = []
+
+    def leave_Decorator(self, _, updated_node: cst.Decorator) -> cst.Decorator:
+        trailing = _with_originals(updated_node.trailing_whitespace,
+                                   self.line_originals)
+        self.line_originals = []
+        return updated_node.with_changes(trailing_whitespace=trailing)
+
+    def visit_IndentedBlock(self, _) -> None:
+        # Originals from the header of a compound statement (conditions,
+        # default arguments ...) go to the line with the colon
+        self.header_originals.append(self.line_originals)
+        self.line_originals = []
+
+    def leave_IndentedBlock(
+            self, _, updated_node: cst.IndentedBlock) -> cst.IndentedBlock:
+        header = _with_originals(updated_node.header,
+                                 self.header_originals.pop())
+        self.line_originals = []
+        return updated_node.with_changes(header=header)
+
+    def visit_SimpleStatementSuite(self, _) -> None:
+        self.header_originals.append(self.line_originals)
+        self.line_originals = []
+
+    def leave_SimpleStatementSuite(
+            self, _,
+            updated_node: cst.SimpleStatementSuite) -> cst.SimpleStatementSuite:
+        trailing = _with_originals(
+            updated_node.trailing_whitespace,
+            self.header_originals.pop() + self.line_originals)
+        self.line_originals = []
+        return updated_node.with_changes(trailing_whitespace=trailing)
+
+    def leave_Arg(self, _, updated_node: cst.Arg) -> cst.Arg:
+        # Remove parentheses around `_tr.e(...) if True else f"..."` in calls
+        value = updated_node.value
+        if isinstance(value, cst.IfExp) and value.lpar \
+                and isinstance(value.test, cst.Name) \
+                and value.test.value == "True":
+            updated_node = updated_node.with_changes(
+                value=value.with_changes(lpar=(), rpar=()))
+        return updated_node
+
+    def leave_SimpleStatementLine(
+            self,
+            original_node: cst.SimpleStatementLine,
+            updated_node: cst.SimpleStatementLine) -> cst.CSTNode:
+        # Show originals of plain lookups, `_tr.t[idx]`, in a trailing comment
+        if self.line_originals:
+            updated_node = updated_node.with_changes(
+                trailing_whitespace=_with_originals(
+                    updated_node.trailing_whitespace, self.line_originals))
+            self.line_originals = []
+        return super().leave_SimpleStatementLine(original_node, updated_node)
+
+    @classmethod
+    def _f_string_languages(cls,
+                            prefix: str,
+                            original: str,
+                            messages: List[str]) -> set[int]:
+        """
+        For the given messages, return a set of indices of languages that
+        requires an f-prefix, excluding the original language.
+
+        This is determined by
+         - checking that the string includes braces and, if so,
+         - compiling as f-string and checking that the result contains some
+           formatted string expressions
+        """
+        add_f = set()
+        if "f" not in prefix:
+            prefix += "f"
+        for i, translation in enumerate(messages[1:], start=1):
+            if re_braced.search(translation):
+                try:
+                    node = cst.parse_expression(prefix + repr(translation))
+                except cst.ParserSyntaxError as exc:
+                    languages = list(config.languages.values())
+                    language = languages[i].international_name
+                    raise TranslationError(
+                        f"Probable syntax error in translation to {language}.\n"
+                        f"Original: {original}\n"
+                        f"Translation:\n  {translation}\n"
+                        "This error occurred while trying to compile the "
+                        "translation string as an f-string.\n"
+                        "The original Python message:"
+                    ) from exc
+
+                assert isinstance(node, cst.FormattedString)
+                if any(isinstance(part, cst.FormattedStringExpression)
+                       for part in node.parts):
+                    add_f.add(i)
+        return add_f
+
+    def _table_entries(
+            self,
+            node: SomeString) -> Optional[Tuple[str, Set[int], List[str]]]:
+        """
+        Return the original, the indices of languages that need an f-string
+        and the entries for message tables, or `None` if the string is not
+        translated to any language.
+        """
+        lq = len(node.quote)
+        orig_str = self.module.code_for_node(node)
+        original = orig_str[len(node.prefix) + lq:-lq]
+
+        messages = [lang_context[original].value
+                    if original in lang_context else None
+                    for lang_context in self.context]
+        assert all(isinstance(translation, (str, bool, type(None)))
+                   for translation in messages)
+        if all(message in (None, False, True) for message in messages):
+            return None
+        messages = [
+            translation if isinstance(translation, str) else original
+            for translation in messages]
+
+        if "f" in node.prefix \
+                or config.auto_prefix and not re_braced.search(original):
+            need_f = self._f_string_languages(node.prefix, orig_str, messages)
+            if "f" in node.prefix:
+                need_f.add(0)
+        else:
+            need_f = set()
+
+        raw = "r" in node.prefix
+        entries = [table_entry(message, need_f, raw, lang_idx)
+                   for lang_idx, message in enumerate(messages)]
+        return original, need_f, entries
+
+    def _add_entries(self, entries: List[str], keymap: KeyMapping) -> int:
+        idx = self.reserved.pop(keymap.path, None)
+        if idx is None:
+            idx = self.offset + len(self.message_tables[0])
+            for entry, table in zip(entries, self.message_tables):
+                table.append(entry)
+            self.key_mapping.append(keymap)
+        else:
+            for entry, table in zip(entries, self.message_tables):
+                table[idx] = entry
+            offset = len(self.message_tables[0]) - len(self.key_mapping)
+            self.key_mapping[idx - offset] = keymap
+        return idx
+
+    def translate(
+            self,
+            node: SomeString,
+            updated_node: SomeString) -> cst.CSTNode:
+        if not self.context:
+            return updated_node
+
+        translation = self._table_entries(node)
+        if translation is None:
+            return updated_node
+        original, need_f, entries = translation
+        orig_str = self.module.code_for_node(node)
+
+        fields = None
+        if need_f and config.format_f_strings:
+            fields, templates = self._format_templates(node, entries)
+            if fields is not None:
+                entries = templates
+            self.f_strings.append((original, fields is not None))
+        idx = self._add_entries(
+            entries,
+            KeyMapping(
+                (*self.key_stack, original),
+                tuple(need_f),
+                "r" in node.prefix,
+                fields
+            )
+        )
+
+        if fields is not None:
+            # Expressions are parenthesized, so that e.g. unparenthesized
+            # tuples in fields remain single arguments
+            args = ", ".join(field if field.isidentifier() else f"({field})"
+                             for field in fields)
+            if len(fields) == 1:
+                args += ","
+            trans = f"_tr.f({idx}, ({args}))"
+        elif need_f and any(isinstance(part, cst.FormattedStringExpression)
+                            for part in getattr(node, "parts", ())):
+            # The original f-string is never evaluated; it only ensures that
+            # names used in it are in the closure and thus available to eval
+            trans = f"(_tr.e(_tr.c({idx})) if True else {orig_str})"
+        elif need_f:
+            trans = f'_tr.e(_tr.c({idx}, {orig_str}))'
+        else:
+            trans = self._lookup(idx, orig_str)
+        return cst.parse_expression(trans)
+
+    def _lookup(self, idx: int, orig_str: str) -> str:
+        """Return code for looking up a string that is not an f-string"""
+        if self.hoist_after is not None \
+                and any(key.startswith("def ") for key in self.key_stack[1:]):
+            trans = f"_tr_{idx}"
+            if config.plain_lookup:
+                lookup = f"_tr.t[{idx}]  {_originals_comment([orig_str])}"
+            else:
+                lookup = f"_tr.m[{idx}, {orig_str}]"
+            self.hoisted.append(cst.parse_statement(f"{trans} = {lookup}"))
+            return trans
+        if config.plain_lookup:
+            self.line_originals.append(orig_str)
+            return f"_tr.t[{idx}]"
+        return f"_tr.m[{idx}, {orig_str}]"
+
+    def leave_ConcatenatedString(
+            self,
+            original_node: cst.ConcatenatedString,
+            updated_node: cst.ConcatenatedString) -> cst.CSTNode:
+        # Fold adjacent parts that are not f-strings (in any language) and are
+        # either all raw or not raw into a single table entry
+        if not self.context:
+            return updated_node
+
+        parts = []
+        node = updated_node
+        while isinstance(node, cst.ConcatenatedString):
+            parts.append(node.left)
+            node = node.right
+        parts.append(node)
+
+        # Group parts into runs of parts that are not f-strings in any
+        # language; untranslated simple strings can be a part of a run
+        runs: List[List[SomeString]] = []
+        translations = {}
+        untranslated = set()
+        for part in parts:
+            translation = self._table_entries(part)
+            if translation is None and isinstance(part, cst.SimpleString):
+                lq = len(part.quote)
+                original = self.module.code_for_node(part)[
+                    len(part.prefix) + lq:-lq]
+                raw = "r" in part.prefix
+                translation = original, set(), [
+                    table_entry(original, (), raw, lang_idx)
+                    for lang_idx in range(len(self.message_tables))]
+                untranslated.add(part)
+            foldable = translation is not None and not translation[1]
+            if foldable:
+                translations[part] = translation
+            if foldable and runs and runs[-1][-1] in translations \
+                    and ("r" in runs[-1][-1].prefix) == ("r" in part.prefix):
+                runs[-1].append(part)
+            else:
+                runs.append([part])
+        runs = [run_or_part
+                for run in runs
+                for run_or_part in (
+                    [[part] for part in run] if untranslated.issuperset(run)
+                    else [run])]
+        if len(runs) == len(parts):
+            return super().leave_ConcatenatedString(original_node,
+                                                    updated_node)
+
+        translated = []
+        for run in runs:
+            if len(run) == 1:
+                translated.append(self.translate(run[0], run[0]))
+                continue
+            originals, _, entries = zip(*map(translations.get, run))
+            idx = self._add_entries(
+                ["".join(lang_entries) for lang_entries in zip(*entries)],
+                KeyMapping(
+                    (*self.key_stack, originals[0]),
+                    (),
+                    "r" in run[0].prefix,
+                    None,
+                    originals[1:]
+                )
+            )
+            orig_str = " ".join(map(self.module.code_for_node, run))
+            translated.append(
+                cst.parse_expression(self._lookup(idx, orig_str)))
+
+        node = translated.pop()
+        while translated:
+            node = cst.BinaryOperation(
+                translated.pop(), cst.Add(), node,
+                (cst.LeftParen(),), (cst.RightParen(), ))
+        return node
+
+    def _format_templates(
+            self,
+            node: SomeString,
+            entries: List[str]
+    ) -> Tuple[Optional[Tuple[str, ...]], Optional[List[str]]]:
+        """
+        Return expressions from replacement fields of the original f-string
+        and templates for `str.format` for all languages, or a pair of `None`s
+        if translations cannot be formatted with the original expressions.
+        """
+        if isinstance(node, cst.FormattedString):
+            # Names are included once; other expressions, which may have
+            # side effects, are included at each occurrence
+            codes = [self.module.code_for_node(part.expression)
+                     for part in node.parts
+                     if isinstance(part, cst.FormattedStringExpression)]
+            fields = tuple(code for idx, code in enumerate(codes)
+                           if not code.isidentifier()
+                           or codes.index(code) == idx)
+        else:
+            fields = ()
+        templates = [format_template(entry, fields) for entry in entries]
+        if None in templates:
+            return None, None
+        return fields, templates
+
+
+def _originals_comment(originals: List[str]) -> str:
+    return "# " + ", ".join(orig.replace("\n", "\\n") for orig in originals)
+
+
+def _with_originals(trailing: cst.TrailingWhitespace,
+                    originals: List[str]) -> cst.TrailingWhitespace:
+    if not originals:
+        return trailing
+    comment = _originals_comment(originals)
+    if trailing.comment is not None:
+        comment += "  " + trailing.comment.value
+    return trailing.with_changes(whitespace=cst.SimpleWhitespace("  "),
+                                 comment=cst.Comment(comment))
+
+
+def table_entry(message: str,
+                 f_lang_idx: Collection[int],
+                 raw: bool,
+                 lang_idx: int) -> str:
+    if not raw:
+        # unescape the translation: we need actual \n, not \ and n
+        message = message \
+            .encode('latin-1', 'backslashreplace') \
+            .decode('unicode-escape')
+    if f_lang_idx:
+        # This string will be evaled, "uneval" it through repr
+        message = repr(message)
+        # Add an f-prefix to the string if needed
+        if lang_idx in f_lang_idx:
+            message = "f" + message
+    return message
+
+
+def format_template(entry: str, fields: Sequence[str]) -> Optional[str]:
+    """
+    Convert a table entry that is evaluated into a template for `str.format`,
+    whose positional arguments are values of the given expressions.
+
+    Return `None` if the entry contains other expressions, self-documenting
+    expressions or nested replacement fields in format specifications.
+    Names can be used any number of times, but other expressions, which may
+    have side effects, must be used exactly once and in the same order as
+    in `fields`, so they are evaluated as in the translated f-string.
+    """
+    others = [idx for idx, field in enumerate(fields)
+              if not field.isidentifier()]
+    node = cst.parse_expression(entry)
+    if isinstance(node, cst.SimpleString):
+        if others:
+            return None
+        return node.evaluated_value.replace("{", "{{").replace("}", "}}")
+
+    assert isinstance(node, cst.FormattedString)
+
+    def unescape(text):
+        # Braces in text are already doubled; process other escapes
+        return ast.literal_eval(f"{node.quote}{text}{node.quote}")
+
+    result = ""
+    used = 0
+    for part in node.parts:
+        if isinstance(part, cst.FormattedStringText):
+            result += unescape(part.value)
+            continue
+        code = cst.Module([]).code_for_node(part.expression)
+        if part.equal \
+                or not all(isinstance(spec, cst.FormattedStringText)
+                           for spec in part.format_spec or ()):
+            return None
+        if code.isidentifier():
+            if code not in fields:
+                return None
+            idx = fields.index(code)
+        else:
+            if used == len(others) or fields[others[used]] != code:
+                return None
+            idx = others[used]
+            used += 1
+        result += "{" + str(idx)
+        if part.conversion:
+            result += "!" + part.conversion
+        if part.format_spec:
+            result += ":" + unescape(
+                "".join(spec.value for spec in part.format_spec))
+        result += "}"
+    if used != len(others):
+        return None
+    return result
@@ -12,6 +12,15 @@ class LanguageDef:
     name: str
     international_name: str
     is_original: bool
+    # Language-specific auto imports; they are also included in
+    # `Configuration.auto_import`
+    auto_import: tuple = ()
+    # Codes of languages whose translations are used, in this order, for
+    # messages that are not translated to this language
+    fallback: tuple = ()
+    # Language-specific static files; they are also included in
+    # `Configuration.static_files`
+    static_files: tuple = ()
 
 
 @dataclasses.dataclass
@@ -28,6 +37,20 @@ class Configuration:
 
     encoding: str = "utf-8"
 
+    cache_messages: bool = False
+    cache_dir: str = ""
+
+    compile_tables: bool = False
+    format_f_strings: bool = False
+    plain_lookup: bool = False
+    hoist_strings: bool = False
+
+    partition_tables: bool = False
+    partition_prefixes: tuple = ()
+
+    specialized_trees: bool = False
+    tree_selector: str = ""
+
     languages = None
 
     def __post_init__(self):
@@ -78,10 +101,13 @@ class Configuration:
         if isinstance(self.static_files, str):
             self.static_files = (self.static_files, )
         self.__check_static_files()
+        if self.hoist_strings and not self.auto_import:
+            print("Option 'hoist-strings' requires 'auto-import'")
+            sys.exit(4)
 
     def parse_languages(self, value):
         language_options = {"name", "original", "international-name",
-                            "auto-import"}
+                            "auto-import", "fallback"}
         self.languages = {}
         for code, values in value.items():
             if "name" not in values:
@@ -101,22 +127,36 @@ class Configuration:
                 print(f"Directory for language '{code}' is missing "
                       f"({lang_dir}).")
                 sys.exit(4)
+            auto_import = (values["auto-import"], ) \
+                if "auto-import" in values else ()
+            fallback = values.get("fallback", ())
+            if isinstance(fallback, str):
+                fallback = (fallback, )
+            static_dir = os.path.join(lang_dir, "static")
+            static_files = (static_dir, ) if os.path.exists(static_dir) else ()
             self.languages[code] = LanguageDef(
                 name=name,
                 international_name=international_name,
-                is_original=is_original
+                is_original=is_original,
+                auto_import=auto_import,
+                fallback=tuple(fallback),
+                static_files=static_files
             )
-            if "auto-import" in values:
-                self.auto_import = self.auto_import + (values["auto-import"], )
-            static_dir = os.path.join(lang_dir, "static")
-            if os.path.exists(static_dir):
-                self.static_files = self.static_files + (static_dir, )
+            self.auto_import = self.auto_import + auto_import
+            self.static_files = self.static_files + static_files
         sorted_langs = sorted(self.languages.items(),
                               key=lambda item: not item[1].is_original)
         if not sorted_langs[0][1].is_original:
             print("Original language is not defined")
             sys.exit(4)
         self.languages = dict(sorted_langs)
+        for code, langdef in self.languages.items():
+            unknown = [fallback for fallback in langdef.fallback
+                       if fallback not in self.languages or fallback == code]
+            if unknown:
+                print(f"Invalid fallback languages for '{code}': " +
+                      ', '.join(unknown))
+                sys.exit(4)
 
     def set_static_files(self, static):
         self.static_files = self.static_files + tuple(static)
@@ -5,9 +5,87 @@ class JamlError(Exception):
     pass
 
 
+# Kinds of events, which are tuples
+# (ENTER, key, comments), (LEAF, key, value, comments) and (EXIT, )
+ENTER, LEAF, EXIT = "enter", "leaf", "exit"
+
+
 def readfile(name, encoding="utf8"):
     with open(name, encoding=encoding) as f:
-        return read(f.read())
+        return _build(iterparse(f))
+
+
+def readfile_indexed(name, encoding="utf8"):
+    """
+    Read the file and return the tree and a list of triplets
+    `(key, start, end)` with byte offsets of its top-level sections.
+
+    A section includes the comments before its key and the empty lines
+    after it, and is a valid JAML document, which can be read with
+    `readsections`. The list is `None` if the encoding is not compatible
+    with ASCII (e.g. UTF-16), so sections cannot be decoded separately.
+    """
+    with open(name, "rb") as f:
+        text = f.read().decode(encoding)
+    if "\r\n".encode(encoding) != b"\r\n":
+        return read(text), None
+
+    # Lines are split like in `read`; lines with line ends are used for
+    # computing offsets
+    lines = text.splitlines()
+    consumed = 0  # index of the last line read by the parser
+
+    def tracked_lines():
+        nonlocal consumed
+        for consumed, line in enumerate(lines):
+            yield line
+        consumed = len(lines)
+
+    ends = []
+
+    def tracked_events(events):
+        # Exits to the top level are yielded when the parser reads the
+        # first line after the section, or after the end of file
+        depth = 0
+        for event in events:
+            kind = event[0]
+            if kind == ENTER:
+                if depth == 0:
+                    ends.append([event[1], None])
+                depth += 1
+            elif kind == EXIT:
+                depth -= 1
+                if depth == 0:
+                    ends[-1][1] = consumed
+            elif depth == 0:
+                ends.append([event[1], consumed + 1])
+            yield event
+
+    tree = _build(tracked_events(_events(tracked_lines())))
+
+    sections = []
+    lines = text.splitlines(keepends=True)
+    start = line_start = 0
+    for key, line_end in ends:
+        end = start + len("".join(lines[line_start:line_end]).encode(encoding))
+        sections.append((key, start, end))
+        start, line_start = end, line_end
+    return tree, sections
+
+
+def readsections(name, sections, encoding="utf8"):
+    """
+    Read sections with the given byte ranges `(start, end)`, as returned by
+    `readfile_indexed`, and return them as a single tree.
+
+    Line numbers in errors are relative to the start of the section.
+    """
+    items = {}
+    with open(name, "rb") as f:
+        for start, end in sections:
+            f.seek(start)
+            items.update(read(f.read(end - start).decode(encoding)))
+    return items
 
 
 def read(text):
@@ -15,77 +93,138 @@ def read(text):
 
 
 def readlines(lines):
+    return _build(_events(lines))
+
+
+def iterparse(source):
+    """
+    Yield events for the JAML document, without building the tree.
+
+    The source is a string or a file opened in text mode, which is read line
+    by line. Events are tuples `(ENTER, key, comments)` for namespaces,
+    `(LEAF, key, value, comments)` for messages, and `(EXIT, )` for the end
+    of the most recently entered namespace. Comments are a list of lines or
+    `None`. Errors are raised when they are encountered, so some events may
+    be yielded before the error.
+    """
+    if isinstance(source, str):
+        return _events(source.splitlines())
+    # Split lines with `str.splitlines`, like `read`, which splits at some
+    # characters that are not line ends in files
+    return _events(part for line in source
+                   for part in line.splitlines() or [""])
+
+
+def _build(events):
     # prevent circular import, pylint: disable=import-outside-toplevel
     from trubar.messages import MsgNode
 
+    items = space = {}
+    stack = [items]
+    for event in events:
+        kind = event[0]
+        if kind == LEAF:
+            space[event[1]] = MsgNode(event[2], event[3])
+        elif kind == ENTER:
+            subspace = {}
+            space[event[1]] = MsgNode(subspace, event[2])
+            stack.append(subspace)
+            space = subspace
+        else:
+            stack.pop()
+            space = stack[-1]
+    return items
+
+
+# Key, followed by a colon and whitespace or end of line, and value
+re_key_value = re.compile(r"(.*?):(?:\s+|$)(.*)")
+constants = {"true": True, "false": False, "null": None}
+_exit_event = (EXIT, )
+
+
+def _events(lines):
     def error(msg, line=None):
         raise JamlError(f"Line {line or lineno}: {msg}") from None
 
     def read_quoted(line):
+        # Return the string, with doubled quotes unescaped, and the rest of
+        # the line; a quote that is not doubled ends the string
         nonlocal lineno
         start_line = lineno
-        block = ""
-        q, line = line[0], line[1:]
-        while (mo := re.match(f"((?:[^{q}]|(?:{q}{q}))*){q}(?!{q})(.*)", line)
-                ) is None:
-            block += line + "\n"
+        q = line[0]
+        qq = 2 * q
+        block = []
+        start = 1
+        while True:
+            end = line.find(q, start)
+            while end != -1 and line.startswith(q, end + 1):
+                end = line.find(q, end + 2)
+            if end != -1:
+                break
+            block.append(line[start:])
             try:
                 lineno, line = next(linegen)
             except StopIteration:
                 error("file ends before the end of quoted string", start_line)
-        inside, after = mo.groups()
-        block += inside
-        return block.replace(2 * q, q), after
+            start = 0
+        block.append(line[start:end])
+        return "\n".join(block).replace(qq, q), line[end + 1:]
 
     def check_no_comments():
         if comments:
             error("stray comment", comment_start)
 
-    items = {}
-    stack = [(-1, items, True)]
+    match_key = re_key_value.match
+    get_constant = constants.get
+    # Indentation of namespaces and whether the next line must be indented
+    stack = [(-1, True)]
     comments = []
     comment_start = None
     linegen = enumerate(lines, start=1)
     lineno, line = 0, ""  # for error reporting for empty files
     for lineno, line in linegen:
+        sline = line.lstrip()
         # Skip empty lines
-        if not line.strip():
+        if not sline:
             continue
-        sline = line.lstrip()
         indent = len(line) - len(sline)
         line = sline
 
         # Indentation
-        last_indent, _, indent_expected = stack[-1]
+        last_indent, indent_expected = stack[-1]
         if indent_expected:
             if indent <= last_indent:
                 error("indent expected")
-            stack.append((indent, stack.pop()[1], False))
+            stack[-1] = (indent, False)
         elif indent > last_indent:
             error("unexpected indent")
         elif indent < last_indent:
             check_no_comments()
-            while stack and indent != stack[-1][0]:
-                stack.pop()
-            if not stack:
+            level = len(stack) - 1
+            while level >= 0 and indent != stack[level][0]:
+                level -= 1
+            if level < 0:
                 error("unindent does not match any outer level")
+            for _ in range(len(stack) - 1 - level):
+                yield _exit_event
+            del stack[level + 1:]
 
         # Gather comments
-        if line[0] == "#":
+        first = line[0]
+        if first == "#":
             comments.append(line)
             comment_start = comment_start or lineno
             continue
 
         # Get key
-        if line[0] in "'\"":
+        if first in ("'", '"'):
             start_line = lineno
             key, after = read_quoted(line)
             if after[:2] != ": ":
                 error(f"quoted key starting in line {start_line} must be followed by a ': '")
-            else:
-                value = after[2:].lstrip()
+            value = after[2:].lstrip()
         else:
-            mo = re.match(r"(.*?):(?:\s+|$)(.*)", line)
+            mo = match_key(line)
             if mo is None:
                 if ":" in line:
                     raise error("colon at the end of the key should be "
@@ -98,56 +237,86 @@ def readlines(lines):
         # `value` is lstripped, but may contain whitespace at the end, which is
         # included in quoted values
         # Leaves
-        if value.strip():
-            if value[0] in "'\"":
+        svalue = value.strip()
+        if svalue:
+            first = value[0]
+            if first in ("'", '"'):
                 start_line = lineno
                 value, after = read_quoted(value)
                 if after.strip():
                     error(f"quoted value starting in line {start_line} "
                           "must be followed by end of line")
             else:
-                value = {"true": True, "false": False, "null": None
-                         }.get(value.strip(), value)
-            stack[-1][1][key] = MsgNode(value, comments or None)
+                value = get_constant(svalue, value)
+            yield LEAF, key, value, comments or None
         # Internal nodes
         else:
-            space = {}
-            stack[-1][1][key] = MsgNode(space, comments or None)
-            stack.append((indent, space, True))
-
-        comments = []
-        comment_start = None
+            yield ENTER, key, comments or None
+            stack.append((indent, True))
+        if comments:
+            comments = []
+            comment_start = None
 
     if stack[-1][-1]:
         raise error("unexpected end of file")
 
     check_no_comments()
-    return items
+    for _ in range(len(stack) - 1):
+        yield _exit_event
+
+
+def writefile(d, name, encoding="utf8"):
+    with open(name, "w", encoding=encoding) as f:
+        write(d, f)
+
+
+def write(d, f, indent=""):
+    f.writelines(iterdump(d, indent))
 
 
 def dump(d, indent=""):
-    def quotescape(s, allow_colon):
-        if not s \
-                or "\n" in s \
-                or ": " in s and not allow_colon \
-                or s[0] in " #\"'|" \
-                or s[-1] in " \t\n":
-            q = '"' if "'" in s else "'"
-            return f"{q}{s.replace(q, 2 * q)}{q}"
-        return s
-
-    def dumpval(s):
-        trans = {True: "true", False: "false", None: "null", "": '""'}
-        if s in trans:
-            return trans[s]
-        return quotescape(s, True)
-
-    res = ""
-    for key, node in d.items():
-        if node.comments is not None:
-            res += "".join(f"{indent}{comment}\n" for comment in node.comments)
-        if isinstance(node.value, dict):
-            res += f"{indent}{key}:\n{dump(node.value, indent + '    ')}"
+    return "".join(iterdump(d, indent))
+
+
+def _quotescape(s, allow_colon):
+    if not s \
+            or "\n" in s \
+            or ": " in s and not allow_colon \
+            or s[0] in " #\"'|" \
+            or s[-1] in " \t\n":
+        q = '"' if "'" in s else "'"
+        return f"{q}{s.replace(q, 2 * q)}{q}"
+    return s
+
+
+constant_names = {True: "true", False: "false", None: "null", "": '""'}
+
+
+def _dumpval(s):
+    if s in constant_names:
+        return constant_names[s]
+    return _quotescape(s, True)
+
+
+def iterdump(d, indent=""):
+    """
+    Yield the text of the JAML document in chunks (lines and comments).
+
+    Nodes are visited with an explicit stack, so each chunk is produced in
+    constant time, regardless of depth.
+    """
+    stack = [(iter(d.items()), indent)]
+    while stack:
+        items, indent = stack[-1]
+        for key, node in items:
+            if node.comments is not None:
+                yield "".join(f"{indent}{comment}\n"
+                              for comment in node.comments)
+            if isinstance(node.value, dict):
+                yield f"{indent}{key}:\n"
+                stack.append((iter(node.value.items()), indent + "    "))
+                break
+            yield f"{indent}{_quotescape(key, False)}: " \
+                  f"{_dumpval(node.value)}\n"
         else:
-            res += f"{indent}{quotescape(key, False)}: {dumpval(node.value)}\n"
-    return res
+            stack.pop()
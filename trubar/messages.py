@@ -1,7 +1,13 @@
 import os
 import sys
 import re
-from typing import NamedTuple, Union, Optional, Dict, List
+import json
+import pickle
+import sqlite3
+import shutil
+import hashlib
+from typing import \
+    NamedTuple, Union, Optional, Dict, List, Tuple, Iterable, Callable, Type
 
 import yaml
 
@@ -18,25 +24,146 @@ MsgDict = Dict[str, MsgNode]
 PureDict = Dict[str, Union[bool, None, str, "PureDict"]]
 
 
-def load(filename: str) -> MsgDict:
+# Version of the format of cache files; increase when MsgNode changes
+CACHE_VERSION = 1
+
+
+def load(filename: str, pattern: str = "") -> MsgDict:
+    """
+    Load messages from the file.
+
+    The format is chosen by the file's extension (see `BACKENDS`); files
+    with unknown extensions are read as JAML. If `pattern` is given, only
+    top-level sections (files) whose keys include it are returned. With
+    `cache-messages`, the cache is used if valid, and for JAML files, an index
+    of sections is kept, so only matching sections are read. Databases
+    (SQLite) are not cached, and only matching sections are read from them.
+    """
     if not os.path.exists(filename):
         print(f"File not found: {filename}")
         sys.exit(2)
-    is_yaml = os.path.splitext(filename)[1] == ".yaml"
+    backend = get_backend(filename, ".jaml")
+    # Databases are queried directly, without caches
+    caching = config.cache_messages and backend.read_matching is None
+    if caching:
+        sections = pattern and backend.read_sections is not None \
+            and _load_cache(filename, ".index")
+        if sections:
+            try:
+                return backend.read_sections(
+                    filename,
+                    [(start, end) for key, start, end in sections
+                     if pattern in key])
+            except backend.errors + (UnicodeDecodeError, ):
+                pass  # file changed while reading; parse it all
+        messages = _load_cache(filename)
+        if messages is not None:
+            return _select(messages, pattern)
+    sections = None
     try:
-        if is_yaml:
-            with open(filename, encoding=config.encoding) as f:
-                messages = yaml.load(f, Loader=yaml.Loader)
+        if backend.read_matching is not None:
+            messages = backend.read_matching(filename, pattern)
+        elif caching and backend.read_indexed is not None:
+            messages, sections = backend.read_indexed(filename)
         else:
-            messages = jaml.readfile(filename, encoding=config.encoding)
-    except (jaml.JamlError, yaml.YAMLError) as exc:
+            messages = backend.read(filename)
+    except backend.errors as exc:
         print(f"Error in {filename}:\n{exc}")
         sys.exit(3)
-    if is_yaml:
-        messages = dict_to_msg_nodes(messages)
     if not check_sanity(messages, filename):
         sys.exit(4)
-    return messages
+    if caching:
+        _save_cache(filename, messages, sections)
+    return _select(messages, pattern)
+
+
+def _select(messages: MsgDict, pattern: str) -> MsgDict:
+    if not pattern:
+        return messages
+    return {key: node for key, node in messages.items() if pattern in key}
+
+
+def cache_name(filename: str, suffix: str = ".cache") -> str:
+    """
+    Return the name of the cache (or, with suffix `.index`, the index) for
+    the given message file: a hidden file next to it or, if `cache-dir` is
+    set, a file in that directory, whose name includes a hash of the message
+    file's absolute path.
+    """
+    dirname, basename = os.path.split(filename)
+    if not config.cache_dir:
+        return os.path.join(dirname, f".{basename}{suffix}")
+    path_hash = hashlib.sha256(
+        os.path.abspath(filename).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(config.base_dir or "", config.cache_dir,
+                        f"{basename}-{path_hash}{suffix}")
+
+
+def _cache_key(filename: str, data: Optional[bytes] = None) -> Dict:
+    stat = os.stat(filename)
+    key = {"version": CACHE_VERSION, "encoding": config.encoding,
+           "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if data is not None:
+        key["hash"] = hashlib.sha256(data).hexdigest()
+    return key
+
+
+def _load_cache(filename: str, suffix: str = ".cache"):
+    # Return data from the cache (or index) if the file has the same size and
+    # modification time as when the cache was written, or the same content;
+    # return None if there is no valid cache. If only the time changed, the
+    # cache is rewritten with the new time, so the content is not hashed again
+    fname = cache_name(filename, suffix)
+    try:
+        with open(fname, "rb") as f:
+            cached_key = pickle.load(f)
+            key = _cache_key(filename)
+            if any(cached_key.get(name) != key[name]
+                   for name in ("version", "encoding", "size")):
+                return None
+            touched = cached_key["mtime"] != key["mtime"]
+            if touched:
+                with open(filename, "rb") as msg_file:
+                    key = _cache_key(filename, msg_file.read())
+                if cached_key["hash"] != key["hash"]:
+                    return None
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError,
+            AttributeError, TypeError):
+        return None
+    if touched:
+        try:
+            _write_cache(fname, key, data)
+        except OSError:
+            pass
+    return data
+
+
+def _write_cache(fname: str, key: Dict, data) -> None:
+    # Write the key and data into a temporary file, which replaces the cache
+    os.makedirs(os.path.dirname(fname) or ".", exist_ok=True)
+    with open(fname + ".tmp", "wb") as f:
+        pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fname + ".tmp", fname)
+
+
+def _save_cache(filename: str, messages: MsgDict,
+                sections: Optional[List[Tuple[str, int, int]]] = None) -> None:
+    # Write the cache and, if given, the index of sections; failures (e.g. in
+    # read-only directories) are ignored
+    try:
+        with open(filename, "rb") as f:
+            key = _cache_key(filename, f.read())
+        for suffix, data in ((".cache", messages), (".index", sections)):
+            fname = cache_name(filename, suffix)
+            if data is None:
+                if os.path.exists(fname):
+                    os.remove(fname)
+                continue
+            _write_cache(fname, key, data)
+    except OSError:
+        pass
 
 
 def check_sanity(message_dict: MsgDict, filename: Optional[str] = None):
@@ -82,12 +209,445 @@ def dict_from_msg_nodes(messages: MsgDict) -> PureDict:
             for key, node in messages.items()}
 
 
+class CompactMsgDict(dict):
+    """
+    Read-only dictionary of messages that stores values without `MsgNode`,
+    and comments in a separate dictionary, if there are any.
+
+    Items are returned as `MsgNode`s, which are created when accessed, so
+    the class can be used instead of `MsgDict` where messages are only read.
+    Methods `values` and `items` return iterators instead of views.
+    Use `compact` to create it.
+    """
+    __slots__ = ("comments", )
+
+    def __init__(self, comments: Optional[Dict[str, List[str]]] = None):
+        super().__init__()
+        self.comments = comments
+
+    def __getitem__(self, key: str) -> MsgNode:
+        return MsgNode(dict.__getitem__(self, key),
+                       None if self.comments is None
+                       else self.comments.get(key))
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    # Overriding __iter__ also stops `dict(...)` from copying raw values
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def values(self):
+        return (self[key] for key in self)
+
+    def items(self):
+        return ((key, self[key]) for key in self)
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return len(self) == len(other) \
+            and all(key in other and self[key] == other[key] for key in self)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def _read_only(self, *_, **_1):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = pop = popitem = setdefault = update = clear \
+        = _read_only
+
+
+def compact(messages: MsgDict,
+            pool: Optional[Dict[str, str]] = None) -> CompactMsgDict:
+    """
+    Return a read-only copy of messages that takes less memory.
+
+    Nodes are stored in `CompactMsgDict`, and equal keys and values are
+    stored as a single string. `pool` maps strings to their shared copies;
+    it can be shared between catalogs, e.g. for different languages, which
+    have the same keys.
+    """
+    if pool is None:
+        pool = {}
+    intern = pool.setdefault
+    result = CompactMsgDict()
+    comments = None
+    for key, node in messages.items():
+        key = intern(key, key)
+        value = node.value
+        if isinstance(value, dict):
+            value = compact(value, pool)
+        elif isinstance(value, str):
+            value = intern(value, value)
+        dict.__setitem__(result, key, value)
+        if node.comments is not None:
+            if comments is None:
+                comments = {}
+            comments[key] = node.comments
+    result.comments = comments
+    return result
+
+
 def dump(messages: MsgDict, filename: str) -> None:
-    if os.path.splitext(filename)[1] == ".jaml":
-        with open(filename, "w", encoding=config.encoding) as f:
-            f.write(jaml.dump(messages))
+    """
+    Write messages into the file, unless it already has the same content.
+
+    The format is chosen by the file's extension (see `BACKENDS`); files
+    with unknown extensions are written as YAML. JAML and JSON files are
+    serialized and compared one top-level section (file) at a time, so
+    nothing is written and the file's modification time is kept if no
+    section changed. Otherwise, the file is written into a temporary
+    file, which then replaces it. Databases (SQLite) are updated in a
+    transaction, in which only changed sections are replaced.
+    """
+    backend = get_backend(filename, ".yaml")
+    if backend.save is not None:
+        backend.save(messages, filename)
+    else:
+        _replace_if_changed(filename, backend.write(messages))
+
+
+def _replace_if_changed(filename: str, chunks: Iterable[bytes]) -> bool:
+    # Compare chunks with the file's content; chunks are kept until the first
+    # difference, and then written, with all remaining, into a temporary file,
+    # which replaces the file (or the target of a symbolic link) and gets its
+    # permissions. Return `True` if the file was written
+    filename = os.path.realpath(filename)
+    tmpname = filename + ".tmp"
+    try:
+        old = open(filename, "rb")  # pylint: disable=consider-using-with
+    except OSError:
+        old = None
+    try:
+        same = []
+        new = None
+        for chunk in chunks:
+            if new is None:
+                if old is not None and old.read(len(chunk)) == chunk:
+                    same.append(chunk)
+                    continue
+                new = open(tmpname, "wb")  # pylint: disable=consider-using-with
+                new.writelines(same)
+            new.write(chunk)
+        if new is None:
+            if old is not None and not old.read(1):
+                return False
+            new = open(tmpname, "wb")  # pylint: disable=consider-using-with
+            new.writelines(same)
+    finally:
+        if old is not None:
+            old.close()
+        if new is not None:
+            new.close()
+    if old is not None:
+        shutil.copymode(filename, tmpname)
+    os.replace(tmpname, filename)
+    return True
+
+
+class Backend(NamedTuple):
+    """
+    Functions for reading and writing message files in some format.
+
+    `read` returns messages from the file, and `write` returns the content
+    of the file as chunks of bytes, preferably one for each top-level
+    section, which are compared with the existing file. Exceptions
+    `errors` are raised for invalid files. If the format supports reading
+    of separate sections, `read_indexed` also returns byte offsets of
+    sections (see `jaml.readfile_indexed`), and `read_sections` reads
+    sections with the given offsets.
+
+    Backends for databases define `read_matching`, which reads only sections
+    whose keys include the given pattern, and `save`, which writes messages
+    into the file instead of `write`.
+    """
+    read: Callable[[str], MsgDict]
+    write: Optional[Callable[[MsgDict], Iterable[bytes]]]
+    errors: Tuple[Type[Exception], ...]
+    read_indexed: Optional[Callable[
+        [str], Tuple[MsgDict, Optional[List[Tuple[str, int, int]]]]]] = None
+    read_sections: Optional[Callable[
+        [str, List[Tuple[int, int]]], MsgDict]] = None
+    read_matching: Optional[Callable[[str, str], MsgDict]] = None
+    save: Optional[Callable[[MsgDict, str], None]] = None
+
+
+def get_backend(filename: str, default: str) -> Backend:
+    """
+    Return the backend for the file's extension or, for unknown extensions,
+    the backend for extension `default`.
+    """
+    extension = os.path.splitext(filename)[1]
+    return BACKENDS.get(extension) or BACKENDS[default]
+
+
+def register_backend(extension: str, backend: Backend) -> None:
+    """
+    Register (or replace) the backend for files with the given extension,
+    e.g. `.jaml`.
+    """
+    BACKENDS[extension] = backend
+
+
+def _read_jaml(filename: str) -> MsgDict:
+    return jaml.readfile(filename, encoding=config.encoding)
+
+
+def _read_jaml_indexed(filename: str):
+    return jaml.readfile_indexed(filename, encoding=config.encoding)
+
+
+def _read_jaml_sections(filename: str,
+                        sections: List[Tuple[int, int]]) -> MsgDict:
+    return jaml.readsections(filename, sections, encoding=config.encoding)
+
+
+def _write_jaml(messages: MsgDict) -> Iterable[bytes]:
+    encoding = config.encoding
+    if "\n".encode(encoding) != b"\n":  # e.g. UTF-16 needs a single BOM
+        return [jaml.dump(messages).encode(encoding)]
+    return (jaml.dump({key: node}).replace("\n", os.linesep).encode(encoding)
+            for key, node in messages.items())
+
+
+# Use libyaml, if available
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CDumper", yaml.Dumper)
+
+
+def _read_yaml(filename: str) -> MsgDict:
+    with open(filename, encoding=config.encoding) as f:
+        return dict_to_msg_nodes(yaml.load(f, Loader=_YamlLoader))
+
+
+def _write_yaml(messages: MsgDict) -> Iterable[bytes]:
+    return [yaml.dump(dict_from_msg_nodes(messages), Dumper=_YamlDumper,
+                      indent=4, sort_keys=False,
+                      encoding="utf-8", allow_unicode=True)]
+
+
+# In JSON files, nodes with comments are lists [value, comments]; values of
+# nodes are never lists, so other nodes are stored as values
+def _read_json(filename: str) -> MsgDict:
+    def to_nodes(space, path):
+        if not isinstance(space, dict):
+            raise ValueError(f"{path or 'file'}: object expected")
+        messages = {}
+        for key, value in space.items():
+            npath = f"{path}/{key}" if path else key
+            comments = None
+            if isinstance(value, list):
+                if len(value) != 2 or not isinstance(value[1], list):
+                    raise ValueError(f"{npath}: a list must contain a value "
+                                     "and a list of comments")
+                value, comments = value
+            if isinstance(value, dict):
+                value = to_nodes(value, npath)
+            elif not (value is None or isinstance(value, (str, bool))):
+                raise ValueError(f"{npath}: invalid value")
+            messages[key] = MsgNode(value, comments)
+        return messages
+
+    with open(filename, encoding="utf-8") as f:
+        return to_nodes(json.load(f), "")
+
+
+def _to_json(node: MsgNode):
+    value = node.value
+    if isinstance(value, dict):
+        value = {key: _to_json(subnode) for key, subnode in value.items()}
+    return value if node.comments is None else [value, node.comments]
+
+
+def _write_json(messages: MsgDict) -> Iterable[bytes]:
+    # One line for each top-level section
+    yield b"{"
+    sep = "\n"
+    for key, node in messages.items():
+        yield (sep + json.dumps(key, ensure_ascii=False) + ": "
+               + json.dumps(_to_json(node), ensure_ascii=False)
+               ).encode("utf-8")
+        sep = ",\n"
+    yield b"\n}\n"
+
+
+# In SQLite databases, table `sections` has a row for each top-level key,
+# with its position and a digest of its content. Table `nodes` has a row for
+# each node (including the top-level one), in preorder; nodes refer to their
+# sections and their parents' `seq`, so key paths are looked up by index.
+# Values are strings, NULL or integers for booleans; namespaces have NULL
+# values and `namespace` set to 1. Comments are stored as JSON lists.
+SQLITE_VERSION = 1
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    digest TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS nodes (
+    section INTEGER NOT NULL REFERENCES sections(id),
+    seq INTEGER NOT NULL,
+    parent INTEGER,
+    key TEXT NOT NULL,
+    value,
+    namespace INTEGER NOT NULL,
+    comments TEXT,
+    PRIMARY KEY (section, seq));
+CREATE UNIQUE INDEX IF NOT EXISTS nodes_path ON nodes(section, parent, key);
+"""
+
+# Digests of sections, as they were read from databases; sections that did
+# not change since then are not written, so concurrent changes are kept
+_sqlite_read: Dict[str, Dict[str, str]] = {}
+
+
+def forget_sqlite_reads(filename: Optional[str] = None) -> None:
+    """
+    Forget which sections of the given SQLite file (or of all files) were
+    read. The next `dump` into the file then treats messages as its entire
+    content: it writes all sections that differ from those in the file,
+    removes other sections and keeps the order of messages.
+    """
+    if filename is None:
+        _sqlite_read.clear()
     else:
-        messages = dict_from_msg_nodes(messages)
-        with open(filename, "wb") as f:
-            f.write(yaml.dump(messages, indent=4, sort_keys=False,
-                              encoding="utf-8", allow_unicode=True))
+        _sqlite_read.pop(os.path.abspath(filename), None)
+
+
+def _section_digest(node: MsgNode) -> str:
+    return hashlib.sha1(json.dumps(_to_json(node), ensure_ascii=False)
+                        .encode("utf-8")).hexdigest()
+
+
+def _read_sqlite(filename: str, pattern: str = "") -> MsgDict:
+    con = sqlite3.connect(filename)
+    try:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version != SQLITE_VERSION:
+            raise sqlite3.DatabaseError(
+                f"unsupported version of database: {version}")
+        messages = {}
+        digests = {}
+        namespaces = {}
+        for section, digest, seq, parent, key, value, namespace, comments \
+                in con.execute(
+                    "SELECT s.key, s.digest, seq, parent, n.key, value, "
+                    "namespace, comments "
+                    "FROM sections s JOIN nodes n ON n.section = s.id "
+                    "WHERE instr(s.key, ?) ORDER BY position, s.id, seq",
+                    (pattern, )):
+            if parent is None:
+                digests[section] = digest
+                space = messages
+            else:
+                space = namespaces[parent]
+            if namespace:
+                value = namespaces[seq] = {}
+            elif isinstance(value, int):
+                value = bool(value)
+            space[key] = MsgNode(
+                value, None if comments is None else json.loads(comments))
+    finally:
+        con.close()
+    _sqlite_read[os.path.abspath(filename)] = digests
+    return messages
+
+
+def _save_sqlite(messages: MsgDict, filename: str) -> None:
+    con = sqlite3.connect(filename, isolation_level=None)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SQLITE_VERSION):
+            raise sqlite3.DatabaseError(
+                f"unsupported version of database: {version}")
+        for statement in _SQLITE_SCHEMA.split(";"):
+            con.execute(statement)
+        con.execute(f"PRAGMA user_version = {SQLITE_VERSION}")
+        stored = {key: (section_id, position, digest)
+                  for section_id, key, position, digest in con.execute(
+                      "SELECT id, key, position, digest FROM sections")}
+        read = _sqlite_read.get(os.path.abspath(filename))
+        next_position = max((position for _, position, _ in stored.values()),
+                            default=-1) + 1
+        # Keep the order of messages if they include all sections
+        reorder = read is None or read.keys() >= stored.keys()
+
+        digests = {}
+        for index, (key, node) in enumerate(messages.items()):
+            digests[key] = digest = _section_digest(node)
+            section_id, position, old_digest = stored.get(key, (None, ) * 3)
+            if reorder:
+                position = index
+            elif section_id is None:
+                position = next_position
+                next_position += 1
+            if section_id is not None and (
+                    digest == old_digest or read and read.get(key) == digest):
+                if position != stored[key][1]:
+                    con.execute("UPDATE sections SET position = ? "
+                                "WHERE id = ?", (position, section_id))
+                continue
+            if section_id is None:
+                section_id = con.execute(
+                    "INSERT INTO sections (key, position, digest) "
+                    "VALUES (?, ?, ?)", (key, position, digest)).lastrowid
+            else:
+                con.execute("DELETE FROM nodes WHERE section = ?",
+                            (section_id, ))
+                con.execute("UPDATE sections SET position = ?, digest = ? "
+                            "WHERE id = ?", (position, digest, section_id))
+            con.executemany(
+                "INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                _sqlite_rows(section_id, key, node))
+
+        for key, (section_id, _, _) in stored.items():
+            if key not in messages and (read is None or key in read):
+                con.execute("DELETE FROM nodes WHERE section = ?",
+                            (section_id, ))
+                con.execute("DELETE FROM sections WHERE id = ?",
+                            (section_id, ))
+        con.execute("COMMIT")
+    finally:
+        con.close()  # rolls back, unless committed
+    _sqlite_read[os.path.abspath(filename)] = digests
+
+
+def _sqlite_rows(section_id: int, key: str, node: MsgNode):
+    # Rows for the node and its subnodes, in preorder
+    rows = []
+
+    def add(key, node, parent):
+        seq = len(rows)
+        value = node.value
+        namespace = isinstance(value, dict)
+        rows.append((section_id, seq, parent, key,
+                     None if namespace else value, int(namespace),
+                     None if node.comments is None
+                     else json.dumps(node.comments, ensure_ascii=False)))
+        if namespace:
+            for subkey, subnode in value.items():
+                add(subkey, subnode, seq)
+
+    add(key, node, None)
+    return rows
+
+
+BACKENDS: Dict[str, Backend] = {
+    ".jaml": Backend(_read_jaml, _write_jaml, (jaml.JamlError, ),
+                     _read_jaml_indexed, _read_jaml_sections),
+    ".yaml": Backend(_read_yaml, _write_yaml, (yaml.YAMLError, )),
+    ".yml": Backend(_read_yaml, _write_yaml, (yaml.YAMLError, )),
+    ".json": Backend(_read_json, _write_json, (ValueError, )),
+    ".sqlite": Backend(_read_sqlite, None, (sqlite3.DatabaseError, ),
+                       read_matching=_read_sqlite, save=_save_sqlite),
+}
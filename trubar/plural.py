@@ -0,0 +1,222 @@
+"""
+Functions for plural forms in translated messages, like `pl` and `plsi`
+described in the documentation on localization.
+
+Rules are given as gettext-style expressions, e.g. `n != 1`, and compiled into
+Python functions once. Strings with forms, e.g. `"leaf|leaves"`, are split
+(or, for regular words, completed) at the first call and memoized.
+
+Like `trubar.runtime`, the module does not depend on the rest of Trubar, so a
+copy of it can be shipped with translated sources through `static-files` or
+the language's `static` directory.
+"""
+import re
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+# Rules for some languages; other can be passed to `plural_function`
+RULES = {
+    "en": "n != 1",
+    "de": "n != 1",
+    "nl": "n != 1",
+    "es": "n != 1",
+    "it": "n != 1",
+    "fr": "n > 1",
+    "ja": "0",
+    "zh": "0",
+    "cs": "(n == 1) ? 0 : (n >= 2 && n <= 4) ? 1 : 2",
+    "hr": "n % 10 == 1 && n % 100 != 11 ? 0 : "
+          "n % 10 >= 2 && n % 10 <= 4 && (n % 100 < 10 || n % 100 >= 20) "
+          "? 1 : 2",
+    "pl": "n == 1 ? 0 : "
+          "n % 10 >= 2 && n % 10 <= 4 && (n % 100 < 10 || n % 100 >= 20) "
+          "? 1 : 2",
+    "ru": "n % 10 == 1 && n % 100 != 11 ? 0 : "
+          "n % 10 >= 2 && n % 10 <= 4 && (n % 100 < 10 || n % 100 >= 20) "
+          "? 1 : 2",
+    "sl": "n % 100 == 1 ? 0 : n % 100 == 2 ? 1 : "
+          "n % 100 == 3 || n % 100 == 4 ? 2 : 3",
+}
+RULES["si"] = RULES["sl"]  # code used for Slovenian in Trubar's examples
+
+
+# Forms for numbers below this are precomputed for each string
+_PRECOMPUTED = 100
+
+_TOKEN = re.compile(r"\s*(?:(\d+)|(n)|(\|\||&&|[=!<>]=|[-+*/%<>!?:()]))")
+
+_BINARY = [("||", " or "), ("&&", " and "), ("==", "=="), ("!=", "!="),
+           ("<", "<"), ("<=", "<="), (">", ">"), (">=", ">="),
+           ("+", "+"), ("-", "-"), ("*", "*"), ("/", "//"), ("%", "%")]
+# Operators from lowest to highest precedence, with their Python equivalents
+_PRECEDENCE = [dict(_BINARY[:1]), dict(_BINARY[1:2]), dict(_BINARY[2:4]),
+               dict(_BINARY[4:8]), dict(_BINARY[8:10]), dict(_BINARY[10:])]
+
+
+class _RuleParser:
+    # Translates a C expression into a Python expression; parentheses are
+    # put around every operation, so Python's precedence and chaining of
+    # comparisons do not matter
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens = []
+        pos = 0
+        expr = expr.rstrip()
+        while pos < len(expr):
+            match = _TOKEN.match(expr, pos)
+            if match is None:
+                raise ValueError(f"invalid plural rule: '{self.expr}'")
+            self.tokens.append(match.group(match.lastindex))
+            pos = match.end()
+        self.pos = 0
+
+    def parse(self) -> str:
+        code = self.ternary()
+        if self.pos != len(self.tokens):
+            self.error()
+        return code
+
+    def error(self):
+        raise ValueError(f"invalid plural rule: '{self.expr}'")
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, token: str) -> None:
+        if self.peek() != token:
+            self.error()
+        self.pos += 1
+
+    def ternary(self) -> str:
+        cond = self.binary(0)
+        if self.peek() != "?":
+            return cond
+        self.take("?")
+        then = self.ternary()
+        self.take(":")
+        other = self.ternary()
+        return f"({then} if {cond} else {other})"
+
+    def binary(self, level: int) -> str:
+        if level == len(_PRECEDENCE):
+            return self.unary()
+        operators = _PRECEDENCE[level]
+        code = self.binary(level + 1)
+        while self.peek() in operators:
+            op = operators[self.tokens[self.pos]]
+            self.pos += 1
+            code = f"({code}{op}{self.binary(level + 1)})"
+        return code
+
+    def unary(self) -> str:
+        token = self.peek()
+        if token in ("!", "-"):
+            self.pos += 1
+            return f"({'not ' if token == '!' else '-'}{self.unary()})"
+        if token == "(":
+            self.take("(")
+            code = self.ternary()
+            self.take(")")
+            return code
+        if token is None or not (token == "n" or token.isdigit()):
+            self.error()
+        self.pos += 1
+        return token
+
+
+@lru_cache(maxsize=None)
+def compile_rule(rule: str) -> Callable[[int], int]:
+    """
+    Compile a gettext-style plural rule into a function.
+
+    The rule is a C expression with variable `n`, like `n != 1`; it can also
+    be given as the entire value of gettext's `Plural-Forms` header, e.g.
+    `nplurals=2; plural=n != 1;`. Each rule is compiled only once.
+
+    Args:
+        rule (str): plural rule
+
+    Returns:
+        (function): function that returns the index of the form for `n`
+    """
+    match = re.search(r"plural\s*=([^;]*)", rule)
+    if match:
+        rule = match.group(1)
+    code = _RuleParser(rule).parse()
+    return eval(f"lambda n: int({code})")  # pylint: disable=eval-used
+
+
+def english_forms(word: str) -> Tuple[str, str]:
+    """
+    Return singular and plural of a regular English noun.
+
+    Nouns that end with a consonant and "y" get "ies", others get "s";
+    plurals of words in upper case are also in upper case.
+    """
+    if word[-1] in "yY" and word[-2:-1] not in "aeiouAEIOU":
+        plural = word[:-1] + "ies"
+    else:
+        plural = word + "s"
+    if word.isupper():
+        plural = plural.upper()
+    return word, plural
+
+
+def slovenian_forms(word: str) -> Tuple[str, str, str, str]:
+    """
+    Return the four forms (for 1, 2, 3 or 4, and 5 or more) of nominative of a
+    regular Slovenian noun.
+    """
+    if word[-1] == "a":
+        return tuple(word[:-1] + suffix for suffix in ("a", "i", "e", ""))
+    return tuple(word + suffix for suffix in ("", "a", "i", "ov"))
+
+
+def plural_function(
+        rule: str,
+        regular: Optional[Callable[[str], Tuple[str, ...]]] = None
+) -> Callable[[int, str], str]:
+    """
+    Return a function `(n, forms) -> str` for the given plural rule.
+
+    `forms` are separated by `|`. If there are fewer forms than the rule
+    distinguishes, the last one is used for the remaining numbers. A single
+    form is passed to function `regular`, if given, which returns all forms.
+    Negative numbers get the same form as their absolute values, and numbers
+    that are not integers are passed to the rule as they are.
+    Results for numbers below 100 are precomputed for each string of forms.
+
+    Args:
+        rule (str): rule (see `compile_rule`) or language code from `RULES`
+        regular (function, optional): function that returns forms of a word
+
+    Returns:
+        (function): function that returns the form for the number
+    """
+    index = compile_rule(RULES.get(rule, rule))
+    words = {}
+
+    @lru_cache(maxsize=None)
+    def split(forms: str) -> Tuple[str, ...]:
+        if "|" in forms or regular is None:
+            return tuple(forms.split("|"))
+        return tuple(regular(forms))
+
+    def choose(n: int, forms: str) -> str:
+        parts = split(forms)
+        return parts[min(index(abs(n)), len(parts) - 1)]
+
+    def plural(n: int, forms: str) -> str:
+        if isinstance(n, int) and 0 <= n < _PRECOMPUTED:
+            try:
+                return words[forms][n]
+            except KeyError:
+                words[forms] = [choose(i, forms) for i in range(_PRECOMPUTED)]
+                return words[forms][n]
+        return choose(n, forms)
+
+    return plural
+
+
+pl = plural_function("en", english_forms)
+plsi = plural_function("sl", slovenian_forms)
@@ -0,0 +1,369 @@
+"""
+A reference implementation of the `_tr` object used by sources that were
+translated in multilingual mode.
+
+Trubar itself does not need this module. Applications can import it, or, since
+it does not depend on the rest of Trubar, ship a copy of it with the translated
+sources (for instance through `static-files`).
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import marshal
+import importlib.util
+from collections import Counter
+from typing import Dict, List, Optional, TextIO, Tuple
+
+# If set, translators are instrumented, and a report is written to the file
+# with the given name (or to stderr for "-") at exit
+STATS_VARIABLE = "TRUBAR_STATS"
+# If set, translators are instrumented, and lookup counts for key paths are
+# added to the file with the given name at exit (see `translate --table-profile`)
+PROFILE_VARIABLE = "TRUBAR_TABLE_PROFILE"
+
+
+class _list(list):
+    # Accept extra argument to allow for the original string
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            item = item[0]
+        return super().__getitem__(item)
+
+
+class Translator:
+    """
+    Message table for the chosen language.
+
+    If environment variable `TRUBAR_STATS` or `TRUBAR_TABLE_PROFILE` is set,
+    the constructor returns an `InstrumentedTranslator`.
+
+    Args:
+        path (str): directory with message tables (`i18n` in translated sources)
+        language (str): international name of the language
+    """
+    def __new__(cls, *_args, **_kwargs):
+        klass = InstrumentedTranslator \
+            if cls is Translator and (os.environ.get(STATS_VARIABLE)
+                                      or os.environ.get(PROFILE_VARIABLE)) \
+            else cls
+        return super().__new__(klass)
+
+    def __init__(self, path: str, language: str):
+        self.path = path
+        self.language = language
+        self._codes = {}
+        self._segments: Dict[str, "Translator"] = {}
+        # Index for `lookup` and key paths, created when needed
+        self._index: Optional[Dict[str, List[int]]] = None
+        self._paths: Optional[Dict[int, Tuple[str, ...]]] = None
+        # Modification times of table files, for `reload`
+        self._stamp = self._table_stamp()
+        # `t` is a plain list for fast lookups, `t[idx]`; `m` has the same
+        # content, but also accepts lookups with originals, `m[idx, original]`
+        self.t = self.load_table()
+        self.m = _list(self.t)
+
+    def load_table(self) -> List[str]:
+        """
+        Load the table from a compiled module (.pyc), if it exists and was
+        compiled by this version of Python, or from .json otherwise, and
+        apply changes written by `update-table --changes-only`, if any.
+        """
+        fname = os.path.join(self.path, self.language)
+        messages = None
+        try:
+            with open(f"{fname}.pyc", "rb") as f:
+                data = f.read()
+        except OSError:
+            pass
+        else:
+            if data[:4] == importlib.util.MAGIC_NUMBER:
+                namespace = {}
+                exec(marshal.loads(data[16:]), namespace)  # pylint: disable=exec-used
+                self._codes = {idx: code
+                               for idx, code in enumerate(namespace["codes"])
+                               if code is not None}
+                messages = list(namespace["messages"])
+        if messages is None:
+            with open(f"{fname}.json", encoding="utf-8") as f:
+                messages = json.load(f)
+        try:
+            with open(f"{fname}.changes.json", encoding="utf-8") as f:
+                changes = json.load(f)["entries"]
+        except OSError:
+            pass
+        else:
+            for idx, entry in changes.items():
+                messages[int(idx)] = entry
+                self._codes.pop(int(idx), None)
+        return messages
+
+    def _table_stamp(self) -> Tuple[Optional[int], ...]:
+        fname = os.path.join(self.path, self.language)
+        stamp = []
+        for ext in (".pyc", ".json", ".changes.json"):
+            try:
+                stamp.append(os.stat(fname + ext).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def reload(self) -> bool:
+        """
+        Reload the table (and loaded segments) if their files changed.
+
+        Changed entries are replaced in place, so strings that are looked up
+        afterwards are translated with new entries.
+
+        Returns:
+            (bool): `True` if any entries changed
+        """
+        changed = False
+        stamp = self._table_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            table = self.load_table()
+            if len(table) != len(self.t):
+                self.t[:] = self.m[:] = table
+                self._codes.clear()
+                changed = True
+            else:
+                for idx, (old, new) in enumerate(zip(self.t, table)):
+                    if old != new:
+                        self.t[idx] = self.m[idx] = new
+                        self._codes.pop(idx, None)
+                        changed = True
+            if changed:
+                self._index = None
+        for segment in self._segments.values():
+            changed |= segment.reload()
+        return changed
+
+    e = eval
+
+    def c(self, idx, *_):
+        code = self._codes.get(idx)
+        if code is None:
+            code = self._codes[idx] = compile(self.m[idx], '<string>', 'eval')
+        return code
+
+    def f(self, idx, args):  # pylint: disable=invalid-name
+        # `t`, not `m`, whose Python-level `__getitem__` is slow
+        return self.t[idx].format(*args)
+
+    def lookup(self, original: str, context: Optional[str] = None) -> str:
+        """
+        Return the translation of a string that is not a literal in sources,
+        or the original if there is none.
+
+        Only messages that are not f-strings in any language are considered.
+        If `context` is given, the message's key path, with parts separated
+        by slashes, must begin with it; for instance, context
+        `farm/animals.py` limits the lookup to messages from this module.
+        The index from originals to table indices is built at the first call.
+
+        Args:
+            original (str): the string in the original language
+            context (str, optional): the beginning of the key path
+
+        Returns:
+            (str): translation
+        """
+        if self._index is None:
+            self._index = self._build_index()
+        indices = self._index.get(original, ())
+        if context is not None:
+            if self._paths is None:
+                self._paths = self.key_paths()
+            indices = [idx for idx in indices
+                       if _in_context(self._paths[idx], context)]
+        return self.m[indices[0]] if indices else original
+
+    def _build_index(self) -> Dict[str, List[int]]:
+        # Map originals, as in the table of the original language, to indices
+        # of entries without f-strings
+        try:
+            with open(os.path.join(self.path, "mapping.json"),
+                      encoding="utf-8") as f:
+                languages, compressed = json.load(f)
+            with open(os.path.join(self.path, f"{languages[0]}.json"),
+                      encoding="utf-8") as f:
+                originals = json.load(f)
+        except OSError:
+            return {}
+        index = {}
+        for idx, (_, _, *extra) in enumerate(compressed, start=2):
+            if not (extra and extra[0]):
+                index.setdefault(originals[idx], []).append(idx)
+        return index
+
+    def key_paths(self) -> Dict[int, Tuple[str, ...]]:
+        """
+        Return paths of keys for table indices, read from `mapping.json`,
+        or an empty dictionary if the file does not exist.
+        """
+        try:
+            with open(os.path.join(self.path, "mapping.json"),
+                      encoding="utf-8") as f:
+                _, compressed = json.load(f)
+        except OSError:
+            return {}
+        paths = {}
+        prev = ()
+        for idx, (s, parts, *_) in enumerate(compressed, start=2):
+            paths[idx] = prev = prev[:s] + tuple(parts)
+        return paths
+
+    def segment(self, name: str) -> "Translator":
+        """
+        Return the translator for the table segment with the given name.
+
+        Segments are loaded when first requested, that is, when the first
+        module from the corresponding package is imported.
+        """
+        if name not in self._segments:
+            self._segments[name] = type(self)(os.path.join(self.path, name),
+                                              self.language)
+        return self._segments[name]
+
+
+class _CountingList(_list):
+    def __init__(self, items, counts: Counter):
+        super().__init__(items)
+        self.counts = counts
+
+    def __getitem__(self, item):
+        idx = item[0] if isinstance(item, tuple) else item
+        self.counts[idx] += 1
+        return list.__getitem__(self, idx)
+
+
+def _in_context(path: Tuple[str, ...], context: str) -> bool:
+    key = "/".join(path)
+    return key.startswith(context) \
+        and (len(key) == len(context) or key[len(context)] == "/")
+
+
+class InstrumentedTranslator(Translator):
+    """
+    Translator that counts lookups for each index, hits and misses of the
+    cache of compiled f-strings, and the time spent compiling and evaluating
+    them.
+
+    Instances are created by `Translator` when environment variable
+    `TRUBAR_STATS` is set; its value is the name of the file into which
+    the report is written at exit, or `-` for standard error (which is also
+    used when the class is instantiated directly). If `TRUBAR_TABLE_PROFILE`
+    is set, lookup counts are also added to the profile in the given file.
+
+    Strings that are bound at import (see `hoist-strings`) are counted once.
+    """
+    _instances: List["InstrumentedTranslator"] = []
+
+    def __init__(self, path: str, language: str):
+        self.lookups = Counter()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.compile_time = Counter()
+        self.eval_time = Counter()
+        self._code_idx = {}
+        super().__init__(path, language)
+        self.t = self.m = _CountingList(self.t, self.lookups)
+        if not InstrumentedTranslator._instances:
+            atexit.register(InstrumentedTranslator._at_exit)
+        InstrumentedTranslator._instances.append(self)
+
+    def e(self, code):
+        frame = sys._getframe(1)  # pylint: disable=protected-access
+        idx = self._code_idx.get(code)
+        start = time.perf_counter()
+        try:
+            return eval(code, frame.f_globals, frame.f_locals)  # pylint: disable=eval-used
+        finally:
+            self.eval_time[idx] += time.perf_counter() - start
+            del frame
+
+    def c(self, idx, *_):
+        if idx in self._codes:
+            self.hits[idx] += 1
+            self.lookups[idx] += 1
+            code = self._codes[idx]
+        else:
+            self.misses[idx] += 1
+            start = time.perf_counter()
+            code = super().c(idx)
+            self.compile_time[idx] += time.perf_counter() - start
+        self._code_idx[code] = idx
+        return code
+
+    def report(self, f: TextIO) -> None:
+        """
+        Write statistics, with most used messages first, to the file.
+        """
+        print(f"Message table: {os.path.join(self.path, self.language)}",
+              file=f)
+        print(f"Compilations: {sum(self.misses.values())}, "
+              f"cache hits: {sum(self.hits.values())}, "
+              f"compile time: {1000 * sum(self.compile_time.values()):.3f} ms, "
+              f"eval time: {1000 * sum(self.eval_time.values()):.3f} ms",
+              file=f)
+        if not self.lookups:
+            print(file=f)
+            return
+        paths = self.key_paths()
+        print(f"{'lookups':>10}{'compiles':>10}{'hits':>10}"
+              f"{'compile ms':>12}{'eval ms':>10}  key", file=f)
+        for idx, count in self.lookups.most_common():
+            key = "/".join(paths.get(idx, ())) or f"#{idx}"
+            print(f"{count:10}{self.misses[idx]:10}{self.hits[idx]:10}"
+                  f"{1000 * self.compile_time[idx]:12.3f}"
+                  f"{1000 * self.eval_time[idx]:10.3f}  {key}", file=f)
+        print(file=f)
+
+    def profile(self) -> Dict[Tuple[str, ...], int]:
+        """
+        Return lookup counts for key paths of messages that were used.
+        """
+        paths = self.key_paths()
+        return {paths[idx]: count for idx, count in self.lookups.items()
+                if idx in paths}
+
+    @classmethod
+    def _at_exit(cls) -> None:
+        stats = os.environ.get(STATS_VARIABLE)
+        profile = os.environ.get(PROFILE_VARIABLE)
+        if stats or not profile:
+            cls._write_report(stats)
+        if profile:
+            cls._write_profile(profile)
+
+    @classmethod
+    def _write_profile(cls, fname: str) -> None:
+        # Add counts to the existing profile, if any; the file contains a list
+        # of pairs (count, key path), with the most used messages first
+        counts = Counter()
+        try:
+            with open(fname, encoding="utf-8") as f:
+                for count, path in json.load(f):
+                    counts[tuple(path)] += count
+        except OSError:
+            pass
+        for translator in cls._instances:
+            counts.update(translator.profile())
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump([[count, path] for path, count in counts.most_common()],
+                      f)
+
+    @classmethod
+    def _write_report(cls, fname: Optional[str] = None) -> None:
+        if fname is None:
+            fname = os.environ.get(STATS_VARIABLE)
+        if not fname or fname == "-":
+            for translator in cls._instances:
+                translator.report(sys.stderr)
+            return
+        with open(fname, "w", encoding="utf-8") as f:
+            for translator in cls._instances:
+                translator.report(f)
@@ -0,0 +1,93 @@
+import os
+import json
+from typing import List, NamedTuple, Tuple, Dict, Sequence
+
+from trubar.utils import KeyMapping, TableWriter
+from trubar.config import config
+
+
+class TableSegment(NamedTuple):
+    message_tables: List[List[str]]
+    key_mapping: List[KeyMapping]
+    # Indices reserved for key paths from the table profile
+    reserved: Dict[Tuple[str, ...], int]
+    # Writer to which entries are flushed after each file
+    writer: TableWriter
+
+
+def tree_shim() -> str:
+    # Package's __init__.py that redirects imports to the tree for the chosen
+    # language and executes the tree's __init__.py in the package's namespace
+    codes = tuple(config.languages)
+    default = codes[0]
+    selector = config.tree_selector \
+        or f'_os.environ.get("TRUBAR_LANGUAGE", {default!r})'
+    return f"""\
+# Generated by Trubar: modules of this package are in i18n/<language code>
+import os as _os
+
+_language = {selector}
+if _language not in {codes!r}:
+    _language = {default!r}
+__path__ = [_os.path.join(_os.path.dirname(__file__), "i18n", _language)]
+__file__ = _os.path.join(__path__[0], "__init__.py")
+if _os.path.exists(__file__):
+    with open(__file__, encoding={config.encoding!r}) as _f:
+        exec(compile(_f.read(), __file__, "exec"))  # pylint: disable=exec-used
+    del _f
+del _os, _language
+"""
+
+
+def new_segment(destination: str,
+                 segment: str,
+                 hot: Dict[str, List[Tuple[str, ...]]]) -> TableSegment:
+    message_tables, key_mapping, reserved = new_tables(hot.get(segment, ()))
+    languages = [langdef.international_name
+                 for langdef in config.languages.values()]
+    writer = TableWriter(os.path.join(destination, "i18n", segment),
+                         languages, message_tables, key_mapping)
+    return TableSegment(message_tables, key_mapping, reserved, writer)
+
+
+def new_tables(
+        hot: Sequence[Tuple[str, ...]] = ()
+) -> Tuple[List[List[str]], List[KeyMapping], Dict[Tuple[str, ...], int]]:
+    # Reserve indices at the beginning of the table for messages in `hot`;
+    # placeholders for messages that are not found remain empty
+    message_tables = [[language.name, language.international_name]
+                      + [""] * len(hot)
+                      for language in config.languages.values()]
+    key_mapping = [KeyMapping(path) for path in hot]
+    reserved = {path: idx for idx, path in enumerate(hot, start=2)}
+    return message_tables, key_mapping, reserved
+
+
+def load_table_profile(
+        filename: str) -> Dict[str, List[Tuple[str, ...]]]:
+    # Return key paths from the profile, grouped by table segments and sorted
+    # by decreasing counts
+    with open(filename, encoding="utf-8") as f:
+        profile = json.load(f)
+    hot = {}
+    for _, path in sorted(profile, key=lambda entry: -entry[0]):
+        hot.setdefault(table_segment(path[0]), []).append(tuple(path))
+    return hot
+
+
+def table_segment(name: str) -> str:
+    """
+    Return the name of table segment for the file with the given name.
+
+    Files from top-level packages (or from packages that match the configured
+    prefixes) go to separate segments; other files, and all files when tables
+    are not partitioned, go to the main table, whose segment name is "".
+    """
+    if not (config.partition_tables or config.partition_prefixes):
+        return ""
+    prefixes = [prefix.rstrip("/") for prefix in config.partition_prefixes
+                if name.startswith(prefix.rstrip("/") + "/")]
+    if prefixes:
+        return max(prefixes, key=len)
+    package, sep, _ = name.partition("/")
+    return package if sep else ""
@@ -0,0 +1,6 @@
+echo "Export-mo"
+
+print_run 'trubar export-mo translations.jaml -o tmp/translations.mo'
+diff tmp/translations.mo exp/translations.mo
+print_run 'trubar --conf ../update-table/multilingual/trubar-config.yaml export-mo translations.jaml -o tmp/mo'
+diff -r tmp/mo exp/mo
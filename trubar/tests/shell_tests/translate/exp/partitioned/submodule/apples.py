@@ -0,0 +1,6 @@
+from something import anythin
+from anything import something
+_tr = Translator("Orange", "biolab.si", "Orange")
+del Translator
+_tr = _tr.segment("submodule")
+print(_tr.m[2, "Oranges"])
\ No newline at end of file
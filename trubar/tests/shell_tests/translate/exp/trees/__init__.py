@@ -0,0 +1,13 @@
+# Generated by Trubar: modules of this package are in i18n/<language code>
+import os as _os
+
+_language = _os.environ.get("TRUBAR_LANGUAGE", 'en')
+if _language not in ('en', 'si'):
+    _language = 'en'
+__path__ = [_os.path.join(_os.path.dirname(__file__), "i18n", _language)]
+__file__ = _os.path.join(__path__[0], "__init__.py")
+if _os.path.exists(__file__):
+    with open(__file__, encoding='utf-8') as _f:
+        exec(compile(_f.read(), __file__, "exec"))  # pylint: disable=exec-used
+    del _f
+del _os, _language
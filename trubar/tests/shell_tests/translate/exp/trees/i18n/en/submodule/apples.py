@@ -0,0 +1 @@
+print("Oranges")
\ No newline at end of file
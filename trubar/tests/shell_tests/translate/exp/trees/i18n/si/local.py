@@ -0,0 +1 @@
+language = "si"
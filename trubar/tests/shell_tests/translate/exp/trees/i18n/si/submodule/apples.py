@@ -0,0 +1,2 @@
+from something import anythin
+print("Pomaranče")
\ No newline at end of file
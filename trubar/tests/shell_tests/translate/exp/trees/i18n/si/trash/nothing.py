@@ -0,0 +1,3 @@
+def f(y):
+    x = "To see here"
+    print(x + y + ', really.')
\ No newline at end of file
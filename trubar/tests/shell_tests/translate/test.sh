@@ -74,6 +74,39 @@ print_run 'trubar --conf multilingual/trubar-config.yaml translate -s ../test_pr
 diff -r exp/multilingual tmp/multilingual
 rm -r tmp/multilingual
 
+echo "... partitioned tables"
+print_run 'trubar --conf multilingual/trubar-config-partitioned.yaml translate -s ../test_project -d tmp/partitioned translations.jaml' tmp/verb_output
+diff -r exp/partitioned tmp/partitioned
+rm -r tmp/partitioned
+
+echo "... specialized trees"
+print_run 'trubar --conf trees/trubar-config.yaml translate -s ../test_project -d tmp/trees translations.yaml -q'
+diff -r exp/trees tmp/trees
+rm -r tmp/trees
+
+echo "... specialized trees with static files"
+print_run 'trubar --conf trees/trubar-config.yaml translate -s ../test_project -d tmp/trees translations.yaml -q --static static_files_lan'
+diff -r tmp/trees/i18n/en/a static_files_lan/a
+diff -r tmp/trees/i18n/si/a static_files_lan/a
+diff tmp/trees/i18n/si/local.py trees/si/static/local.py
+if [ -e tmp/trees/i18n/en/local.py -o -e tmp/trees/a ]; then
+    echo "static files copied into a wrong tree"
+    exit 1
+fi
+echo "anythin = None" > tmp/something.py
+(cd tmp && python -c "import trees.a.y")
+(cd tmp && TRUBAR_LANGUAGE=si python -c "from trees.local import language; assert language == 'si'")
+rm -r tmp/trees tmp/something.py
+
+echo "... error: specialized trees in place"
+set +e
+print_run 'trubar --conf trees/trubar-config.yaml translate -s tmp -i translations.yaml' tmp/output.txt
+check_exit_code
+grep -q "in place" tmp/output.txt
+check_exit_code "Invalid error message" -ne
+set -e
+rm tmp/output.txt
+
 echo "... error: no -d or -i"
 set +e
 print_run 'trubar translate -s .. translations.yaml' tmp/output.txt
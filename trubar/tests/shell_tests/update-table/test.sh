@@ -3,3 +3,13 @@ echo "Update-table"
 print_run 'trubar --conf multilingual/trubar-config.yaml translate -s ../test_project -d tmp translations.jaml' > /dev/null
 print_run "trubar --conf multilingual/trubar-config.yaml update-table -o tmp/i18n/Slovenian.json new-translations.jaml" tmp/verb_output
 diff -r exp tmp/i18n
+
+echo "... changes only"
+print_run 'trubar --conf multilingual/trubar-config.yaml translate -s ../test_project -d tmp translations.jaml' > /dev/null
+cp tmp/i18n/Slovenian.json tmp/Slovenian-orig.json
+print_run "trubar --conf multilingual/trubar-config.yaml update-table -c -o tmp/i18n/Slovenian.json new-translations.jaml" tmp/verb_output
+diff tmp/Slovenian-orig.json tmp/i18n/Slovenian.json
+test -f tmp/i18n/Slovenian.changes.json
+print_run "trubar --conf multilingual/trubar-config.yaml update-table -o tmp/i18n/Slovenian.json new-translations.jaml" tmp/verb_output
+diff -r exp tmp/i18n
+rm tmp/Slovenian-orig.json
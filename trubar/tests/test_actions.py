@@ -1,6 +1,5 @@
 # pylint: disable=protected-access, invalid-name
 
-import re
 import io
 import os
 from copy import deepcopy
@@ -11,11 +10,9 @@ from contextlib import redirect_stdout
 import libcst as cst
 
 from trubar.actions import \
-    collect, missing, merge, template, update_messages, \
-    StringCollector, StringTranslator, StringTranslatorMultilingual, \
-    CountImportsFromFuture, Stat, TranslationError
+    collect, missing, merge, template, update_messages, StringCollector, \
+    Stat, with_fallbacks, resolve_fallbacks, mo_entries
 
-from trubar import config
 from trubar.config import LanguageDef
 from trubar.messages import dict_from_msg_nodes, dict_to_msg_nodes, MsgNode
 from trubar.utils import KeyMapping
@@ -25,49 +22,6 @@ import trubar.tests.test_module
 test_module_path = os.path.split(trubar.tests.test_module.__file__)[0]
 
 
-class CountImportsFromFutureTest(unittest.TestCase):
-    module_with_futures = """
-'''
-this is a docstring
-'''
-
-# A comment here
-from __future__ import annotations
-
-# A comment there
-"And another string"
-from __future__ import division
-from __future__ import print_function # test here
-
-# A comment everywhere
-import os
-"""
-
-    module_without_futures = """
-'''
-this is a docstring
-'''
-# test here
-# A comment here
-import os
-
-# A comment there
-"And another string"
-import path
- """
-
-    def test_counts(self):
-        tree = cst.parse_module(self.module_with_futures)
-        cif = CountImportsFromFuture()
-        tree.visit(cif)
-        self.assertEqual(cif.count, 3)
-
-        tree = cst.parse_module(self.module_without_futures)
-        cif = CountImportsFromFuture()
-        tree.visit(cif)
-        self.assertEqual(cif.count, 0)
-
-
 class StringCollectorTest(unittest.TestCase):
     @staticmethod
     def collect(s):
@@ -174,379 +128,6 @@ def g(x):
         self.assertEqual(msgs, {'x = {len("foo")} {"bar"}': None})
 
 
-class StringTranslatorTest(unittest.TestCase):
-    def test_translator(self):
-        module = """
-# A comment
-class A:
-    def b(x):  # Another comment
-        def c(x):
-              d = '''foo'''  # intentional bad indentation
-              e = "bar"
-        a = "baz"
-
-        class B:
-           f = f"baz{42}"
-
-
-class C:
-    g = 'crux'
-"""
-
-        translations = {'class `A`': {'def `b`': {'def `c`': {'foo': 'sea food',
-                                                              'bar': None},
-                                                  'baz': True,
-                                                  'class `B`': {'baz{42}':
-                                                                    False}}},
-                        'class `C`': {'crux': ""}}
-
-        tree = cst.parse_module(module)
-        translator = yamlized(StringTranslator)(translations, tree)
-        translated = tree.visit(translator)
-        trans_source = tree.code_for_node(translated)
-        self.assertEqual(trans_source, """
-# A comment
-class A:
-    def b(x):  # Another comment
-        def c(x):
-              d = '''sea food'''  # intentional bad indentation
-              e = "bar"
-        a = "baz"
-
-        class B:
-           f = f"baz{42}"
-
-
-class C:
-    g = ''
-""")
-
-    def test_auto_quote_and_prefix(self):
-        module = """
-print("Foo")
-print('Bar')
-print("2 + 2 = 4")
-print("2 + 3 = 4")
-print("2 + 4 = 4")
-print("baz")
-print("kux")
-print(r"bing")
-print('''f x g''')
-print(\"\"\"f y g\"\"\")
-print("just {braces}, not an f-string!")
-"""
-
-        tree = cst.parse_module(module)
-        translations = {"Foo": 'Fo"o',
-                        "Bar": "B'ar",
-                        "2 + 2 = 4": "2 + 2 = {2 + 2}",
-                        "2 + 3 = 4": "2 + 3 = {}",
-                        "2 + 4 = 4": "2 + 4 = {not an expression}",
-                        "baz": "ba{}z",
-                        "kux": "ku{--}x",
-                        "bing": "b{2 + 2}ng",
-                        "f x g": "f ' g",
-                        "f y g": 'f " g',
-                        "just {braces}, not an f-string!": "samo {oklepaji}!"
-                        }
-        translator = yamlized(StringTranslator)(translations, tree)
-        translated = tree.visit(translator)
-        trans_source = tree.code_for_node(translated)
-        self.assertEqual(trans_source, """
-print('Fo"o')
-print("B'ar")
-print(f"2 + 2 = {2 + 2}")
-print("2 + 3 = {}")
-print("2 + 4 = {not an expression}")
-print("ba{}z")
-print("ku{--}x")
-print(fr"b{2 + 2}ng")
-print('''f ' g''')
-print(\"\"\"f " g\"\"\")
-print("samo {oklepaji}!")
-""")
-
-    def test_syntax_error(self):
-        tree = cst.parse_module("print('foo')")
-        translator = yamlized(StringTranslator)({"foo": 'bar\nbaz'}, tree)
-        self.assertRaisesRegex(
-            TranslationError,
-            re.compile(".*foo.*bar.*", re.DOTALL), tree.visit, translator)
-
-    def test_import_from_future(self):
-        module = CountImportsFromFutureTest.module_with_futures
-        imports = "import plural\nimport dual"
-        auto_import = cst.parse_module(imports).body
-        tree = cst.parse_module(module)
-        translator = StringTranslator({}, tree, auto_import, 3)
-        translated = tree.visit(translator)
-        trans_source = tree.code_for_node(translated)
-        self.assertEqual(
-            trans_source,
-            module.replace(
-                "test here\n",
-                "test here\nimport plural\nimport dual\n")
-        )
-
-    def test_inport_after_docstring(self):
-        module = CountImportsFromFutureTest.module_without_futures
-        imports = "import plural\nimport dual"
-        auto_import = cst.parse_module(imports).body
-        tree = cst.parse_module(module)
-        translator = StringTranslator({}, tree, auto_import, 0, True)
-        translated = tree.visit(translator)
-        trans_source = tree.code_for_node(translated)
-        self.assertEqual(
-            trans_source,
-            module.replace(
-                "# test here\n",
-                "import plural\nimport dual\n# test here\n")
-        )
-
-
-class StringTranslatorMultilingualTest(unittest.TestCase):
-    def setUp(self):
-        super().setUp()
-        config.config.languages = {
-            "de": LanguageDef("Deutsch", "German", True),
-            "si": LanguageDef("Slovenščina", "Slovenian", False),
-            "en": LanguageDef("English", "English", False)}
-
-    def tearDown(self):
-        config.config.languages = None
-
-    def _translate(self, module, messages, add_initial=False, key_mapping=None):
-        tree = cst.parse_module(module)
-        message_tables = [["msg1", "msg2", "msg3"],
-                          ["msg4", "msg5", "msg6"],
-                          ["msg7", "msg8", "msg8"]] if add_initial else [[], [], []]
-        translator = StringTranslatorMultilingual(
-            [{}] + [dict_to_msg_nodes(d) for d in messages],
-            ["name"], message_tables,
-            key_mapping if key_mapping is not None else [],
-            tree)
-        translated = tree.visit(translator)
-        trans_source = tree.code_for_node(translated)
-        return trans_source, message_tables
-
-    def test_translator(self):
-        module = """
-# A comment
-class A:
-    def b(x):  # Another comment
-        def c(x):
-              d = '''foo'''  # intentional bad indentation
-              e = "bar"
-        a = "baz"
-
-        class B:
-           f = f"baz{42}"
-
-
-class C:
-    g = 'crux'
-"""
-
-        trans_foo = {'class `A`': {'def `b`': {'def `c`': {'foo': 'sea food',
-                                                           'bar': None},
-                                               'baz': True,
-                                               'class `B`': {
-                                                   'baz{42}': False}}},
-                     'class `C`': {'crux': ""}}
-
-        trans_fee = {'class `A`': {'def `b`': {'def `c`': {'bar': "no-bar"},
-                                               'class `B`': {
-                                                   'baz{42}': "bar(1)"}}}}
-
-        key_mapping = [KeyMapping(path=('some', 'path'), f_lang_idx=(0, 1), raw=True)]
-        trans_source, message_tables = self._translate(
-            module, [trans_foo, trans_fee], True, key_mapping)
-        self.assertEqual(trans_source, """
-# A comment
-class A:
-    def b(x):  # Another comment
-        def c(x):
-              d = _tr.m[3, '''foo''']  # intentional bad indentation
-              e = _tr.m[4, "bar"]
-        a = "baz"
-
-        class B:
-           f = _tr.e(_tr.c(5, f"baz{42}"))
-
-
-class C:
-    g = _tr.m[6, 'crux']
-""")
-        self.assertEqual(
-            message_tables,
-            [['msg1', 'msg2', 'msg3', 'foo', 'bar', "f'baz{42}'", 'crux'],
-             ['msg4', 'msg5', 'msg6', 'sea food', 'bar', "f'baz{42}'", ''],
-             ['msg7', 'msg8', 'msg8', 'foo', 'no-bar', "'bar(1)'", 'crux']]
-        )
-        self.assertEqual(
-            key_mapping,
-            [KeyMapping(path=('some', 'path'),
-                        f_lang_idx=(0, 1), raw=True),
-             KeyMapping(path=('name', 'class `A`', 'def `b`', 'def `c`', 'foo'),
-                        f_lang_idx=(), raw=False),
-             KeyMapping(path=('name', 'class `A`', 'def `b`', 'def `c`', 'bar'),
-                        f_lang_idx=(), raw=False),
-             KeyMapping(path=('name', 'class `A`', 'def `b`', 'class `B`', 'baz{42}'),
-                        f_lang_idx=(0, 1), raw=False),
-             KeyMapping(path=('name', 'class `C`', 'crux'),
-                        f_lang_idx=(), raw=False)]
-        )
-
-    def test_f_string_languages(self):
-        m = StringTranslatorMultilingual._f_string_languages
-
-        # Original is an f-string, and so is one of translations
-        self.assertEqual(
-            m("f", "a {s}tring", ["a {s}tring", "one", "two{x}"]),
-            {2})
-
-        # Only original needs it
-        self.assertEqual(
-            m("f", "a {s}tring", ["a {s}tring", "one", "two"]),
-            set())
-
-        m = StringTranslatorMultilingual._f_string_languages
-        # No language needs it
-        self.assertEqual(
-            m("", "a string", ["a string", "one", "two"]),
-            set())
-
-        # Original is not an f-string, but one of translations is
-        for quote in ['"', "'", "'''", '"""']:
-            self.assertEqual(
-                m("", "a string", ["a string", "one", f"t{quote}wo{{x}}"]),
-                {2})
-
-    def test_auto_prefix(self):
-        # No f-strings, no problems
-        translation, tables = self._translate(
-            "print('foo')", [{"foo": "don't"}, {"foo": 'x"y'}])
-        self.assertEqual(translation, "print(_tr.m[0, 'foo'])")
-        self.assertEqual(tables, [["foo"], ["don't"], ['x"y']])
-
-        # Original is an f-string, and so is one of translations, other is missing
-        translation, tables = self._translate(
-            "print(f'fo{o}')", [{"fo{o}": "do{n}t"}, {}])
-        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'fo{o}')))")
-        self.assertEqual(tables, [["f'fo{o}'"], ["f'do{n}t'"], ["f'fo{o}'"]])
-
-        # Original is an f-string, translations are not
-        translation, tables = self._translate(
-            "print(f'fo{o}')", [{"fo{o}": "dont"}, {}])
-        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'fo{o}')))")
-        self.assertEqual(tables, [["f'fo{o}'"], ["'dont'"], ["f'fo{o}'"]])
-
-        # Original is not an f-string, one of translations is, one is not
-        translation, tables = self._translate(
-            "print('foo')", [{"foo": "do{n}t"}, {"foo": "bar"}])
-        self.assertEqual(translation, "print(_tr.e(_tr.c(0, 'foo')))")
-        self.assertEqual(tables, [["'foo'"], ["f'do{n}t'"], ["'bar'"]])
-
-        with patch("trubar.config.config.auto_prefix", False):
-            translation, tables = self._translate(
-                "print('foo')", [{"foo": "do{n}t"}, {"foo": "bar"}])
-            self.assertEqual(translation, "print(_tr.m[0, 'foo'])")
-            self.assertEqual(tables, [['foo'], ['do{n}t'], ['bar']])
-
-    def test_smart_quotes_and_f(self):
-        # Original has an f-string, and translations have different quotes
-        translation, tables = self._translate(
-            "print(f'foo')", [{"foo": "don't"}, {"foo": 'x"y'}])
-        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'foo')))")
-        self.assertEqual(
-            tables,
-            [["f'foo'"], ['"don\'t"'], ['\'x"y\'']])
-
-        # One language has an f-string, and translations have different quotes
-        self._translate(
-            "print('foo')", [{"foo": "d{o}n't"}, {"foo": 'x"y'}])
-        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'foo')))")
-        self.assertEqual(
-            tables,
-            [["f'foo'"], ["\"don't\""], ["'x\"y'"]])
-
-    def test_syntax_error(self):
-        tree = cst.parse_module("print('foo')")
-        translator = yamlized(StringTranslator)({"foo": 'bar\nbaz'}, tree)
-        self.assertRaisesRegex(
-            TranslationError,
-            re.compile(".*foo.*bar.*", re.DOTALL), tree.visit, translator)
-
-    def test_raw_originals(self):
-        code = r"""
-x = r"a stri\ng"
-y = 'o\ne'
-z = 'four'
-        """.strip()
-        key_mapping = []
-        trans_source, messages_tables = self._translate(
-            code,
-            [{}, {r"a stri\ng": r"\niz", r"o\ne": r"e\na", "four": r"š\tiri"}],
-            key_mapping=key_mapping)
-        self.assertEqual(
-            trans_source,
-            r"""
-x = _tr.m[0, r"a stri\ng"]
-y = _tr.m[1, 'o\ne']
-z = _tr.m[2, 'four']
-            """.strip())
-        # The crux of the test is that the second and the third string contain
-        # \n and \t, while the first one has a literal \ and n.
-        self.assertEqual(
-            messages_tables,
-            [[r'a stri\ng', 'o\ne', 'four'],
-             [r'a stri\ng', 'o\ne', 'four'],
-             [r'\niz', 'e\na', 'š\tiri']]
-        )
-        self.assertEqual(
-            key_mapping,
-            [KeyMapping(path=('name', 'a stri\\ng'), f_lang_idx=(), raw=True),
-             KeyMapping(path=('name', 'o\\ne'), f_lang_idx=(), raw=False),
-             KeyMapping(path=('name', 'four'), f_lang_idx=(), raw=False)]
-        )
-
-        code = r"""
-x = rf"a stri\ng {x}"
-y = f'o\ne {x}'
-z = f'four {x}'
-        """.strip()
-        key_mapping = []
-        trans_source, messages_tables = self._translate(
-            code,
-            [{}, {r"a stri\ng {x}": r"\niz {x}",
-                  r"o\ne {x}": r"e\na x",
-                  "four {x}": r"š\tiri {x}"}],
-            key_mapping=key_mapping)
-        self.assertEqual(
-            trans_source,
-            r"""
-x = _tr.e(_tr.c(0, rf"a stri\ng {x}"))
-y = _tr.e(_tr.c(1, f'o\ne {x}'))
-z = _tr.e(_tr.c(2, f'four {x}'))
-            """.strip())
-        # The crux of the test is that the second and the third string contain
-        # \n and \t, while the first one has a literal \ and n.
-        # Note double backslashes in comparison with the above test
-        # because strings these are evaled, unlike those above.
-        self.assertEqual(
-            messages_tables,
-            [[r"f'a stri\\ng {x}'", r"f'o\ne {x}'", "f'four {x}'"],
-             [r"f'a stri\\ng {x}'", r"f'o\ne {x}'", "f'four {x}'"],
-             [r"f'\\niz {x}'", r"'e\na x'", r"f'š\tiri {x}'"]]
-        )
-        self.assertEqual(
-            key_mapping,
-            [KeyMapping(path=('name', 'a stri\\ng {x}'), f_lang_idx=(0, 1, 2), raw=True),
-             KeyMapping(path=('name', 'o\\ne {x}'), f_lang_idx=(0, 1), raw=False),
-             KeyMapping(path=('name', 'four {x}'), f_lang_idx=(0, 1, 2), raw=False)]
-        )
-
-
 class ActionsTest(unittest.TestCase):
     @patch("builtins.print")
     def test_collect(self, print_):
@@ -769,6 +350,89 @@ def `m` not in target structure
             printed = buf.getvalue()
             self.assertEqual(printed, "")
 
+    def test_with_fallbacks(self):
+        translations = dict_to_msg_nodes({
+            "a.py": {
+                "a": "ao",
+                "b": None,
+                "c": False,
+                "d": True,
+                "def `f`": {"x": None}},
+        })
+        pt = dict_to_msg_nodes({
+            "a.py": {
+                "a": "a",
+                "b": "b",
+                "c": "c",
+                "d": "d",
+                "e": None,
+                "def `f`": {"x": None, "y": "y"}},
+            "b.py": {"u": "u"}
+        })
+        es = dict_to_msg_nodes({
+            "a.py": {
+                "e": "e",
+                "def `f`": {"x": "x", "y": "z"}}
+        })
+        resolved = with_fallbacks(translations, [pt, es])
+        self.assertEqual(
+            dict_from_msg_nodes(resolved),
+            {"a.py": {
+                "a": "ao",
+                "b": "b",
+                "c": False,
+                "d": True,
+                "def `f`": {"x": "x", "y": "y"},
+                "e": "e"},
+             "b.py": {"u": "u"}})
+        # Translations are not modified
+        self.assertIsNone(translations["a.py"].value["b"].value)
+
+        self.assertIs(with_fallbacks(translations, []), translations)
+        self.assertIs(with_fallbacks(translations, [{}]), translations)
+
+    def test_resolve_fallbacks(self):
+        translations = [
+            {},
+            dict_to_msg_nodes({"a.py": {"a": "a-pt", "b": "b-pt"}}),
+            dict_to_msg_nodes({"a.py": {"a": "a-br", "b": None}})]
+        languages = {
+            "en": LanguageDef("English", "English", True),
+            "pt": LanguageDef("Português", "Portuguese", False),
+            "pt_BR": LanguageDef("Português do Brasil", "Portuguese (Brazil)",
+                                 False, fallback=("pt", ))}
+        with patch("trubar.config.config.languages", languages):
+            resolved = resolve_fallbacks(translations)
+        self.assertEqual(resolved[0], {})
+        self.assertIs(resolved[1], translations[1])
+        self.assertEqual(dict_from_msg_nodes(resolved[2]),
+                         {"a.py": {"a": "a-br", "b": "b-pt"}})
+
+    def test_mo_entries(self):
+        translations = dict_to_msg_nodes({
+            "a.py": {
+                "pig": "pujsek",
+                "cow": None,
+                "horse": False,
+                "class `A`": {
+                    "def `f`": {
+                        "sea\\nfood": "morska\\nhrana",
+                        "I'm": "Sem",
+                        'say \\"hi\\" and \'bye\'': "reci",
+                        "{n} pigs": "{n} pujskov"}}},
+            "b.py": {"pig": "prašič"}
+        })
+        self.assertEqual(
+            mo_entries(translations),
+            [("a.py", "pig", "pujsek"),
+             ("a.py/class `A`/def `f`", "sea\nfood", "morska\nhrana"),
+             ("a.py/class `A`/def `f`", "I'm", "Sem"),
+             ("a.py/class `A`/def `f`", 'say "hi" and \'bye\'', "reci"),
+             ("a.py/class `A`/def `f`", "{n} pigs", "{n} pujskov"),
+             ("b.py", "pig", "prašič")])
+        self.assertEqual(mo_entries(translations, "b."),
+                         [("b.py", "pig", "prašič")])
+
     def test_template(self):
         messages = {
             "a": "b",
@@ -831,6 +495,38 @@ def `m` not in target structure
         ]
         self.assertEqual(new_messages, expected)
 
+    def test_update_messages_joined(self):
+        translations = {"name": {"class `A`": {"foo": "fu", "bar": None,
+                                               "baz": True, "x": "\\n"}}}
+        key_mapping = [
+            KeyMapping(('name', 'class `A`', 'foo'), joined=('bar', 'baz')),
+            KeyMapping(('name', 'class `A`', 'x'), joined=('y', )),
+            KeyMapping(('name', 'class `A`', 'x'), raw=True, joined=('y', )),
+            KeyMapping(('name', 'class `B`', 'foo'), joined=('bar', ))]
+        messages = ["old foo", "old x", "old raw x", "old B"]
+        new_messages = update_messages(
+            dict_to_msg_nodes(translations), messages, key_mapping, 1)
+        self.assertEqual(new_messages, ["fubarbaz", "\ny", "\\ny", "old B"])
+
+    @patch("builtins.print")
+    def test_update_messages_templates(self, print_):
+        translations = {"name": {'{x} foo {y}': '{y} bar {x!r}',
+                                 '{x} baz': '{pl(x)} baz',
+                                 'qux': 'quux{{'}}
+        key_mapping = [
+            KeyMapping(path=('name', '{x} foo {y}'),
+                       f_lang_idx=(0, 1), fields=("x", "y")),
+            KeyMapping(path=('name', '{x} baz'),
+                       f_lang_idx=(0, 1), fields=("x", )),
+            KeyMapping(path=('name', 'qux'),
+                       f_lang_idx=(0, ), fields=())
+        ]
+        messages = ["{0} foo {1}", "{0} baz", "qux"]
+        new_messages = update_messages(
+            dict_to_msg_nodes(translations), messages, key_mapping, 1)
+        self.assertEqual(new_messages, ["{1} bar {0!r}", "{0} baz", "quux{{{{"])
+        self.assertIn("{x} baz", print_.call_args[0][0])
+
     def test_stat(self):
         messages = {
             "a": "b",
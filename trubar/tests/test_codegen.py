@@ -0,0 +1,786 @@
+# pylint: disable=protected-access, invalid-name
+
+import re
+import dis
+import unittest
+from unittest.mock import patch
+
+import libcst as cst
+
+from trubar.codegen import \
+    StringTranslator, StringTranslatorMultilingual, CountImportsFromFuture, \
+    TranslationError
+from trubar.tables import new_tables
+
+from trubar import config
+from trubar.config import LanguageDef
+from trubar.messages import dict_to_msg_nodes
+from trubar.utils import KeyMapping
+from trubar.tests import yamlized
+
+
+class CountImportsFromFutureTest(unittest.TestCase):
+    module_with_futures = """
+'''
+this is a docstring
+'''
+
+# A comment here
+from __future__ import annotations
+
+# A comment there
+"And another string"
+from __future__ import division
+from __future__ import print_function # test here
+
+# A comment everywhere
+import os
+"""
+
+    module_without_futures = """
+'''
+this is a docstring
+'''
+# test here
+# A comment here
+import os
+
+# A comment there
+"And another string"
+import path
+ """
+
+    def test_counts(self):
+        tree = cst.parse_module(self.module_with_futures)
+        cif = CountImportsFromFuture()
+        tree.visit(cif)
+        self.assertEqual(cif.count, 3)
+
+        tree = cst.parse_module(self.module_without_futures)
+        cif = CountImportsFromFuture()
+        tree.visit(cif)
+        self.assertEqual(cif.count, 0)
+
+
+class StringTranslatorTest(unittest.TestCase):
+    def test_translator(self):
+        module = """
+# A comment
+class A:
+    def b(x):  # Another comment
+        def c(x):
+              d = '''foo'''  # intentional bad indentation
+              e = "bar"
+        a = "baz"
+
+        class B:
+           f = f"baz{42}"
+
+
+class C:
+    g = 'crux'
+"""
+
+        translations = {'class `A`': {'def `b`': {'def `c`': {'foo': 'sea food',
+                                                              'bar': None},
+                                                  'baz': True,
+                                                  'class `B`': {'baz{42}':
+                                                                    False}}},
+                        'class `C`': {'crux': ""}}
+
+        tree = cst.parse_module(module)
+        translator = yamlized(StringTranslator)(translations, tree)
+        translated = tree.visit(translator)
+        trans_source = tree.code_for_node(translated)
+        self.assertEqual(trans_source, """
+# A comment
+class A:
+    def b(x):  # Another comment
+        def c(x):
+              d = '''sea food'''  # intentional bad indentation
+              e = "bar"
+        a = "baz"
+
+        class B:
+           f = f"baz{42}"
+
+
+class C:
+    g = ''
+""")
+
+    def test_concatenated_strings(self):
+        module = """
+a = ("foo "
+     'bar' f"{x}")
+b = "baz" "qux"
+"""
+        translations = {"foo ": "fu ", "bar": "bu", "{x}": "{x}!",
+                        "baz": "bz"}
+        tree = cst.parse_module(module)
+        translator = yamlized(StringTranslator)(translations, tree)
+        translated = tree.visit(translator)
+        self.assertEqual(tree.code_for_node(translated), """
+a = ("fu "
+     'bu' f"{x}!")
+b = "bz" "qux"
+""")
+
+    def test_auto_quote_and_prefix(self):
+        module = """
+print("Foo")
+print('Bar')
+print("2 + 2 = 4")
+print("2 + 3 = 4")
+print("2 + 4 = 4")
+print("baz")
+print("kux")
+print(r"bing")
+print('''f x g''')
+print(\"\"\"f y g\"\"\")
+print("just {braces}, not an f-string!")
+"""
+
+        tree = cst.parse_module(module)
+        translations = {"Foo": 'Fo"o',
+                        "Bar": "B'ar",
+                        "2 + 2 = 4": "2 + 2 = {2 + 2}",
+                        "2 + 3 = 4": "2 + 3 = {}",
+                        "2 + 4 = 4": "2 + 4 = {not an expression}",
+                        "baz": "ba{}z",
+                        "kux": "ku{--}x",
+                        "bing": "b{2 + 2}ng",
+                        "f x g": "f ' g",
+                        "f y g": 'f " g',
+                        "just {braces}, not an f-string!": "samo {oklepaji}!"
+                        }
+        translator = yamlized(StringTranslator)(translations, tree)
+        translated = tree.visit(translator)
+        trans_source = tree.code_for_node(translated)
+        self.assertEqual(trans_source, """
+print('Fo"o')
+print("B'ar")
+print(f"2 + 2 = {2 + 2}")
+print("2 + 3 = {}")
+print("2 + 4 = {not an expression}")
+print("ba{}z")
+print("ku{--}x")
+print(fr"b{2 + 2}ng")
+print('''f ' g''')
+print(\"\"\"f " g\"\"\")
+print("samo {oklepaji}!")
+""")
+
+    def test_syntax_error(self):
+        tree = cst.parse_module("print('foo')")
+        translator = yamlized(StringTranslator)({"foo": 'bar\nbaz'}, tree)
+        self.assertRaisesRegex(
+            TranslationError,
+            re.compile(".*foo.*bar.*", re.DOTALL), tree.visit, translator)
+
+    def test_import_from_future(self):
+        module = CountImportsFromFutureTest.module_with_futures
+        imports = "import plural\nimport dual"
+        auto_import = cst.parse_module(imports).body
+        tree = cst.parse_module(module)
+        translator = StringTranslator({}, tree, auto_import, 3)
+        translated = tree.visit(translator)
+        trans_source = tree.code_for_node(translated)
+        self.assertEqual(
+            trans_source,
+            module.replace(
+                "test here\n",
+                "test here\nimport plural\nimport dual\n")
+        )
+
+    def test_inport_after_docstring(self):
+        module = CountImportsFromFutureTest.module_without_futures
+        imports = "import plural\nimport dual"
+        auto_import = cst.parse_module(imports).body
+        tree = cst.parse_module(module)
+        translator = StringTranslator({}, tree, auto_import, 0, True)
+        translated = tree.visit(translator)
+        trans_source = tree.code_for_node(translated)
+        self.assertEqual(
+            trans_source,
+            module.replace(
+                "# test here\n",
+                "import plural\nimport dual\n# test here\n")
+        )
+
+
+class StringTranslatorMultilingualTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        config.config.languages = {
+            "de": LanguageDef("Deutsch", "German", True),
+            "si": LanguageDef("Slovenščina", "Slovenian", False),
+            "en": LanguageDef("English", "English", False)}
+
+    def tearDown(self):
+        config.config.languages = None
+
+    def _translate(self, module, messages, add_initial=False, key_mapping=None):
+        tree = cst.parse_module(module)
+        message_tables = [["msg1", "msg2", "msg3"],
+                          ["msg4", "msg5", "msg6"],
+                          ["msg7", "msg8", "msg8"]] if add_initial else [[], [], []]
+        translator = StringTranslatorMultilingual(
+            [{}] + [dict_to_msg_nodes(d) for d in messages],
+            ["name"], message_tables,
+            key_mapping if key_mapping is not None else [],
+            tree)
+        translated = tree.visit(translator)
+        trans_source = tree.code_for_node(translated)
+        return trans_source, message_tables
+
+    def test_translator(self):
+        module = """
+# A comment
+class A:
+    def b(x):  # Another comment
+        def c(x):
+              d = '''foo'''  # intentional bad indentation
+              e = "bar"
+        a = "baz"
+
+        class B:
+           f = f"baz{42}"
+
+
+class C:
+    g = 'crux'
+"""
+
+        trans_foo = {'class `A`': {'def `b`': {'def `c`': {'foo': 'sea food',
+                                                           'bar': None},
+                                               'baz': True,
+                                               'class `B`': {
+                                                   'baz{42}': False}}},
+                     'class `C`': {'crux': ""}}
+
+        trans_fee = {'class `A`': {'def `b`': {'def `c`': {'bar': "no-bar"},
+                                               'class `B`': {
+                                                   'baz{42}': "bar(1)"}}}}
+
+        key_mapping = [KeyMapping(path=('some', 'path'), f_lang_idx=(0, 1), raw=True)]
+        trans_source, message_tables = self._translate(
+            module, [trans_foo, trans_fee], True, key_mapping)
+        self.assertEqual(trans_source, """
+# A comment
+class A:
+    def b(x):  # Another comment
+        def c(x):
+              d = _tr.m[3, '''foo''']  # intentional bad indentation
+              e = _tr.m[4, "bar"]
+        a = "baz"
+
+        class B:
+           f = (_tr.e(_tr.c(5)) if True else f"baz{42}")
+
+
+class C:
+    g = _tr.m[6, 'crux']
+""")
+        self.assertEqual(
+            message_tables,
+            [['msg1', 'msg2', 'msg3', 'foo', 'bar', "f'baz{42}'", 'crux'],
+             ['msg4', 'msg5', 'msg6', 'sea food', 'bar', "f'baz{42}'", ''],
+             ['msg7', 'msg8', 'msg8', 'foo', 'no-bar', "'bar(1)'", 'crux']]
+        )
+        self.assertEqual(
+            key_mapping,
+            [KeyMapping(path=('some', 'path'),
+                        f_lang_idx=(0, 1), raw=True),
+             KeyMapping(path=('name', 'class `A`', 'def `b`', 'def `c`', 'foo'),
+                        f_lang_idx=(), raw=False),
+             KeyMapping(path=('name', 'class `A`', 'def `b`', 'def `c`', 'bar'),
+                        f_lang_idx=(), raw=False),
+             KeyMapping(path=('name', 'class `A`', 'def `b`', 'class `B`', 'baz{42}'),
+                        f_lang_idx=(0, 1), raw=False),
+             KeyMapping(path=('name', 'class `C`', 'crux'),
+                        f_lang_idx=(), raw=False)]
+        )
+
+    def test_f_string_languages(self):
+        m = StringTranslatorMultilingual._f_string_languages
+
+        # Original is an f-string, and so is one of translations
+        self.assertEqual(
+            m("f", "a {s}tring", ["a {s}tring", "one", "two{x}"]),
+            {2})
+
+        # Only original needs it
+        self.assertEqual(
+            m("f", "a {s}tring", ["a {s}tring", "one", "two"]),
+            set())
+
+        m = StringTranslatorMultilingual._f_string_languages
+        # No language needs it
+        self.assertEqual(
+            m("", "a string", ["a string", "one", "two"]),
+            set())
+
+        # Original is not an f-string, but one of translations is
+        for quote in ['"', "'", "'''", '"""']:
+            self.assertEqual(
+                m("", "a string", ["a string", "one", f"t{quote}wo{{x}}"]),
+                {2})
+
+    def test_auto_prefix(self):
+        # No f-strings, no problems
+        translation, tables = self._translate(
+            "print('foo')", [{"foo": "don't"}, {"foo": 'x"y'}])
+        self.assertEqual(translation, "print(_tr.m[0, 'foo'])")
+        self.assertEqual(tables, [["foo"], ["don't"], ['x"y']])
+
+        # Original is an f-string, and so is one of translations, other is missing
+        translation, tables = self._translate(
+            "print(f'fo{o}')", [{"fo{o}": "do{n}t"}, {}])
+        self.assertEqual(translation, "print(_tr.e(_tr.c(0)) if True else f'fo{o}')")
+        self.assertEqual(tables, [["f'fo{o}'"], ["f'do{n}t'"], ["f'fo{o}'"]])
+
+        # Original is an f-string, translations are not
+        translation, tables = self._translate(
+            "print(f'fo{o}')", [{"fo{o}": "dont"}, {}])
+        self.assertEqual(translation, "print(_tr.e(_tr.c(0)) if True else f'fo{o}')")
+        self.assertEqual(tables, [["f'fo{o}'"], ["'dont'"], ["f'fo{o}'"]])
+
+        # Original is not an f-string, one of translations is, one is not
+        translation, tables = self._translate(
+            "print('foo')", [{"foo": "do{n}t"}, {"foo": "bar"}])
+        self.assertEqual(translation, "print(_tr.e(_tr.c(0, 'foo')))")
+        self.assertEqual(tables, [["'foo'"], ["f'do{n}t'"], ["'bar'"]])
+
+        with patch("trubar.config.config.auto_prefix", False):
+            translation, tables = self._translate(
+                "print('foo')", [{"foo": "do{n}t"}, {"foo": "bar"}])
+            self.assertEqual(translation, "print(_tr.m[0, 'foo'])")
+            self.assertEqual(tables, [['foo'], ['do{n}t'], ['bar']])
+
+    def test_smart_quotes_and_f(self):
+        # Original has an f-string, and translations have different quotes
+        translation, tables = self._translate(
+            "print(f'foo')", [{"foo": "don't"}, {"foo": 'x"y'}])
+        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'foo')))")
+        self.assertEqual(
+            tables,
+            [["f'foo'"], ['"don\'t"'], ['\'x"y\'']])
+
+        # One language has an f-string, and translations have different quotes
+        self._translate(
+            "print('foo')", [{"foo": "d{o}n't"}, {"foo": 'x"y'}])
+        self.assertEqual(translation, "print(_tr.e(_tr.c(0, f'foo')))")
+        self.assertEqual(
+            tables,
+            [["f'foo'"], ["\"don't\""], ["'x\"y'"]])
+
+    def test_syntax_error(self):
+        tree = cst.parse_module("print('foo')")
+        translator = yamlized(StringTranslator)({"foo": 'bar\nbaz'}, tree)
+        self.assertRaisesRegex(
+            TranslationError,
+            re.compile(".*foo.*bar.*", re.DOTALL), tree.visit, translator)
+
+    @patch("trubar.config.config.format_f_strings", True)
+    def test_format_f_strings_side_effects(self):
+        # Expressions other than names are evaluated at each occurrence, and
+        # must appear in translations in the same order
+        code = r"""
+a = f"{next(it)} {next(it)} {x} {x}"
+b = f"{next(it)}, {x}"
+        """.strip()
+        trans_source, tables = self._translate(
+            code,
+            [{"{next(it)} {next(it)} {x} {x}": "{next(it)}-{next(it)}-{x}",
+              "{next(it)}, {x}": None},
+             {"{next(it)} {next(it)} {x} {x}": "{x}",
+              "{next(it)}, {x}": "{next(it)}, {next(it)}"}])
+        self.assertEqual(
+            trans_source.splitlines()[0],
+            "a = (_tr.e(_tr.c(0)) if True "
+            "else f\"{next(it)} {next(it)} {x} {x}\")")
+        self.assertEqual(
+            trans_source.splitlines()[1],
+            "b = (_tr.e(_tr.c(1)) if True else f\"{next(it)}, {x}\")")
+
+        trans_source, tables = self._translate(
+            code,
+            [{"{next(it)} {next(it)} {x} {x}": "{next(it)}-{next(it)}-{x}"},
+             {"{next(it)} {next(it)} {x} {x}": "{next(it)} {next(it)}"}])
+        self.assertEqual(trans_source.splitlines()[0],
+                         "a = _tr.f(0, ((next(it)), (next(it)), x))")
+        self.assertEqual([table[0] for table in tables],
+                         ["{0} {1} {2} {2}", "{0}-{1}-{2}", "{0} {1}"])
+        it = iter(range(10))  # pylint: disable=possibly-unused-variable
+        x = 42  # pylint: disable=possibly-unused-variable
+        self.assertEqual(tables[1][0].format(next(it), next(it), x),
+                         eval('f"{next(it)}-{next(it)}-{x}"',  # pylint: disable=eval-used
+                              {"it": iter(range(10)), "x": 42}))
+
+    @patch("trubar.config.config.format_f_strings", True)
+    def test_format_f_strings(self):
+        code = r"""
+a = f"{x} and {y!r:>5} and {x}"
+b = f'{x:{y}}'
+c = f"{x}"
+d = "d"
+e = f"{x}\n{x}"
+f = f"e"
+        """.strip()
+        key_mapping = []
+        trans_source, tables = self._translate(
+            code,
+            [{"{x} and {y!r:>5} and {x}": "{y:x} in {x} {{ }}",
+              "{x:{y}}": "{x}",
+              "{x}": "{pl(x)}",
+              "d": "{x}",
+              "e": "ex"},
+             {"{x} and {y!r:>5} and {x}": "brez",
+              "d": "ddd",
+              "{x}\\n{x}": "{x}\\t{x}"}],
+            key_mapping=key_mapping)
+        self.assertEqual(
+            trans_source,
+            r"""
+a = _tr.f(0, (x, y))
+b = (_tr.e(_tr.c(1)) if True else f'{x:{y}}')
+c = (_tr.e(_tr.c(2)) if True else f"{x}")
+d = _tr.e(_tr.c(3, "d"))
+e = _tr.f(4, (x,))
+f = _tr.f(5, ())
+            """.strip())
+        self.assertEqual(
+            [table[:1] + table[4:] for table in tables],
+            [["{0} and {1!r:>5} and {0}", "{0}\n{0}", "e"],
+             ["{1:x} in {0} {{ }}", "{0}\n{0}", "ex"],
+             ["brez", "{0}\t{0}", "e"]]
+        )
+        self.assertEqual(
+            [(keymap.f_lang_idx, keymap.fields) for keymap in key_mapping],
+            [((0, 1), ("x", "y")),
+             ((0, 1, 2), None),
+             ((0, 1, 2), None),
+             ((1, ), None),
+             ((0, 1, 2), ("x", )),
+             ((0, ), ())]
+        )
+
+        # Templates give the same results as evaluated f-strings
+        x, y = 42, 3  # pylint: disable=possibly-unused-variable
+        for formatted, fstring in [
+                (tables[0][0], code.splitlines()[0][4:]),
+                (tables[1][0], 'f"{y:x} in {x} {{ }}"'),
+                (tables[2][4], 'f"{x}\t{x}"')]:
+            self.assertEqual(formatted.format(x, y), eval(fstring))  # pylint: disable=eval-used
+
+        # Without the option, nothing changes
+        with patch("trubar.config.config.format_f_strings", False):
+            trans_source, _ = self._translate(
+                code, [{"{x}\\n{x}": "{x}"}, {}])
+            self.assertEqual(trans_source.splitlines()[4],
+                             r'e = (_tr.e(_tr.c(0)) if True else f"{x}\n{x}")')
+
+    @patch("trubar.config.config.format_f_strings", True)
+    def test_format_f_strings_expressions(self):
+        code = """
+a = f"{p, q} x"
+b = f"{(r := 3)} {r}"
+c = f"{(lambda y: y + 1)(p)}"
+        """.strip()
+        trans_source, tables = self._translate(
+            code,
+            [{"{p, q} x": "x {p, q}",
+              "{(r := 3)} {r}": "{r} {(r := 3)}",
+              "{(lambda y: y + 1)(p)}": "y: {(lambda y: y + 1)(p)}"},
+             {}])
+        self.assertEqual(
+            trans_source,
+            """
+a = _tr.f(0, ((p, q),))
+b = _tr.f(1, (((r := 3)), r))
+c = _tr.f(2, (((lambda y: y + 1)(p)),))
+            """.strip())
+
+        class Translator:
+            def __init__(self, t):
+                self.t = t
+
+            def f(self, idx, args):
+                return self.t[idx].format(*args)
+
+        for table, expected in ((tables[0], ("(1, 2) x", "3 3", "2")),
+                                (tables[1], ("x (1, 2)", "3 3", "y: 2"))):
+            namespace = {"_tr": Translator(table), "p": 1, "q": 2}
+            exec(trans_source, namespace)  # pylint: disable=exec-used
+            self.assertEqual(
+                tuple(namespace[name] for name in "abc"), expected)
+
+    def test_closures(self):
+        code = """
+def f():
+    x = 42
+    def g():
+        return f"{x}"
+    return g
+
+def h(y):
+    return lambda: f"{y!r}"
+"""
+        trans_source, tables = self._translate(
+            code,
+            [{"def `f`": {"def `g`": {"{x}": "{x} je odgovor"}},
+              "def `h`": {"{y!r}": "y je {y!r}"}},
+             {}])
+        self.assertEqual(trans_source, """
+def f():
+    x = 42
+    def g():
+        return (_tr.e(_tr.c(0)) if True else f"{x}")
+    return g
+
+def h(y):
+    return lambda: (_tr.e(_tr.c(1)) if True else f"{y!r}")
+""")
+
+        class Translator:
+            m = tables[1]
+            e = eval
+
+            def c(self, idx, *_):
+                return compile(self.m[idx], '<string>', 'eval')
+
+        namespace = {"_tr": Translator()}
+        exec(trans_source, namespace)  # pylint: disable=exec-used
+        self.assertEqual(namespace["f"]()(), "42 je odgovor")
+        self.assertEqual(namespace["h"]("z")(), "y je 'z'")
+        # The original f-string is not evaluated
+        self.assertNotIn("FORMAT", dis.Bytecode(namespace["f"]()).dis())
+
+    @patch("trubar.config.config.plain_lookup", True)
+    def test_plain_lookup(self):
+        code = '''
+a = "foo" + 'bar'  # a comment
+if x == """baz
+qux""":
+    b = f"{x}"
+    c = {"baz": x}
+while x != "foo": x = "bar"
+
+@deco("baz")
+def f(y="foo"):  # a comment
+    pass
+'''
+        trans_source, tables = self._translate(
+            code,
+            [{"foo": "fu", "bar": "bu", "baz\nqux": "bq", "{x}": "{x}!",
+              "baz": "b",
+              "def `f`": {"baz": "b", "foo": "fu"}},
+             {}])
+        self.assertEqual(
+            trans_source,
+            '''
+a = _tr.t[0] + _tr.t[1]  # "foo", 'bar'  # a comment
+if x == _tr.t[2]:  # """baz\\nqux"""
+    b = (_tr.e(_tr.c(3)) if True else f"{x}")
+    c = {_tr.t[4]: x}  # "baz"
+while x != _tr.t[5]: x = _tr.t[6]  # "foo", "bar"
+
+@deco(_tr.t[7])  # "baz"
+def f(y=_tr.t[8]):  # "foo"  # a comment
+    pass
+''')
+        self.assertEqual(tables[1],
+                         ["fu", "bu", "bq", "f'{x}!'", "b", "fu", "bu", "b",
+                          "fu"])
+
+    @patch("trubar.config.config.hoist_strings", True)
+    def test_hoist_strings(self):
+        code = '''"""Docstring"""
+a = "foo"
+
+class A:
+    b = "bar"
+
+    def f(self, x="baz"):
+        def g():
+            return "foo" + f"{x}"
+        return "bar" + g()
+'''
+        messages = [{"foo": "fu",
+                     "class `A`": {"bar": "bu",
+                                   "def `f`": {"baz": "bz",
+                                               "def `g`": {"foo": "fu",
+                                                           "{x}": "{x}!"},
+                                               "bar": "bu"}}},
+                    {}]
+        expected = '''"""Docstring"""
+import tr
+_tr_4 = _tr.m[4, "baz"]
+_tr_5 = _tr.m[5, "foo"]
+_tr_7 = _tr.m[7, "bar"]
+a = _tr.m[2, "foo"]
+
+class A:
+    b = _tr.m[3, "bar"]
+
+    def f(self, x=_tr_4):
+        def g():
+            return _tr_5 + (_tr.e(_tr.c(6)) if True else f"{x}")
+        return _tr_7 + g()
+'''
+        tree = cst.parse_module(code)
+        translator = StringTranslatorMultilingual(
+            [{}] + [dict_to_msg_nodes(d) for d in messages],
+            ["name"], [["x", "y"], ["x", "y"], ["x", "y"]], [],
+            tree, cst.parse_module("import tr").body, 0, True)
+        tree = cst.metadata.MetadataWrapper(tree)
+        trans_source = tree.module.code_for_node(tree.visit(translator))
+        self.assertEqual(trans_source, expected)
+
+        with patch("trubar.config.config.plain_lookup", True):
+            tree = cst.parse_module(code)
+            translator = StringTranslatorMultilingual(
+                [{}] + [dict_to_msg_nodes(d) for d in messages],
+                ["name"], [["x", "y"], ["x", "y"], ["x", "y"]], [],
+                tree, cst.parse_module("import tr").body, 0, True)
+            tree = cst.metadata.MetadataWrapper(tree)
+            trans_source = tree.module.code_for_node(tree.visit(translator))
+            self.assertIn('_tr_5 = _tr.t[5]  # "foo"\n', trans_source)
+            self.assertIn('            return _tr_5 + (_tr.e(', trans_source)
+
+        # No hoisting without auto imports
+        trans_source, _ = self._translate(code, messages)
+        self.assertNotIn("_tr_", trans_source)
+
+    def test_concatenated_strings(self):
+        code = r"""
+a = ("foo "
+     "bar" r"\d" f"{x}" 'baz' "qux")
+b = "x" "y"
+c = "y" "z"
+        """.strip()
+        key_mapping = []
+        trans_source, tables = self._translate(
+            code,
+            [{"foo ": "fu ", "bar": "bu\\n", r"\d": "\\D", "{x}": "{x}!",
+              "baz": "bz", "qux": True, "x": "iks"},
+             {}],
+            key_mapping=key_mapping)
+        self.assertEqual(
+            trans_source,
+            r"""
+a = (_tr.m[0, "foo " "bar"] + (_tr.m[1, r"\d"] + ((_tr.e(_tr.c(2)) """
+            r"""if True else f"{x}") + _tr.m[3, 'baz' "qux"])))
+b = _tr.m[4, "x" "y"]
+c = ("y" + "z")
+            """.strip())
+        self.assertEqual(tables[1], ["fu bu\n", r"\D", "f'{x}!'", "bzqux", "iksy"])
+        self.assertEqual(tables[2], ["foo bar", r"\d", "f'{x}'", "bazqux", "xy"])
+        self.assertEqual(
+            key_mapping,
+            [KeyMapping(('name', 'foo '), joined=('bar', )),
+             KeyMapping(('name', r'\d'), raw=True),
+             KeyMapping(('name', '{x}'), (0, 1, 2)),
+             KeyMapping(('name', 'baz'), joined=('qux', )),
+             KeyMapping(('name', 'x'), joined=('y', ))])
+
+        @patch("trubar.config.config.plain_lookup", True)
+        def plain():
+            return self._translate('a = "x" "y"', [{"x": "iks"}, {}])[0]
+
+        self.assertEqual(plain(), 'a = _tr.t[0]  # "x" "y"')
+
+    def test_reserved_indices(self):
+        code = 'a = "foo"\nb = "bar"\nc = "baz"'
+        tree = cst.parse_module(code)
+        message_tables, key_mapping, reserved = new_tables(
+            [("name", "baz"), ("name", "qux")])
+        translator = StringTranslatorMultilingual(
+            [{}, dict_to_msg_nodes({"foo": "fu", "bar": "bu", "baz": "bz"}),
+             {}],
+            ["name"], message_tables, key_mapping, tree,
+            reserved=reserved)
+        self.assertEqual(
+            tree.code_for_node(tree.visit(translator)),
+            'a = _tr.m[4, "foo"]\nb = _tr.m[5, "bar"]\nc = _tr.m[2, "baz"]')
+        self.assertEqual(message_tables[1],
+                         ["Slovenščina", "Slovenian", "bz", "", "fu", "bu"])
+        self.assertEqual(
+            key_mapping,
+            [KeyMapping(("name", "baz")), KeyMapping(("name", "qux")),
+             KeyMapping(("name", "foo")), KeyMapping(("name", "bar"))])
+        self.assertEqual(reserved, {("name", "qux"): 3})
+
+    def test_raw_originals(self):
+        code = r"""
+x = r"a stri\ng"
+y = 'o\ne'
+z = 'four'
+        """.strip()
+        key_mapping = []
+        trans_source, messages_tables = self._translate(
+            code,
+            [{}, {r"a stri\ng": r"\niz", r"o\ne": r"e\na", "four": r"š\tiri"}],
+            key_mapping=key_mapping)
+        self.assertEqual(
+            trans_source,
+            r"""
+x = _tr.m[0, r"a stri\ng"]
+y = _tr.m[1, 'o\ne']
+z = _tr.m[2, 'four']
+            """.strip())
+        # The crux of the test is that the second and the third string contain
+        # \n and \t, while the first one has a literal \ and n.
+        self.assertEqual(
+            messages_tables,
+            [[r'a stri\ng', 'o\ne', 'four'],
+             [r'a stri\ng', 'o\ne', 'four'],
+             [r'\niz', 'e\na', 'š\tiri']]
+        )
+        self.assertEqual(
+            key_mapping,
+            [KeyMapping(path=('name', 'a stri\\ng'), f_lang_idx=(), raw=True),
+             KeyMapping(path=('name', 'o\\ne'), f_lang_idx=(), raw=False),
+             KeyMapping(path=('name', 'four'), f_lang_idx=(), raw=False)]
+        )
+
+        code = r"""
+x = rf"a stri\ng {x}"
+y = f'o\ne {x}'
+z = f'four {x}'
+        """.strip()
+        key_mapping = []
+        trans_source, messages_tables = self._translate(
+            code,
+            [{}, {r"a stri\ng {x}": r"\niz {x}",
+                  r"o\ne {x}": r"e\na x",
+                  "four {x}": r"š\tiri {x}"}],
+            key_mapping=key_mapping)
+        self.assertEqual(
+            trans_source,
+            r"""
+x = (_tr.e(_tr.c(0)) if True else rf"a stri\ng {x}")
+y = (_tr.e(_tr.c(1)) if True else f'o\ne {x}')
+z = (_tr.e(_tr.c(2)) if True else f'four {x}')
+            """.strip())
+        # The crux of the test is that the second and the third string contain
+        # \n and \t, while the first one has a literal \ and n.
+        # Note double backslashes in comparison with the above test
+        # because strings these are evaled, unlike those above.
+        self.assertEqual(
+            messages_tables,
+            [[r"f'a stri\\ng {x}'", r"f'o\ne {x}'", "f'four {x}'"],
+             [r"f'a stri\\ng {x}'", r"f'o\ne {x}'", "f'four {x}'"],
+             [r"f'\\niz {x}'", r"'e\na x'", r"f'š\tiri {x}'"]]
+        )
+        self.assertEqual(
+            key_mapping,
+            [KeyMapping(path=('name', 'a stri\\ng {x}'), f_lang_idx=(0, 1, 2), raw=True),
+             KeyMapping(path=('name', 'o\\ne {x}'), f_lang_idx=(0, 1), raw=False),
+             KeyMapping(path=('name', 'four {x}'), f_lang_idx=(0, 1, 2), raw=False)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
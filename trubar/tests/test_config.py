@@ -114,18 +114,29 @@ class ConfigTest(TestBase):
         with patch("os.path.exists",
                    lambda path: not os.path.join("si", "static") in path):
             config.update_from_file(self.fn)
+            base_dir, _ = os.path.split(self.fn)
             # Language definitions are correct
             self.assertEqual(
                 config.languages,
                 {'en': LanguageDef(name='English',
                                    international_name='English',
-                                   is_original=True),
+                                   is_original=True,
+                                   static_files=(
+                                       os.path.join(base_dir, "en", "static"),
+                                   )),
                  'si': LanguageDef(name='Slovenščina',
                                    international_name='Slovenian',
-                                   is_original=False),
+                                   is_original=False,
+                                   auto_import=(
+                                       'from orangecanvas.localization.si '
+                                       'import plsi', )),
                  'ua': LanguageDef(name='Українська',
                                    international_name='Ukrainian',
-                                   is_original=False)})
+                                   is_original=False,
+                                   auto_import=('import grain', ),
+                                   static_files=(
+                                       os.path.join(base_dir, "ua", "static"),
+                                   ))})
             # Original language is first
             self.assertTrue(next(iter(config.languages.values())).is_original)
             # Auto-imports are correct
@@ -135,7 +146,6 @@ class ConfigTest(TestBase):
                  'import grain',
                  'from orangecanvas.localization import pl'})
             # Base dir is set correctly
-            base_dir, _ = os.path.split(self.fn)
             self.assertEqual(config.base_dir, base_dir)
             # Static files are correct
             self.assertEqual(
@@ -197,6 +207,45 @@ class ConfigTest(TestBase):
                 "Directory for language 'foo-bar-langa' is missing",
                 a_print.call_args[0][0])
 
+    @patch("builtins.print")
+    def test_languages_fallback(self, a_print):
+        self.prepare("""
+                languages:
+                    en:
+                        name: English
+                        original: true
+                    pt:
+                        name: Português
+                    pt_BR:
+                        name: Português do Brasil
+                        fallback: [pt]
+                    es:
+                        name: Español
+                        fallback: pt
+        """)
+        with patch("os.path.exists", lambda _: True):
+            config = Configuration()
+            config.update_from_file(self.fn)
+            self.assertEqual(config.languages["pt"].fallback, ())
+            self.assertEqual(config.languages["pt_BR"].fallback, ("pt", ))
+            self.assertEqual(config.languages["es"].fallback, ("pt", ))
+
+        self.prepare("""
+                languages:
+                    en:
+                        name: English
+                        original: true
+                    pt:
+                        name: Português
+                        fallback: [pt, pt_PT]
+        """)
+        with patch("os.path.exists", lambda _: True):
+            config = Configuration()
+            self.assertRaises(SystemExit, config.update_from_file, self.fn)
+            self.assertEqual(
+                a_print.call_args[0][0],
+                "Invalid fallback languages for 'pt': pt, pt_PT")
+
     @patch("builtins.print")
     def test_no_original_language(self, a_print):
         self.prepare("""
@@ -213,6 +262,20 @@ class ConfigTest(TestBase):
                 "Original language is not defined",
                 a_print.call_args[0][0])
 
+    @patch("builtins.print")
+    def test_hoist_strings_without_auto_import(self, a_print):
+        self.prepare("hoist-strings: true")
+        config = Configuration()
+        self.assertRaises(SystemExit, config.update_from_file, self.fn)
+        self.assertEqual(a_print.call_args[0][0],
+                         "Option 'hoist-strings' requires 'auto-import'")
+
+        self.prepare("hoist-strings: true\n"
+                     "auto-import: from foo import _tr")
+        config = Configuration()
+        config.update_from_file(self.fn)
+        self.assertTrue(config.hoist_strings)
+
 
 if __name__ == "__main__":
     unittest.main()
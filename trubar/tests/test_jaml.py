@@ -1,5 +1,7 @@
+import io
+import os
+import tempfile
 import unittest
-from unittest.mock import patch
 
 from trubar import jaml
 from trubar.messages import MsgNode
@@ -95,6 +97,19 @@ x/y.py: null
          }
     )
 
+    def test_read_quoted_blocks_with_escaped_quotes(self):
+        self.assertEqual(
+            jaml.read("a: 'it''\n"
+                      "''s'' ''\n"
+                      "''\n"
+                      "'\n"
+                      'b: "x""""\n'
+                      '""  c"\n'),
+            {"a": MsgNode("it'\n's' '\n'\n"),
+             "b": MsgNode('x""\n"  c')})
+        self.assertRaisesRegex(
+            jaml.JamlError, "Line 1: file ends", jaml.read, "a: 'b''\n''")
+
     def test_read_quotes_in_values(self):
         text = '''
 foo1: "bar"
@@ -258,11 +273,89 @@ ghi: jkl
             tuv: bdf""",
         )
 
-    @patch("trubar.jaml.read")
-    def test_readfile(self, read):
-        jaml.readfile(jaml.__file__)
-        with open(jaml.__file__, encoding="utf-8") as f:
-            read.assert_called_with(f.read())
+    def test_readfile(self):
+        text = "# comment\r\nclass `A`:\r\n    a: 'b\n\n  c'\n" \
+               "    d: e\u2028f: g\rx: y"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "x.jaml")
+            with open(fname, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            self.assertEqual(jaml.readfile(fname), jaml.read(text))
+
+            with open(fname, "w", encoding="utf-8") as f:
+                f.write("a:\n    b: c\n  d: e")
+            self.assertRaisesRegex(
+                jaml.JamlError, "Line 3: unindent", jaml.readfile, fname)
+
+    def test_readfile_indexed(self):
+        text = "# a\r\n\r\na.py:\r\n    x: 'multi\nline'\n    y: z\n\n" \
+               "# b\nb.py: null\nc.py:\n    k:\n        v: 'č\u2028ž'\n\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "x.jaml")
+            with open(fname, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            tree, sections = jaml.readfile_indexed(fname)
+            self.assertEqual(tree, jaml.readfile(fname))
+            self.assertEqual([key for key, *_ in sections],
+                             ["a.py", "b.py", "c.py"])
+            with open(fname, "rb") as f:
+                data = f.read()
+            self.assertEqual(
+                [data[start:end].decode("utf-8")
+                 for _, start, end in sections],
+                ["# a\r\n\r\na.py:\r\n    x: 'multi\nline'\n    y: z\n\n",
+                 "# b\nb.py: null\n",
+                 "c.py:\n    k:\n        v: 'č\u2028ž'\n\n"])
+            self.assertEqual(
+                jaml.readsections(fname, [sections[2][1:], sections[0][1:]]),
+                {"c.py": tree["c.py"], "a.py": tree["a.py"]})
+
+            # Section starts after a line separator within a line of the file
+            with open(fname, "w", encoding="utf-8") as f:
+                f.write("a: b\u2028c: d\n")
+            tree, sections = jaml.readfile_indexed(fname)
+            self.assertEqual(sections, [("a", 0, 7), ("c", 7, 12)])
+            self.assertEqual(jaml.readsections(fname, [(7, 12)]),
+                             {"c": tree["c"]})
+
+            with open(fname, "w", encoding="utf-16") as f:
+                f.write("a: b\n")
+            tree, sections = jaml.readfile_indexed(fname, encoding="utf-16")
+            self.assertEqual(tree["a"].value, "b")
+            self.assertIsNone(sections)
+
+    def test_iterparse(self):
+        text = """
+# A
+class `A`:
+    a: b
+    def `f`:
+        # c
+        c: null
+        d: 'x
+y'
+    e: true
+x: y
+"""
+        events = [(jaml.ENTER, "class `A`", ["# A"]),
+                  (jaml.LEAF, "a", "b", None),
+                  (jaml.ENTER, "def `f`", None),
+                  (jaml.LEAF, "c", None, ["# c"]),
+                  (jaml.LEAF, "d", "x\ny", None),
+                  (jaml.EXIT, ),
+                  (jaml.LEAF, "e", True, None),
+                  (jaml.EXIT, ),
+                  (jaml.LEAF, "x", "y", None)]
+        self.assertEqual(list(jaml.iterparse(text)), events)
+        self.assertEqual(list(jaml.iterparse(io.StringIO(text))), events)
+
+        events = list(jaml.iterparse("a:\n    b:\n        c: d"))
+        self.assertEqual(events[-2:], [(jaml.EXIT, ), (jaml.EXIT, )])
+
+        events = jaml.iterparse(io.StringIO("a: b\nc:\n    d: e\n  f: g"))
+        self.assertEqual(next(events), (jaml.LEAF, "a", "b", None))
+        self.assertRaisesRegex(jaml.JamlError, "Line 4: unindent",
+                               list, events)
 
 
 class JamlDumperTest(unittest.TestCase):
@@ -298,6 +391,31 @@ a/b.py:
 class `A`: false
 """[1:])
 
+    def test_write(self):
+        tree = {"a/b.py": MsgNode({"def `f`": MsgNode({"foo": MsgNode("bar")},
+                                                     ["# f"]),
+                                   "baz": MsgNode(None)}),
+                "x": MsgNode(True)}
+        text = "a/b.py:\n    # f\n    def `f`:\n        foo: bar\n" \
+               "    baz: null\nx: true\n"
+        self.assertEqual(jaml.dump(tree), text)
+        self.assertEqual("".join(jaml.iterdump(tree)), text)
+
+        f = io.StringIO()
+        jaml.write(tree, f)
+        self.assertEqual(f.getvalue(), text)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "x.jaml")
+            jaml.writefile(tree, fname)
+            self.assertEqual(jaml.readfile(fname), tree)
+
+    def test_dump_deep(self):
+        tree = {"x": MsgNode("y")}
+        for i in range(2000):
+            tree = {f"def `f{i}`": MsgNode(tree)}
+        self.assertEqual(jaml.dump(tree).count("\n"), 2001)
+
     def test_backslashes(self):
         self.assertEqual(jaml.dump({r"a\nb": MsgNode(r"c\nd")}).strip(),
                          r"a\nb: c\nd")
@@ -1,11 +1,18 @@
 import io
+import os
+import sys
+import sqlite3
+import subprocess
 from contextlib import redirect_stdout
 import unittest
 from unittest.mock import patch
 
-from trubar import messages
+from trubar import messages, jaml
 from trubar.messages import \
-    load, dump, dict_to_msg_nodes, dict_from_msg_nodes, MsgNode
+    load, dump, dict_to_msg_nodes, dict_from_msg_nodes, MsgNode, cache_name, \
+    compact, CompactMsgDict, forget_sqlite_reads, \
+    check_sanity as check_message_sanity
+from trubar.config import config
 
 from trubar.tests import TestBase, yamlized
 
@@ -59,6 +66,184 @@ class TestUtils(TestBase):
                 'foo': MsgNode(value='bar: baz')
             })})
 
+    def test_load_json(self):
+        fn = self.prepare_file("x.json", """
+        {"class `A`": [{"foo": "bar", "baz": [null, ["# c"]]}, ["# A"]],
+         "x.py": false}
+        """)
+        msgs = load(fn)
+        self.assertEqual(
+            msgs,
+            {'class `A`': MsgNode(value={
+                'foo': MsgNode(value='bar'),
+                'baz': MsgNode(value=None, comments=["# c"])
+            }, comments=["# A"]),
+             'x.py': MsgNode(value=False)})
+
+        dump(msgs, fn)
+        self.assertEqual(load(fn), msgs)
+        with open(fn, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+        for text, error in (('{"x.py": [1]}', "x.py: a list"),
+                            ('{"x.py": {"a": 1}}', "x.py/a: invalid"),
+                            ('["x.py"]', "object expected"),
+                            ('{"x.py": ', "Expecting value")):
+            with open(fn, "w", encoding="utf-8") as f:
+                f.write(text)
+            with io.StringIO() as buf, redirect_stdout(buf):
+                self.assertRaises(SystemExit, load, fn)
+                self.assertIn(error, buf.getvalue())
+
+    def test_sqlite(self):
+        text = """
+        # file
+        a/x.py:
+            foo: bar
+            # class
+            class `A`:
+                def `f`:
+                    "quoted: {x}": true
+                    baz: false
+                    multi: 'line
+        line'
+        b/y.py: null
+        a/z.py:
+            foo: null
+        """
+        jaml_fn = self.prepare_file("x.jaml", text)
+        fn = os.path.join(self.tmpdir, "x.sqlite")
+        msgs = load(jaml_fn)
+        dump(msgs, fn)
+        self.assertEqual(load(fn), msgs)
+        self.assertEqual(list(load(fn)), list(msgs))
+        self.assertEqual(load(fn, "a/"),
+                         {"a/x.py": msgs["a/x.py"], "a/z.py": msgs["a/z.py"]})
+        dump(load(fn), jaml_fn)
+        with open(jaml_fn, encoding="utf-8") as f:
+            self.assertEqual(f.read(), jaml.dump(msgs))
+
+        def sections():
+            con = sqlite3.connect(fn)
+            try:
+                return con.execute(
+                    "SELECT key, id, digest FROM sections "
+                    "ORDER BY position").fetchall()
+            finally:
+                con.close()
+
+        # Only changed sections are written
+        before = sections()
+        msgs = load(fn)
+        msgs["a/z.py"].value["foo"] = MsgNode("baz")
+        dump(msgs, fn)
+        after = sections()
+        self.assertEqual(before[:2], after[:2])
+        self.assertNotEqual(before[2], after[2])
+        self.assertEqual(load(fn), msgs)
+
+        # Changes in sections that were not changed here are kept
+        mine = load(fn)
+        subprocess.run(
+            [sys.executable, "-c",
+             "import sys\n"
+             "from trubar.messages import load, dump, MsgNode\n"
+             "theirs = load(sys.argv[1])\n"
+             "theirs['a/x.py'].value['foo'] = MsgNode('qux')\n"
+             "dump(theirs, sys.argv[1])\n",
+             fn],
+            env={**os.environ, "PYTHONPATH": os.path.dirname(
+                os.path.dirname(messages.__file__))},
+            check=True)
+        mine["b/y.py"] = MsgNode(False)
+        dump(mine, fn)
+        msgs = load(fn)
+        self.assertEqual(msgs["a/x.py"].value["foo"].value, "qux")
+        self.assertIs(msgs["b/y.py"].value, False)
+
+        # Partially loaded files keep other sections
+        msgs = load(fn, "z.py")
+        msgs["a/z.py"] = MsgNode(True)
+        msgs["c.py"] = MsgNode(None)
+        dump(msgs, fn)
+        msgs = load(fn)
+        self.assertEqual(list(msgs), ["a/x.py", "b/y.py", "a/z.py", "c.py"])
+        self.assertIs(msgs["a/z.py"].value, True)
+
+        # Removed sections are deleted
+        del msgs["a/x.py"]
+        dump(msgs, fn)
+        self.assertEqual(list(load(fn)), ["b/y.py", "a/z.py", "c.py"])
+
+        # After forgetting the read sections, messages are the entire content
+        msgs = load(fn, "c.py")
+        forget_sqlite_reads(fn)
+        dump(msgs, fn)
+        self.assertEqual(list(load(fn)), ["c.py"])
+
+        with open(fn, "wb") as f:
+            f.write(b"not a database" * 10)
+        with io.StringIO() as buf, redirect_stdout(buf):
+            self.assertRaises(SystemExit, load, fn)
+            self.assertIn("Error in", buf.getvalue())
+
+    def test_compact(self):
+        msgs = {"a.py": MsgNode({"foo": MsgNode("bar", ["# c"]),
+                                 "def `f`": MsgNode({"baz": MsgNode(None)}),
+                                 "t": MsgNode(True)},
+                                ["# a"]),
+                "b.py": MsgNode(False)}
+        pool = {}
+        comp = compact(msgs, pool)
+        self.assertIsInstance(comp, dict)
+        self.assertEqual(comp, msgs)
+        self.assertEqual(msgs, comp)
+        self.assertFalse(comp != msgs)
+        self.assertNotEqual(comp, {"b.py": MsgNode(False)})
+        self.assertEqual(comp["a.py"].comments, ["# a"])
+        self.assertEqual(comp["a.py"].value["foo"], MsgNode("bar", ["# c"]))
+        self.assertIsInstance(comp["a.py"].value["def `f`"].value,
+                              CompactMsgDict)
+        self.assertIsNone(comp.get("c.py"))
+        self.assertEqual(comp.get("b.py"), MsgNode(False))
+        self.assertIn("b.py", comp)
+        self.assertEqual(list(comp), ["a.py", "b.py"])
+        self.assertEqual(list(comp.items()), list(msgs.items()))
+        self.assertEqual(list(comp.values()), list(msgs.values()))
+        self.assertEqual(dict(comp), msgs)
+        self.assertRaises(TypeError, comp.__setitem__, "c.py", MsgNode(None))
+        self.assertRaises(TypeError, comp.pop, "b.py")
+        self.assertTrue(check_message_sanity(comp))
+        self.assertEqual(jaml.dump(comp), jaml.dump(msgs))
+
+        # Equal strings are shared
+        foo, bar = "".join(["fo", "o"]), "".join(["ba", "r"])
+        self.assertIsNot(foo, next(iter(comp["a.py"].value)))
+        other = compact({"a.py": MsgNode({foo: MsgNode(bar)})}, pool)
+        self.assertIs(next(iter(other["a.py"].value)),
+                      next(iter(comp["a.py"].value)))
+        self.assertIs(other["a.py"].value["foo"].value,
+                      comp["a.py"].value["foo"].value)
+
+    def test_register_backend(self):
+        calls = []
+        backend = messages.Backend(
+            lambda fn: calls.append(fn) or {"x.py": MsgNode(None)},
+            lambda msgs: [b"x"],
+            (ValueError, ))
+        try:
+            messages.register_backend(".foo", backend)
+            fn = self.prepare_file("x.foo", "")
+            self.assertEqual(load(fn), {"x.py": MsgNode(None)})
+            self.assertEqual(calls, [fn])
+            dump({}, fn)
+            with open(fn, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "x")
+        finally:
+            del messages.BACKENDS[".foo"]
+        self.assertIs(messages.get_backend("x.bar", ".jaml"),
+                      messages.BACKENDS[".jaml"])
+
     def test_loader_graceful_exit_on_error(self):
         fn = self.prepare_file("x.jaml", """
         class `A`: asdf
@@ -71,6 +256,98 @@ class TestUtils(TestBase):
             self.assertRaises(SystemExit, load, "no such file")
             self.assertIn("not found", buf.getvalue())
 
+    def test_load_cached(self):
+        fn = self.prepare_file("x.jaml", """
+        class `A`:
+            foo: bar
+        """)
+        cache = os.path.join(self.tmpdir, ".x.jaml.cache")
+        expected = {'class `A`': MsgNode(value={'foo': MsgNode(value='bar')})}
+        try:
+            config.cache_messages = True
+            self.assertEqual(load(fn), expected)
+            self.assertTrue(os.path.exists(cache))
+
+            with patch("trubar.jaml.readfile") as readfile:
+                self.assertEqual(load(fn), expected)
+                readfile.assert_not_called()
+
+                # Same content, different time: hash is checked
+                os.utime(fn, ns=(0, 0))
+                self.assertEqual(load(fn), expected)
+                readfile.assert_not_called()
+
+                # ... and the cache gets the new time
+                with patch("hashlib.sha256") as sha256:
+                    self.assertEqual(load(fn), expected)
+                    sha256.assert_not_called()
+                readfile.assert_not_called()
+
+            # Changed content of the same size
+            with open(fn, "w", encoding="utf-8") as f:
+                f.write("class `A`:\n    foo: baz\n")
+            self.assertEqual(load(fn)['class `A`'].value['foo'].value, "baz")
+            with patch("trubar.jaml.readfile") as readfile:
+                self.assertEqual(
+                    load(fn)['class `A`'].value['foo'].value, "baz")
+                readfile.assert_not_called()
+
+            # Corrupt cache is ignored and replaced
+            with open(cache, "wb") as f:
+                f.write(b"garbage")
+            self.assertEqual(load(fn)['class `A`'].value['foo'].value, "baz")
+
+            config.cache_dir = "cache"
+            config.base_dir = self.tmpdir
+            self.assertEqual(load(fn)['class `A`'].value['foo'].value, "baz")
+            self.assertEqual(
+                os.path.dirname(cache_name(fn)),
+                os.path.join(self.tmpdir, "cache"))
+            self.assertTrue(os.path.exists(cache_name(fn)))
+        finally:
+            config.cache_messages = False
+            config.cache_dir = ""
+            config.base_dir = None
+
+    def test_load_pattern(self):
+        fn = self.prepare_file("x.jaml", """
+        a/x.py:
+            foo: bar
+        b/y.py:
+            baz: null
+        a/z.py: null
+        """)
+        for cached in (False, True, True):
+            try:
+                config.cache_messages = cached
+                self.assertEqual(list(load(fn, "a/")), ["a/x.py", "a/z.py"])
+                self.assertEqual(load(fn, "y.py"),
+                                 {"b/y.py": MsgNode({"baz": MsgNode(None)})})
+                self.assertEqual(len(load(fn)), 3)
+            finally:
+                config.cache_messages = False
+        self.assertTrue(os.path.exists(cache_name(fn, ".index")))
+
+        # Sections are read from the index
+        try:
+            config.cache_messages = True
+            with patch("trubar.jaml.readfile_indexed") as readfile, \
+                    patch("trubar.jaml.readsections",
+                          wraps=messages.jaml.readsections) as readsections:
+                self.assertEqual(list(load(fn, "a/")), ["a/x.py", "a/z.py"])
+                readfile.assert_not_called()
+                self.assertEqual(len(readsections.call_args[0][1]), 2)
+        finally:
+            config.cache_messages = False
+
+    def test_load_not_cached(self):
+        fn = self.prepare_file("x.jaml", """
+        class `A`:
+            foo: bar
+        """)
+        load(fn)
+        self.assertFalse(os.path.exists(cache_name(fn)))
+
     @patch("builtins.print")
     def test_loader_verifies_sanity(self, a_print):
         fn = self.prepare_file("x.jaml", """
@@ -167,20 +444,64 @@ module2/def `g`: Unexpectedly not a namespace
             dict_from_msg_nodes({"x": MsgNode("foo", ["bar", "baz"])}),
             {"x": "foo"})
 
-    @patch("builtins.open")
-    @patch("yaml.dump")
-    @patch("trubar.jaml.dump")
-    def test_dump(self, jaml_dump, yaml_dump, _):
-        msgdict = {"x": MsgNode("foo", ["bar", "baz"])}
-        dump(msgdict, "x.jaml")
-        jaml_dump.assert_called_with(msgdict)
-        jaml_dump.reset_mock()
-        yaml_dump.assert_not_called()
-
-        msgdict = {"x": MsgNode("foo", ["bar", "baz"])}
-        dump(msgdict, "x.yaml")
-        self.assertEqual(yaml_dump.call_args[0][0], dict_from_msg_nodes(msgdict))
-        jaml_dump.assert_not_called()
+    def test_dump(self):
+        msgdict = {"x.py": MsgNode({"foo": MsgNode("bar")}, ["# baz"]),
+                   "y.py": MsgNode({"foo": MsgNode(None)})}
+        fn = self.prepare_file("x.jaml", "")
+        dump(msgdict, fn)
+        with open(fn, encoding="utf-8") as f:
+            self.assertEqual(f.read(),
+                             "# baz\nx.py:\n    foo: bar\ny.py:\n    foo: null\n")
+
+        fn = self.prepare_file("x.yaml", "")
+        dump(msgdict, fn)
+        self.assertEqual(dict_from_msg_nodes(load(fn)),
+                         dict_from_msg_nodes(msgdict))
+
+    def test_dump_unchanged(self):
+        msgdict = {"x.py": MsgNode({"foo": MsgNode("bar")}, ["# baz"]),
+                   "y.py": MsgNode({"foo": MsgNode(None)})}
+        for name in ("x.jaml", "x.yaml", "x.json"):
+            fn = self.prepare_file(name, "")
+            dump(msgdict, fn)
+            with open(fn, "rb") as f:
+                content = f.read()
+            os.utime(fn, ns=(0, 0))
+
+            dump(msgdict, fn)
+            self.assertEqual(os.stat(fn).st_mtime_ns, 0)
+
+            msgdict["y.py"].value["foo"] = MsgNode("baz")
+            dump(msgdict, fn)
+            self.assertNotEqual(os.stat(fn).st_mtime_ns, 0)
+            self.assertEqual(dict_from_msg_nodes(load(fn)),
+                             dict_from_msg_nodes(msgdict))
+
+            # Last section removed
+            msgdict.pop("y.py")
+            dump(msgdict, fn)
+            self.assertEqual(dict_from_msg_nodes(load(fn)),
+                             dict_from_msg_nodes(msgdict))
+            self.assertFalse(os.path.exists(fn + ".tmp"))
+            msgdict["y.py"] = MsgNode({"foo": MsgNode(None)})
+
+            # Section added
+            dump(msgdict, fn)
+            with open(fn, "rb") as f:
+                self.assertEqual(f.read(), content)
+
+    @unittest.skipIf(sys.platform == "win32", "requires symbolic links")
+    def test_dump_keeps_mode_and_links(self):
+        msgdict = {"x.py": MsgNode({"foo": MsgNode("bar")})}
+        fn = self.prepare_file("x.jaml", "")
+        os.chmod(fn, 0o640)
+        link = os.path.join(os.path.dirname(fn), "link.jaml")
+        os.symlink(fn, link)
+        dump(msgdict, link)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(os.stat(fn).st_mode & 0o777, 0o640)
+        self.assertEqual(dict_from_msg_nodes(load(fn)),
+                         dict_from_msg_nodes(msgdict))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import unittest
+
+from trubar.plural import \
+    compile_rule, plural_function, english_forms, slovenian_forms, \
+    pl, plsi, RULES
+
+
+class CompileRuleTest(unittest.TestCase):
+    def test_compile_rule(self):
+        rule = compile_rule("n != 1")
+        self.assertEqual([rule(n) for n in range(4)], [1, 0, 1, 1])
+
+        rule = compile_rule(RULES["sl"])
+        self.assertEqual([rule(n) for n in (0, 1, 2, 3, 4, 5, 101, 102, 111)],
+                         [3, 0, 1, 2, 2, 3, 0, 1, 3])
+
+        rule = compile_rule(RULES["ru"])
+        self.assertEqual([rule(n) for n in (1, 2, 5, 11, 12, 21, 22, 25)],
+                         [0, 1, 2, 2, 2, 0, 1, 2])
+
+        rule = compile_rule("nplurals=3; plural=n==1 ? 0 : !(n % 10) ? 1 : 2;")
+        self.assertEqual([rule(n) for n in (1, 10, 20, 7)], [0, 1, 1, 2])
+
+        rule = compile_rule("n / 2 - 1 < 2 == 1")
+        self.assertEqual([rule(n) for n in (1, 5, 6)], [1, 1, 0])
+
+    def test_compile_once(self):
+        self.assertIs(compile_rule("n > 1"), compile_rule("n > 1"))
+
+    def test_invalid_rule(self):
+        for rule in ("n ! 1", "n ? 1", "(n", "n == 1)", "m == 1", "n ==",
+                     "n == 1; import os"):
+            self.assertRaises(ValueError, compile_rule, rule)
+
+
+class PluralFunctionTest(unittest.TestCase):
+    def test_english(self):
+        self.assertEqual(pl(1, "pig"), "pig")
+        self.assertEqual(pl(2, "pig"), "pigs")
+        self.assertEqual(pl(0, "piggy"), "piggies")
+        self.assertEqual(pl(3, "monkey"), "monkeys")
+        self.assertEqual(pl(3, "PIGGY"), "PIGGIES")
+        self.assertEqual(pl(1, "leaf|leaves"), "leaf")
+        self.assertEqual(pl(2, "leaf|leaves"), "leaves")
+        self.assertEqual(pl(-1, "leaf|leaves"), "leaf")
+        self.assertEqual(pl(1000, "leaf|leaves"), "leaves")
+        self.assertEqual(pl(1.0, "leaf|leaves"), "leaf")
+        self.assertEqual(pl(1.5, "leaf|leaves"), "leaves")
+
+    def test_float_first(self):
+        # Forms are not yet precomputed at the first call
+        self.assertEqual(pl(1.5, "cow"), "cows")
+        self.assertEqual(pl(1.0, "calf|calves"), "calf")
+        self.assertEqual(pl(1, "cow"), "cow")
+
+    def test_negative(self):
+        self.assertEqual(pl(-1, "pig"), "pig")
+        self.assertEqual(pl(-2, "pig"), "pigs")
+        forms = "pujsek|pujska|pujski|pujskov"
+        self.assertEqual([plsi(n, forms) for n in (-1, -2, -3, -5, -101)],
+                         ["pujsek", "pujska", "pujski", "pujskov", "pujsek"])
+
+    def test_slovenian(self):
+        forms = "pujsek|pujska|pujski|pujskov"
+        self.assertEqual([plsi(n, forms) for n in (1, 2, 3, 4, 5, 0, 101)],
+                         ["pujsek", "pujska", "pujski", "pujski", "pujskov",
+                          "pujskov", "pujsek"])
+        self.assertEqual(plsi(1002, forms), "pujska")
+        self.assertEqual(plsi(5, "pujskom|pujskoma|pujski"), "pujski")
+        self.assertEqual(plsi(2, "miza"), "mizi")
+        self.assertEqual(plsi(7, "miza"), "miz")
+        self.assertEqual(plsi(3, "pes"), "pesi")
+
+    def test_forms(self):
+        self.assertEqual(english_forms("day"), ("day", "days"))
+        self.assertEqual(english_forms("y"), ("y", "ys"))
+        self.assertEqual(slovenian_forms("krava"),
+                         ("krava", "kravi", "krave", "krav"))
+
+    def test_plural_function(self):
+        plfr = plural_function("fr")
+        self.assertEqual(plfr(0, "cochon|cochons"), "cochon")
+        self.assertEqual(plfr(2, "cochon|cochons"), "cochons")
+        self.assertEqual(plfr(2, "cochon"), "cochon")
+
+        pljp = plural_function("0")
+        self.assertEqual(pljp(5, "豚"), "豚")
+
+        calls = []
+
+        def regular(word):
+            calls.append(word)
+            return english_forms(word)
+
+        plen = plural_function("n != 1", regular)
+        self.assertEqual([plen(n, "pig") for n in range(3)],
+                         ["pigs", "pig", "pigs"])
+        self.assertEqual(calls, ["pig"])
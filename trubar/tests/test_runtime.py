@@ -0,0 +1,231 @@
+# pylint: disable=protected-access
+import io
+import os
+import json
+from unittest.mock import patch
+
+from trubar.runtime import \
+    Translator, InstrumentedTranslator, STATS_VARIABLE, PROFILE_VARIABLE
+from trubar.utils import save_compiled_table, KeyMapping
+from trubar.tests import TestBase
+
+
+class TranslatorTest(TestBase):
+    def prepare_tables(self):
+        self.prepare_file("Slovenian.json",
+                          json.dumps(["Slovenščina", "Slovenian",
+                                      "pujsek", "f'{n} pujskov'"]))
+        os.mkdir(os.path.join(self.tmpdir, "farm"))
+        self.prepare_file(os.path.join("farm", "Slovenian.json"),
+                          json.dumps(["Slovenščina", "Slovenian", "kmetija"]))
+
+    def test_lookups(self):
+        self.prepare_tables()
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertEqual(tr.m[2], "pujsek")
+        self.assertEqual(tr.m[2, "piggy"], "pujsek")
+        self.assertEqual(tr.t[2], "pujsek")
+
+        n = 5  # pylint: disable=unused-variable
+        self.assertEqual(tr.e(tr.c(3, "{n} pigs")), "5 pujskov")
+        self.assertIs(tr.c(3), tr.c(3))
+
+        tr.t[2] = tr.m[2] = "{0} pujskov in {1!r}"
+        self.assertEqual(tr.f(2, (5, "x")), "5 pujskov in 'x'")
+
+    def test_segments(self):
+        self.prepare_tables()
+        tr = Translator(self.tmpdir, "Slovenian")
+        farm = tr.segment("farm")
+        self.assertEqual(farm.m[2, "farm"], "kmetija")
+        self.assertIs(tr.segment("farm"), farm)
+        self.assertEqual(tr.m[2, "piggy"], "pujsek")
+
+        self.assertRaises(OSError, tr.segment, "forest")
+
+    def test_lookup(self):
+        self.prepare_file("mapping.json", json.dumps(
+            [["English", "Slovenian"],
+             [[0, ["a.py", "piggy"]],
+              [1, ["{n} pigs"], [0, 1]],
+              [0, ["b.py", "class `A`", "piggy"]],
+              [1, ["class `B`", "farm"]],
+              [2, ["cow"], [1]]]]))
+        self.prepare_file("English.json", json.dumps(
+            ["English", "English", "piggy", "f'{n} pigs'", "piggy", "farm",
+             "'cow'"]))
+        self.prepare_file("Slovenian.json", json.dumps(
+            ["Slovenščina", "Slovenian", "pujsek", "f'{n} pujskov'",
+             "prašiček", "kmetija", "f'krava'"]))
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertIsNone(tr._index)
+        self.assertEqual(tr.lookup("farm"), "kmetija")
+        self.assertEqual(tr._index, {"piggy": [2, 4], "farm": [5]})
+        self.assertEqual(tr.lookup("piggy"), "pujsek")
+        self.assertEqual(tr.lookup("piggy", "b.py"), "prašiček")
+        self.assertEqual(tr.lookup("piggy", "b.py/class `A`"), "prašiček")
+        self.assertEqual(tr.lookup("piggy", "b.py/class `B`"), "piggy")
+        self.assertEqual(tr.lookup("piggy", "b"), "piggy")
+        self.assertEqual(tr.lookup("cow"), "cow")
+        self.assertEqual(tr.lookup("horse"), "horse")
+
+    def test_reload(self):
+        self.prepare_tables()
+        tr = Translator(self.tmpdir, "Slovenian")
+        farm = tr.segment("farm")
+        t, m = tr.t, tr.m
+        n = 5  # pylint: disable=unused-variable
+        self.assertEqual(tr.e(tr.c(3)), "5 pujskov")
+        self.assertFalse(tr.reload())
+
+        fname = os.path.join(self.tmpdir, "Slovenian.json")
+        self.prepare_file("Slovenian.json",
+                          json.dumps(["Slovenščina", "Slovenian",
+                                      "pujsek", "f'{n} prašičkov'"]))
+        os.utime(fname, ns=(1, 1))
+        self.assertTrue(tr.reload())
+        self.assertIs(tr.t, t)
+        self.assertIs(tr.m, m)
+        self.assertEqual(tr.t[3], "f'{n} prašičkov'")
+        self.assertEqual(tr.m[3], "f'{n} prašičkov'")
+        self.assertEqual(tr.e(tr.c(3)), "5 prašičkov")
+        self.assertFalse(tr.reload())
+
+        # Changes written by update-table --changes-only
+        self.prepare_file(os.path.join("farm", "Slovenian.changes.json"),
+                          json.dumps({"generation": 1,
+                                      "entries": {"2": "posestvo"}}))
+        self.assertTrue(tr.reload())
+        self.assertEqual(farm.m[2], "posestvo")
+        self.assertEqual(tr.segment("farm").t[2], "posestvo")
+        self.assertEqual(tr.t[2], "pujsek")
+
+        # Changes are also applied at load
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertEqual(tr.segment("farm").t[2], "posestvo")
+
+    def test_compiled_tables(self):
+        self.prepare_tables()
+        save_compiled_table(
+            os.path.join(self.tmpdir, "Slovenian.pyc"),
+            ["Slovenščina", "Slovenian", "prašiček", "f'{n} prašičkov'"],
+            [KeyMapping(("a.py", "piggy")),
+             KeyMapping(("a.py", "{n} pigs"), (0, 1))])
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertEqual(tr.m[2, "piggy"], "prašiček")
+        self.assertEqual(list(tr._codes), [3])
+        n = 5  # pylint: disable=unused-variable
+        self.assertEqual(tr.e(tr.c(3)), "5 prašičkov")
+
+        # Compiled code is not used for changed entries
+        self.prepare_file("Slovenian.changes.json",
+                          json.dumps({"generation": 1,
+                                      "entries": {"3": "f'{n} pujsov'"}}))
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertEqual(list(tr._codes), [])
+        self.assertEqual(tr.e(tr.c(3)), "5 pujsov")
+        os.remove(os.path.join(self.tmpdir, "Slovenian.changes.json"))
+
+        # Compiled by another version of Python: fall back to json
+        fname = os.path.join(self.tmpdir, "Slovenian.pyc")
+        with open(fname, "rb") as f:
+            data = f.read()
+        with open(fname, "wb") as f:
+            f.write(b"xxxx" + data[4:])
+        tr = Translator(self.tmpdir, "Slovenian")
+        self.assertEqual(tr.m[2, "piggy"], "pujsek")
+        self.assertEqual(tr._codes, {})
+
+
+class InstrumentedTranslatorTest(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.prepare_file("Slovenian.json",
+                          json.dumps(["Slovenščina", "Slovenian",
+                                      "pujsek", "f'{n} pujskov'"]))
+        self.prepare_file("mapping.json", json.dumps(
+            [["English", "Slovenian"],
+             [[0, ["a.py", "def `f`", "piggy"]],
+              [2, ["{n} pigs"], [0, 1]]]]))
+        instances = InstrumentedTranslator._instances
+        self.addCleanup(setattr, InstrumentedTranslator, "_instances",
+                        instances)
+        InstrumentedTranslator._instances = [None]
+
+    def test_enabled_by_variable(self):
+        with patch.dict(os.environ, {STATS_VARIABLE: ""}):
+            self.assertIs(type(Translator(self.tmpdir, "Slovenian")),
+                          Translator)
+        with patch.dict(os.environ, {STATS_VARIABLE: "-"}):
+            tr = Translator(self.tmpdir, "Slovenian")
+            self.assertIsInstance(tr, InstrumentedTranslator)
+            self.assertIs(type(tr.segment("")), InstrumentedTranslator)
+        with patch.dict(os.environ, {STATS_VARIABLE: "",
+                                     PROFILE_VARIABLE: "profile.json"}):
+            self.assertIsInstance(Translator(self.tmpdir, "Slovenian"),
+                                  InstrumentedTranslator)
+
+    def test_counts(self):
+        tr = InstrumentedTranslator(self.tmpdir, "Slovenian")
+        self.assertEqual(tr.m[2, "piggy"], "pujsek")
+        self.assertEqual(tr.t[2], "pujsek")
+
+        # Code as produced by `translate`
+        def outer():
+            n = 5  # pylint: disable=unused-variable
+            def inner():
+                return tr.e(tr.c(3)) if True else f"{n} pigs"  # pylint: disable=using-constant-test
+            return inner
+
+        func = outer()
+        for _ in range(3):
+            self.assertEqual(func(), "5 pujskov")
+        self.assertEqual(tr.lookups, {2: 2, 3: 3})
+        self.assertEqual(tr.misses, {3: 1})
+        self.assertEqual(tr.hits, {3: 2})
+        self.assertEqual(list(tr.eval_time), [3])
+
+        self.assertEqual(tr.key_paths(),
+                         {2: ("a.py", "def `f`", "piggy"),
+                          3: ("a.py", "def `f`", "{n} pigs")})
+
+        f = io.StringIO()
+        tr.report(f)
+        lines = f.getvalue().splitlines()
+        self.assertIn("Compilations: 1, cache hits: 2", lines[1])
+        self.assertTrue(lines[3].endswith("a.py/def `f`/{n} pigs"))
+        self.assertEqual(lines[3].split()[:3], ["3", "1", "2"])
+        self.assertTrue(lines[4].endswith("a.py/def `f`/piggy"))
+
+        fname = os.path.join(self.tmpdir, "stats.txt")
+        InstrumentedTranslator._instances = [tr]
+        InstrumentedTranslator._write_report(fname)
+        with open(fname, encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines(), lines)
+
+    def test_profile(self):
+        tr = InstrumentedTranslator(self.tmpdir, "Slovenian")
+        for _ in range(3):
+            _ = tr.t[3]
+        _ = tr.m[2, "piggy"]
+        _ = tr.m[0]
+        self.assertEqual(tr.profile(),
+                         {("a.py", "def `f`", "{n} pigs"): 3,
+                          ("a.py", "def `f`", "piggy"): 1})
+
+        fname = os.path.join(self.tmpdir, "profile.json")
+        InstrumentedTranslator._instances = [tr]
+        InstrumentedTranslator._write_profile(fname)
+        with open(fname, encoding="utf-8") as f:
+            self.assertEqual(json.load(f),
+                             [[3, ["a.py", "def `f`", "{n} pigs"]],
+                              [1, ["a.py", "def `f`", "piggy"]]])
+
+        # Counts are added to counts in the existing file
+        for _ in range(5):
+            _ = tr.t[2]
+        InstrumentedTranslator._write_profile(fname)
+        with open(fname, encoding="utf-8") as f:
+            self.assertEqual(json.load(f),
+                             [[7, ["a.py", "def `f`", "piggy"]],
+                              [6, ["a.py", "def `f`", "{n} pigs"]]])
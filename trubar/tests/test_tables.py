@@ -0,0 +1,76 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from trubar.tables import table_segment, tree_shim, load_table_profile
+
+from trubar.config import LanguageDef
+
+
+class TablesTest(unittest.TestCase):
+    def test_table_segment(self):
+        self.assertEqual(table_segment("a/b/c.py"), "")
+        self.assertEqual(table_segment("c.py"), "")
+
+        with patch("trubar.config.config.partition_tables", True):
+            self.assertEqual(table_segment("a/b/c.py"), "a")
+            self.assertEqual(table_segment("a/c.py"), "a")
+            self.assertEqual(table_segment("c.py"), "")
+
+        with patch("trubar.config.config.partition_prefixes",
+                   ("a/b", "a/b/d/", "a/e")):
+            self.assertEqual(table_segment("a/b/c.py"), "a/b")
+            self.assertEqual(table_segment("a/b/d/c.py"), "a/b/d")
+            self.assertEqual(table_segment("a/bd/c.py"), "a")
+            self.assertEqual(table_segment("a/c.py"), "a")
+            self.assertEqual(table_segment("x/c.py"), "x")
+            self.assertEqual(table_segment("c.py"), "")
+
+    @patch("trubar.config.config.partition_tables", True)
+    def test_load_table_profile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "profile.json")
+            with open(fname, "w", encoding="utf-8") as f:
+                json.dump([[3, ["a/b.py", "x"]], [5, ["c.py", "y"]],
+                           [4, ["a/d.py", "z"]], [1, ["a/b.py", "t"]]], f)
+            self.assertEqual(
+                load_table_profile(fname),
+                {"": [("c.py", "y")],
+                 "a": [("a/d.py", "z"), ("a/b.py", "x"), ("a/b.py", "t")]})
+
+    @patch("trubar.config.config.languages",
+           {"en": LanguageDef("English", "English", True),
+            "si": LanguageDef("Slovenščina", "Slovenian", False)})
+    def test_tree_shim(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for code in ("en", "si"):
+                os.makedirs(os.path.join(tmpdir, "i18n", code))
+                with open(os.path.join(tmpdir, "i18n", code, "__init__.py"),
+                          "w", encoding="utf-8") as f:
+                    f.write(f"x = {code!r}")
+
+            def run_shim():
+                namespace = {"__file__": os.path.join(tmpdir, "__init__.py")}
+                exec(tree_shim(), namespace)  # pylint: disable=exec-used
+                return namespace
+
+            for environ, language in (({}, "en"),
+                                      ({"TRUBAR_LANGUAGE": "si"}, "si"),
+                                      ({"TRUBAR_LANGUAGE": "xx"}, "en")):
+                with patch.dict(os.environ, environ):
+                    namespace = run_shim()
+                path = os.path.join(tmpdir, "i18n", language)
+                self.assertEqual(namespace["x"], language)
+                self.assertEqual(namespace["__path__"], [path])
+                self.assertEqual(namespace["__file__"],
+                                 os.path.join(path, "__init__.py"))
+                self.assertNotIn("_language", namespace)
+
+            with patch("trubar.config.config.tree_selector", "'s' + 'i'"):
+                self.assertEqual(run_shim()["x"], "si")
+
+
+if __name__ == "__main__":
+    unittest.main()
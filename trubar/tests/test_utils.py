@@ -1,5 +1,10 @@
 import os
+import json
+import struct
+import gettext
+import marshal
 import tempfile
+import importlib.util
 from pathlib import PureWindowsPath
 
 import unittest
@@ -8,7 +13,9 @@ from unittest.mock import patch, Mock
 
 from trubar.utils import \
     walk_files, check_any_files, unique_name, dump_removed, make_list, \
-    KeyMapping, _compressed, _decompressed, save_mapping, load_mapping
+    KeyMapping, _compressed, _decompressed, save_mapping, load_mapping, \
+    save_compiled_table, table_changes_name, load_table_changes, \
+    save_table_changes, remove_table_changes, save_mo, _hashpjw, TableWriter
 
 from trubar.config import config
 import trubar.tests.test_module
@@ -243,7 +250,10 @@ class TestMappingCompression(unittest.TestCase):
         KeyMapping(path=('some', 'completely', 'beyond', 'different'), raw=False),
         KeyMapping(path=('really', 'different'), f_lang_idx=(0, 1), raw=True),
         KeyMapping(path=('really', 'really', 'different'), f_lang_idx=(0, 1), raw=True),
-        KeyMapping(path=('not-same',), f_lang_idx=(0, 1), raw=True)
+        KeyMapping(path=('not-same',), f_lang_idx=(0, 1), raw=True),
+        KeyMapping(path=('not-same', 'x'), f_lang_idx=(0, 1), fields=('x', )),
+        KeyMapping(path=('not-same', 'y'), f_lang_idx=(0, ), fields=()),
+        KeyMapping(path=('not-same', 'z'), joined=('w', 'v'))
     ]
 
     def test_compression(self):
@@ -258,7 +268,10 @@ class TestMappingCompression(unittest.TestCase):
              [2, ('beyond', 'different')],
              [0, ('really', 'different'), (0, 1), True],
              [1, ('really', 'different'), (0, 1), True],
-             [0, ('not-same',), (0, 1), True]]
+             [0, ('not-same',), (0, 1), True],
+             [1, ('x',), (0, 1), False, ('x', )],
+             [1, ('y',), (0, ), False, ()],
+             [1, ('z',), (), False, None, ('w', 'v')]]
         )
 
         self.assertEqual(_decompressed(compressed), self.key_mapping)
@@ -272,5 +285,149 @@ class TestMappingCompression(unittest.TestCase):
             self.assertEqual(loaded_languages, languages)
             self.assertEqual(loaded_mapping, self.key_mapping)
 
+
+class TestCompiledTables(unittest.TestCase):
+    def test_save_compiled_table(self):
+        messages = ["Slovenščina", "Slovenian",
+                    "pujsek", "f'{n} pujskov'", "'kmetija'"]
+        mapping = [KeyMapping(("a.py", "piggy")),
+                   KeyMapping(("a.py", "{n} pigs"), (0, 1)),
+                   KeyMapping(("a.py", "farm"), (1, ))]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            fname = os.path.join(tmpdirname, "Slovenian.pyc")
+            save_compiled_table(fname, messages, mapping)
+            with open(fname, "rb") as f:
+                data = f.read()
+        self.assertEqual(data[:4], importlib.util.MAGIC_NUMBER)
+        namespace = {}
+        exec(marshal.loads(data[16:]), namespace)  # pylint: disable=exec-used
+        self.assertEqual(namespace["messages"], tuple(messages))
+
+        codes = namespace["codes"]
+        self.assertEqual(len(codes), 5)
+        self.assertEqual([code is None for code in codes],
+                         [True, True, True, False, False])
+        self.assertEqual(eval(codes[3], {"n": 5}), "5 pujskov")  # pylint: disable=eval-used
+        self.assertEqual(eval(codes[4]), "kmetija")  # pylint: disable=eval-used
+
+
+class TestTableWriter(unittest.TestCase):
+    def test_writer(self):
+        languages = ["English", "Slovenian"]
+        entries = [(("a.py", "pig"), "f'{n} pigs'", "f'{n} pujskov'"),
+                   (("a.py", "def `f`", "cow"), "cow", "krava"),
+                   (("b.py", "cow"), "cow", "krava"),
+                   (("b.py", "dog"), "dog", "pes")]
+        mapping = [KeyMapping(path, (0, 1) if "{" in orig else ())
+                   for path, orig, _ in entries]
+        exp_tables = [["English", "English", *(e[1] for e in entries)],
+                      ["Slovenščina", "Slovenian", *(e[2] for e in entries)]]
+        for fixed, flushes in ((0, (1, 3)), (1, (2, )), (2, ()), (0, ())):
+            with tempfile.TemporaryDirectory() as tmpdirname:
+                path = os.path.join(tmpdirname, "i18n")
+                # Fixed entries are initially empty and filled at the end
+                tables = [["English", "English"] + [""] * fixed,
+                          ["Slovenščina", "Slovenian"] + [""] * fixed]
+                key_mapping = [KeyMapping(keymap.path)
+                               for keymap in mapping[:fixed]]
+                writer = TableWriter(path, languages, tables, key_mapping)
+                for i, ((_, *messages), keymap) in enumerate(
+                        zip(entries[fixed:], mapping[fixed:]), start=fixed):
+                    if i in flushes:
+                        writer.flush()
+                    self.assertEqual(writer.flushed + len(tables[0]), i + 2)
+                    for table, message in zip(tables, messages):
+                        table.append(message)
+                    key_mapping.append(keymap)
+                for i in range(fixed):
+                    tables[0][i + 2], tables[1][i + 2] = entries[i][1:]
+                    key_mapping[i] = mapping[i]
+                writer.close(compile_tables=True)
+
+                for language, exp_table in zip(languages, exp_tables):
+                    fname = os.path.join(path, f"{language}.json")
+                    with open(fname, encoding="utf-8") as f:
+                        self.assertEqual(f.read(), json.dumps(exp_table))
+                    self.assertTrue(
+                        os.path.exists(os.path.join(path, f"{language}.pyc")))
+                with open(os.path.join(path, "mapping.json"),
+                          encoding="utf-8") as f:
+                    written = f.read()
+                save_mapping(tmpdirname, languages, mapping)
+                with open(os.path.join(tmpdirname, "mapping.json"),
+                          encoding="utf-8") as f:
+                    self.assertEqual(written, f.read())
+                self.assertEqual(
+                    sorted(os.listdir(path)),
+                    ["English.json", "English.pyc", "Slovenian.json",
+                     "Slovenian.pyc", "mapping.json"])
+
+
+class TestTableChanges(unittest.TestCase):
+    def test_save_load_remove(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            fname = os.path.join(tmpdirname, "Slovenian.json")
+            self.assertEqual(table_changes_name(fname),
+                             os.path.join(tmpdirname, "Slovenian.changes.json"))
+            self.assertEqual(load_table_changes(fname), (0, {}))
+
+            save_table_changes(fname, ["a", "b", "c", "d"],
+                               ["a", "x", "c", "y"], 3)
+            self.assertEqual(load_table_changes(fname), (3, {1: "x", 3: "y"}))
+
+            remove_table_changes(fname)
+            self.assertFalse(os.path.exists(table_changes_name(fname)))
+            remove_table_changes(fname)
+
+
+class TestMo(unittest.TestCase):
+    def test_save_mo(self):
+        entries = [("a.py/class `A`", "pig", "pujsek"),
+                   ("a.py/def `f`", "pig", "prašič"),
+                   ("", "farm", "kmetija")]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            fname = os.path.join(tmpdirname, "si.mo")
+            save_mo(fname, entries, "si")
+            with open(fname, "rb") as f:
+                data = f.read()
+                f.seek(0)
+                trans = gettext.GNUTranslations(f)
+
+        self.assertEqual(trans.pgettext("a.py/class `A`", "pig"), "pujsek")
+        self.assertEqual(trans.pgettext("a.py/def `f`", "pig"), "prašič")
+        self.assertEqual(trans.gettext("farm"), "kmetija")
+        self.assertEqual(trans.gettext("pig"), "pig")
+        self.assertEqual(trans.info()["language"], "si")
+
+        # Find all keys through the hash table
+        magic, _, n, orig_offset, _, hash_size, hash_offset = \
+            struct.unpack("<7I", data[:28])
+        self.assertEqual(magic, 0x950412de)
+        self.assertEqual(n, 4)
+        hash_table = struct.unpack(
+            f"<{hash_size}I", data[hash_offset:hash_offset + 4 * hash_size])
+        for key in (b"", b"a.py/class `A`\x04pig", b"a.py/def `f`\x04pig",
+                    b"farm"):
+            hval = _hashpjw(key)
+            idx = hval % hash_size
+            incr = 1 + hval % (hash_size - 2)
+            while True:
+                i = hash_table[idx]
+                self.assertNotEqual(i, 0)
+                length, offset = struct.unpack(
+                    "<2I", data[orig_offset + 8 * (i - 1):][:8])
+                if data[offset:offset + length] == key:
+                    break
+                idx = (idx + incr) % hash_size
+
+    def test_hashpjw(self):
+        self.assertEqual(_hashpjw(b""), 0)
+        self.assertEqual(_hashpjw(b"a"), 97)
+        self.assertEqual(_hashpjw(b"ab"), 97 * 16 + 98)
+        self.assertLess(_hashpjw(b"a long string to overflow"), 1 << 32)
+        # Shifting sets bit 32, which gettext's 32-bit hash drops
+        self.assertEqual(_hashpjw(b"\xff\xff\xff\xff\xff\xf0\xf1\xf0"), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -2,9 +2,13 @@ import re
 import json
 import os
 import sys
-from itertools import chain
+import marshal
+import shutil
+import struct
+import importlib.util
 from pathlib import PurePath
-from typing import Iterator, Tuple, Optional, Set, List, Dict, Union, NamedTuple
+from typing import \
+    Iterator, Tuple, Optional, Set, List, Dict, Union, NamedTuple, TextIO
 
 from trubar.config import config
 from trubar.messages import MsgDict, dump
@@ -91,6 +95,12 @@ class KeyMapping(NamedTuple):
     path: Tuple[str, ...]
     f_lang_idx: Tuple[int, ...] = ()
     raw: bool = False
+    # Expressions whose values are passed to `str.format`, if the entry
+    # is a template for `_tr.f`
+    fields: Optional[Tuple[str, ...]] = None
+    # Originals of further parts of implicitly concatenated strings, whose
+    # translations are joined into this entry; they are in the same namespace
+    joined: Tuple[str, ...] = ()
 
 MappingDict = Dict[str, Union[str, "MappingDict"]]
 
@@ -107,27 +117,276 @@ def load_mapping(path: str) -> Tuple[List[str], List[KeyMapping]]:
         languages, compressed = json.load(f)
     return languages, _decompressed(compressed)
 
-def _compressed(mapping: List[KeyMapping]) -> List:
-    empty = ((), (), False)
-    return [
-        [s := next((i for i, (x, y) in enumerate(zip(prev, parts)) if x != y),
-                   len(prev)),
-         parts[s:]]
-        + ([f_lang_idx] if f_lang_idx or raw else [])
-        + ([raw] if raw else [])
-        for (prev, *_), (parts, f_lang_idx, raw) in zip(chain((empty, ), mapping),
-                                                        mapping)
-    ]
+def _compressed(mapping: List[KeyMapping],
+                prev: Tuple[str, ...] = ()) -> List:
+    # Path is stored as the number of parts shared with the previous path,
+    # followed by the remaining parts, and other fields, except trailing
+    # fields with default values; `prev` is the path that precedes `mapping`
+    defaults = KeyMapping(())[1:]
+    compressed = []
+    for parts, *extra in mapping:
+        while extra and extra[-1] == defaults[len(extra) - 1]:
+            extra.pop()
+        s = next((i for i, (x, y) in enumerate(zip(prev, parts)) if x != y),
+                 len(prev))
+        compressed.append([s, parts[s:], *extra])
+        prev = parts
+    return compressed
 
 def _decompressed(compressed: List) -> List[KeyMapping]:
     mapping = []
-    for (s, parts, *rest), (prev, *_) in zip(compressed,
-                                             chain((KeyMapping(()),), mapping)):
+    prev = ()
+    for s, parts, *extra in compressed:
+        prev = prev[:s] + tuple(parts)
         mapping.append(
             KeyMapping(
-                prev[:s] + tuple(parts),
-                tuple(rest[0]) if rest else (),
-                rest[1] if len(rest) > 1 else False
+                prev,
+                *(tuple(field) if isinstance(field, list) else field
+                  for field in extra)
             )
         )
     return mapping
+
+
+class TableWriter:
+    """
+    Write message tables and mapping for a table segment while they are built.
+
+    Lists `message_tables` and `key_mapping` are shared with the code that
+    fills them. Their initial entries are kept in memory and may be changed
+    until `close`; entries that are appended later are written to temporary
+    files by `flush` and removed from the lists. The number of removed
+    entries is in `flushed`, so the index of an entry in the final table is
+    `flushed` + its position in the list. `close` writes the tables and the
+    mapping into the directory.
+
+    Args:
+        path (str): directory for tables (created when needed)
+        languages (list of str): international names of languages
+        message_tables (list of list of str): tables for all languages
+        key_mapping (list of KeyMapping): key mapping
+    """
+    def __init__(self,
+                 path: str,
+                 languages: List[str],
+                 message_tables: List[List[str]],
+                 key_mapping: List[KeyMapping]):
+        self.path = path
+        self.languages = languages
+        self.message_tables = message_tables
+        self.key_mapping = key_mapping
+        self.fixed = len(key_mapping)
+        self.flushed = 0
+        # Key mappings are compressed with respect to the previous path
+        self._prev = key_mapping[-1].path if key_mapping else ()
+
+    def _part_name(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.part")
+
+    def flush(self) -> None:
+        """Write and remove entries added after the initial ones"""
+        new = len(self.key_mapping) - self.fixed
+        if not new:
+            return
+        mode = "a" if self.flushed else "w"
+        if not self.flushed:
+            os.makedirs(self.path, exist_ok=True)
+        for language, table in zip(self.languages, self.message_tables):
+            start = len(table) - new
+            with open(self._part_name(f"{language}.json"), mode,
+                      encoding="utf-8") as f:
+                for entry in table[start:]:
+                    f.write(", " + json.dumps(entry))
+            del table[start:]
+        with open(self._part_name("mapping.json"), mode,
+                  encoding="utf-8") as f:
+            for entry in _compressed(self.key_mapping[self.fixed:],
+                                     self._prev):
+                f.write(", " + json.dumps(entry))
+        self._prev = self.key_mapping[-1].path
+        del self.key_mapping[self.fixed:]
+        self.flushed += new
+
+    def close(self, compile_tables: bool = False) -> None:
+        """
+        Write tables and mapping; the output is the same as if whole tables
+        were dumped with `json.dump` and the mapping with `save_mapping`.
+        """
+        self.flush()
+        os.makedirs(self.path, exist_ok=True)
+        for language, table in zip(self.languages, self.message_tables):
+            fname = os.path.join(self.path, f"{language}.json")
+            with open(fname, "w", encoding="utf-8") as f:
+                f.write(json.dumps(table)[:-1])
+                self._copy_part(f"{language}.json", f)
+                f.write("]")
+            remove_table_changes(fname)
+        with open(os.path.join(self.path, "mapping.json"), "w",
+                  encoding="utf-8") as f:
+            f.write(f"[{json.dumps(self.languages)}, [")
+            compressed = _compressed(self.key_mapping)
+            f.write(", ".join(map(json.dumps, compressed)))
+            self._copy_part("mapping.json", f, skip_comma=not compressed)
+            f.write("]]")
+        if compile_tables:
+            _, mapping = load_mapping(self.path)
+            for language in self.languages:
+                with open(os.path.join(self.path, f"{language}.json"),
+                          encoding="utf-8") as f:
+                    messages = json.load(f)
+                save_compiled_table(
+                    os.path.join(self.path, f"{language}.pyc"),
+                    messages, mapping)
+
+    def _copy_part(self, name: str, dest: TextIO, skip_comma=False) -> None:
+        if not self.flushed:
+            return
+        fname = self._part_name(name)
+        with open(fname, encoding="utf-8") as f:
+            if skip_comma:
+                f.read(2)
+            shutil.copyfileobj(f, dest)
+        os.remove(fname)
+
+
+def save_compiled_table(fname: str,
+                        messages: List[str],
+                        mapping: List[KeyMapping]) -> None:
+    """
+    Write the message table as a sourceless Python module (a .pyc file).
+
+    The module defines a tuple `messages` with the table and a tuple `codes`
+    with code objects for messages that are evaluated (f-strings), and `None`
+    for others, including templates for `str.format`.
+    """
+    codes = (None, None) + tuple(
+        compile(message, "<string>", "eval")
+        if keymap.f_lang_idx and keymap.fields is None else None
+        for message, keymap in zip(messages[2:], mapping))
+    module = compile("messages = '__messages__'\ncodes = '__codes__'",
+                     fname, "exec")
+    data = {"__messages__": tuple(messages), "__codes__": codes}
+    module = module.replace(
+        co_consts=tuple(data.get(const, const) for const in module.co_consts))
+    with open(fname, "wb") as f:
+        # Header: magic number, flags (0) and source timestamp and size (0)
+        f.write(importlib.util.MAGIC_NUMBER + bytes(12))
+        f.write(marshal.dumps(module))
+
+
+def table_changes_name(fname: str) -> str:
+    """Return the name of the file with changes for the given table"""
+    return os.path.splitext(fname)[0] + ".changes.json"
+
+
+def load_table_changes(fname: str) -> Tuple[int, Dict[int, str]]:
+    """
+    Return the generation and changed entries for the table `fname`;
+    generation is 0 and there are no entries if the file does not exist.
+    """
+    try:
+        with open(table_changes_name(fname), encoding="utf-8") as f:
+            changes = json.load(f)
+    except FileNotFoundError:
+        return 0, {}
+    return changes["generation"], \
+        {int(idx): entry for idx, entry in changes["entries"].items()}
+
+
+def save_table_changes(fname: str,
+                       table: List[str],
+                       messages: List[str],
+                       generation: int) -> None:
+    """
+    Write entries of `messages` that differ from `table` into the file
+    with changes for table `fname`, with the given generation.
+    """
+    entries = {idx: message
+               for idx, (entry, message) in enumerate(zip(table, messages))
+               if entry != message}
+    with open(table_changes_name(fname), "w", encoding="utf-8") as f:
+        json.dump({"generation": generation, "entries": entries}, f)
+
+
+def remove_table_changes(fname: str) -> None:
+    """Remove the file with changes for table `fname`, if it exists"""
+    try:
+        os.remove(table_changes_name(fname))
+    except FileNotFoundError:
+        pass
+
+
+def save_mo(fname: str,
+            entries: List[Tuple[str, str, str]],
+            language: str = "") -> None:
+    """
+    Write a GNU gettext catalog (.mo), including the hash table.
+
+    Args:
+        fname: output file name
+        entries: triplets (context, original, translation)
+        language: language code for the header
+    """
+    header = "Content-Type: text/plain; charset=UTF-8\n" \
+             "Content-Transfer-Encoding: 8bit\n"
+    if language:
+        header += f"Language: {language}\n"
+    # Context is separated from the original by EOT, as in gettext
+    messages = {b"": header.encode("utf-8")}
+    for context, original, translation in entries:
+        key = f"{context}\x04{original}" if context else original
+        messages[key.encode("utf-8")] = translation.encode("utf-8")
+    keys = sorted(messages)
+    n = len(keys)
+
+    hash_size = _next_prime(max(3, n * 4 // 3))
+    hash_table = [0] * hash_size
+    for i, key in enumerate(keys, start=1):
+        hval = _hashpjw(key)
+        idx = hval % hash_size
+        incr = 1 + hval % (hash_size - 2)
+        while hash_table[idx]:
+            idx = (idx + incr) % hash_size
+        hash_table[idx] = i
+
+    # Header, tables of originals and translations, hash table, strings
+    orig_offset = 28
+    trans_offset = orig_offset + 8 * n
+    hash_offset = trans_offset + 8 * n
+    offset = hash_offset + 4 * hash_size
+    orig_table, trans_table = [], []
+    for strings, table in ((keys, orig_table),
+                           ([messages[key] for key in keys], trans_table)):
+        for s in strings:
+            table += [len(s), offset]
+            offset += len(s) + 1
+    with open(fname, "wb") as f:
+        f.write(struct.pack("<7I", 0x950412de, 0, n, orig_offset,
+                            trans_offset, hash_size, hash_offset))
+        f.write(struct.pack(f"<{2 * n}I", *orig_table))
+        f.write(struct.pack(f"<{2 * n}I", *trans_table))
+        f.write(struct.pack(f"<{hash_size}I", *hash_table))
+        for s in keys:
+            f.write(s + b"\0")
+        for key in keys:
+            f.write(messages[key] + b"\0")
+
+
+def _hashpjw(s: bytes) -> int:
+    # Hash function used by GNU gettext
+    hval = 0
+    for c in s:
+        hval = (hval << 4) + c
+        g = hval & 0xf0000000
+        if g:
+            hval ^= g >> 24
+            hval ^= g
+    # gettext keeps the hash in 32 bits; higher bits do not affect lower ones
+    return hval & 0xFFFFFFFF
+
+
+def _next_prime(n: int) -> int:
+    n |= 1
+    while any(n % i == 0 for i in range(3, int(n ** 0.5) + 1, 2)):
+        n += 2
+    return n